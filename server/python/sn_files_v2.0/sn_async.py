@@ -0,0 +1,894 @@
+"""
+    File name: sn_async.py
+    Author: Georgios Vrettos
+    Date created: 5/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 3.7
+
+This module contains an alternative runtime of the server node that runs on a single asyncio
+event loop. The socket of the MQTT client is driven by the event loop instead of a network thread,
+the database is used through an asynchronous driver and every processing stage is a coroutine.
+The control messages of every node run in order on a session task of the node, so many node sessions
+can be served at the same time by one thread.
+The writes that cannot reach the database are appended to the same on-disk spool as in the
+threads runtime and its replay thread writes them in order when the database recovers.
+In this module, functions from the package "asyncpg" are used.
+To install the package using pip issue the following command:
+$pip install asyncpg
+
+Example:
+	$ python3 sn_main.py --runtime asyncio
+
+Todo :
+	*
+"""
+
+import asyncio
+import collections
+import datetime
+import signal
+import time
+import traceback
+from io import BytesIO
+
+import asyncpg
+import paho.mqtt.client as mqtt
+
+import sn_db
+from sn_db import Sn_db, STATEMENTS, CLIENT_DATA_COLUMNS, MIGRATIONS, SENSOR_SPEC_TABLE
+from sn_mqtt import SnMqtt
+from sn_states import ActiveMode
+from sn_lanes import HIGH_WATERMARK, LOW_WATERMARK
+from sn_batch import Sn_sensor_specs, BATCH_MAX_SIZE, BATCH_MAX_DELAY
+from sn_record import Sn_reading
+from sn_cache import Sn_config_cache
+from sn_config import Sn_config
+from sn_snapshot import Sn_snapshot
+from sn_registry import Sn_node_registry, DEFAULT_SEV_MODE
+from sn_writeback import Sn_node_updates, NODE_FLUSH_INTERVAL
+from sn_rollup import Sn_rollup_windows, ROLLUP_FLUSH_INTERVAL
+from sn_notify import read_change, NOTIFY_POLL_INTERVAL, NOTIFY_RECONNECT_DELAY
+from sn_schema import Sn_schema
+from sn_spool import Sn_spool, orphaned_spools
+from validate_xml import start_pool, close_pool
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# Seconds between two calls of the MQTT housekeeping function (keepalive, retries).
+MISC_INTERVAL = 1.0
+# Seconds to wait for the running client sessions on shutdown.
+SHUTDOWN_TIMEOUT = 10
+# Seconds between two attempts to connect to the database, while it is unavailable.
+DB_RECONNECT_DELAY = 5
+
+# --------------------------------------------------------------------------------------------------
+
+
+class AsyncSnMqtt(SnMqtt):
+    'The MQTT client (SN) with its socket driven by an asyncio event loop'
+
+    def __init__(self,loop,ingest):
+        """__init__ function. This function creates the client.
+        Args:
+            param1 (AbstractEventLoop): The event loop.
+            param2 (asyncio.Queue): The queue of the incoming messages.
+        """
+
+        SnMqtt.__init__(self)
+        self.event_loop = loop
+        self.ingest = ingest
+        # While paused the socket is not read.
+        self.paused = False
+        self.throttle_events = 0
+
+
+    def on_socket_open(self,mqttc,userdata,sock):
+        """on_socket_open callback function. The new socket is watched by the event loop,
+        unless reading is paused.
+        """
+
+        if(not self.paused):
+            self.event_loop.add_reader(sock, self.loop_read)
+
+    def on_socket_close(self,mqttc,userdata,sock):
+        """on_socket_close callback function. The closed socket is not watched any more.
+        """
+
+        self.event_loop.remove_reader(sock)
+
+    def on_socket_register_write(self,mqttc,userdata,sock):
+        """on_socket_register_write callback function. There is outgoing data for the socket.
+        """
+
+        self.event_loop.add_writer(sock, self.loop_write)
+
+    def on_socket_unregister_write(self,mqttc,userdata,sock):
+        """on_socket_unregister_write callback function. The outgoing data is sent.
+        """
+
+        self.event_loop.remove_writer(sock)
+
+
+    def on_message(self,mqttc, userdata, msg):
+        """on_message callback function.
+        This function is executed when a message arrives (Someone published a message).
+        Args:
+            param1 (Client): The client instance.
+            param2 (str): User defined data that is defined on Client().
+            param3 (MQTTMessage): An instance of MQTTMessage, contains topic,payload,qos,retain
+        """
+
+        self.ingest.put_nowait(self.make_record(msg))
+        if(self.ingest.qsize() >= HIGH_WATERMARK and not self.paused):
+            # The socket is not read until the queue drains, TCP and the broker hold the messages back.
+            self.event_loop.remove_reader(self.socket())
+            self.paused = True
+            self.throttle_events += 1
+
+
+    def resume_reading(self):
+        """resume_reading function. The socket is read again when the queue
+        drains to the low watermark.
+        """
+
+        if(self.paused and self.ingest.qsize() <= LOW_WATERMARK):
+            self.paused = False
+            if(self.socket() is not None):
+                self.event_loop.add_reader(self.socket(), self.loop_read)
+
+
+    async def misc_loop(self):
+        """misc_loop coroutine. This coroutine handles the keepalive pings and the
+        retries of the client and reconnects if the connection is lost. While reading is paused
+        the socket is not read and the client reconnects only after reading is resumed.
+        """
+
+        while True:
+            await asyncio.sleep(MISC_INTERVAL)
+            if(self.loop_misc() == mqtt.MQTT_ERR_NO_CONN and not self.paused):
+                try:
+                    self.reconnect()
+                except Exception:
+                    print("Reconnection failed.")
+
+
+class AsyncActiveMode(ActiveMode):
+    """
+    The Active mode of the server node on the asyncio runtime. The message parsing functions
+    are inherited from ActiveMode, the message handling stages are coroutines.
+    """
+
+    # Class functionality variables.
+    # the asyncpg connection pool.
+    db = None
+    # the queue of the incoming messages.
+    ingest = None
+    # the queue of the sensor data rows that wait for the writer.
+    rows = None
+    # the last type and range of every sensor of every node.
+    specs = None
+    # the pending changes of the nodes table.
+    node_writer = None
+    # the on-disk spool for writes that cannot reach the database.
+    spool = None
+    # set when the server stops, the writer tasks write what they hold and end.
+    stopping = None
+
+    def __init__(self):
+        """ __init__ function. This is the constructor of the current state.
+        The event loop runs until the server is stopped.
+        """
+        print('Current State: ' + str(self))
+        asyncio.run(self.run())
+
+
+    async def run(self):
+        """run coroutine. This coroutine sets up the server, starts the processing stages
+        and waits for a termination signal.
+        """
+
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        self.stopping = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopped.set)
+
+        # The validation processes are forked before the server starts a thread.
+        start_pool()
+        # The spool is opened first, records left from a previous run are replayed when the database is up.
+        # The spools of the shards of the threads runtime are replayed too.
+        self.spool = Sn_spool()
+        self.orphan_spools = [Sn_spool(directory) for directory in orphaned_spools(0)]
+        # The asynchronous connection pool of the database, the schema changes are applied.
+        # If the database is unavailable the server starts without it and the writes go to the spool.
+        await self.connect_db_async()
+        # The sensor data tables are partitioned on a worker thread, before any reading is written.
+        self.schema = Sn_schema()
+        await loop.run_in_executor(None, self.schema.start)
+        self.config_cache = Sn_config_cache()
+        self.snapshot = Sn_snapshot()
+        self.registry = Sn_node_registry()
+        self.node_writer = Sn_node_updates()
+        self.rollup = Sn_rollup_windows()
+        listen_conn = None
+        if(self.db is not None):
+            # The listener starts listening before the nodes are loaded, so no change is missed.
+            try:
+                listen_conn = await self.listen_async()
+            except (OSError, asyncpg.PostgresError) as exception:
+                print(exception)
+            await self.load_nodes_async()
+        else:
+            # The node configurations of the existing file are kept until the database is available.
+            self.snapshot.seed_file()
+        await self.initial_setup_async()
+
+        self.ingest = asyncio.Queue()
+        self.rows = asyncio.Queue(maxsize=BATCH_MAX_SIZE * 2)
+        self.sessions = set()
+        # The control messages that wait for the session task of every node, in arrival order.
+        self.session_lanes = {}
+
+        # Object instantiations for the Mqtt Client class, the connection registers the socket on the loop.
+        self.mqtt = AsyncSnMqtt(loop, self.ingest)
+        self.mqtt.mqtt_connect()
+        # Inital topic subscriotions and the handlers of the topics.
+        self.initial_connections(self.mqtt, self.server_config)
+        self.router = self.initial_routes(self.server_config, self.start_session_async,
+                                          self.save_sensor_data_async)
+        # The counters of the server are published every STATUS_INTERVAL seconds.
+        self.status = self.status_report(self.server_config.sys_topics['server_stats'])
+
+        misc = loop.create_task(self.mqtt.misc_loop())
+        dispatcher = loop.create_task(self.check_buffer_async())
+        writer = loop.create_task(self.writer_async())
+        node_writer = loop.create_task(self.node_writer_async())
+        rollup_writer = loop.create_task(self.rollup_writer_async())
+        listener = loop.create_task(self.listener_async(listen_conn))
+        connector = loop.create_task(self.connector_async())
+        status = loop.create_task(self.status_async())
+
+        await stopped.wait()
+
+        print("Server shutting down.")
+        self.mqtt.disconnect()
+        misc.cancel()
+        listener.cancel()
+        connector.cancel()
+        status.cancel()
+        # The messages that are in the queue are handled before the dispatcher stops.
+        self.ingest.put_nowait(None)
+        await dispatcher
+        if(self.sessions):
+            await asyncio.wait(self.sessions, timeout=SHUTDOWN_TIMEOUT)
+        # The writer flushes every pending row before it stops.
+        await self.rows.put(None)
+        await writer
+        # The open rollup windows and the pending changes of the nodes table are written before the pool closes,
+        # a flush that is running is finished first.
+        self.stopping.set()
+        await rollup_writer
+        await node_writer
+        if(self.db is not None):
+            await self.db.close()
+        self.spool.close()
+        for spool in self.orphan_spools:
+            spool.close()
+        # The last changes of the node configurations are written to the file on a worker thread.
+        await loop.run_in_executor(None, self.snapshot.close)
+        await loop.run_in_executor(None, self.schema.close)
+        # The pending validations finish and the validation processes stop.
+        await loop.run_in_executor(None, close_pool)
+
+
+    async def connect_db_async(self):
+        """connect_db_async coroutine. This coroutine creates the connection pool of the database
+        and applies the schema changes. It returns True if the database is available.
+        """
+
+        try:
+            db = await asyncpg.create_pool(database=sn_db.DB_NAME, user=sn_db.DB_USERNAME,
+                                           password=sn_db.DB_PASSWORD, host=sn_db.DB_HOST,
+                                           port=sn_db.DB_PORT, min_size=sn_db.DB_POOL_MIN,
+                                           max_size=sn_db.DB_POOL_MAX,
+                                           server_settings={'application_name': sn_db.application_name()})
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as exception:
+            print(exception)
+            Sn_db.breaker.failure()
+            return False
+        try:
+            async with db.acquire() as conn:
+                async with conn.transaction():
+                    for migration in MIGRATIONS:
+                        # A change that the database rejects is reported once and the server runs without it,
+                        # the same way as in the threads runtime. Every change has a savepoint.
+                        try:
+                            async with conn.transaction():
+                                await conn.execute(migration)
+                        except asyncpg.PostgresConnectionError:
+                            raise
+                        except asyncpg.PostgresError as exception:
+                            print("Schema change not applied, the server runs without it: " + str(exception))
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as exception:
+            print(exception)
+            Sn_db.breaker.failure()
+            await db.close()
+            return False
+        Sn_db.breaker.success()
+        self.db = db
+        return True
+
+
+    async def connector_async(self):
+        """connector_async coroutine. This coroutine connects to the database, if it was unavailable
+        on startup, and loads the nodes again. The spool replays the writes of the time without it.
+        """
+
+        while(self.db is None):
+            await asyncio.sleep(DB_RECONNECT_DELAY)
+            if(await self.connect_db_async()):
+                print("Database connected.")
+                await self.reload_nodes_async()
+
+
+    async def load_nodes_async(self):
+        """load_nodes_async coroutine. This coroutine loads the fingerprints, the saved configurations
+        and the status and the severity mode of every node from the database.
+        """
+
+        try:
+            self.config_cache.seed([tuple(row) for row in await self.db.fetch(STATEMENTS["get_config_hashes"][0])])
+            self.snapshot.seed([tuple(row) for row in await self.db.fetch(STATEMENTS["get_node_configs"][0])])
+            self.registry.seed([tuple(row) for row in await self.db.fetch(STATEMENTS["get_node_states"][0])])
+        except (OSError, asyncpg.PostgresError) as exception:
+            print(exception)
+
+
+    async def initial_setup_async(self):
+        """initial_setup_async coroutine. This coroutine is used for the initial setup of
+        the server node.
+        """
+        # the server configuration file in str form.
+        self.server_config_str = self.read_config()
+        # The configuration is parsed once, its JSON form and its topics are kept.
+        self.server_config = Sn_config(self.server_config_str)
+        # the SN performs validation of it's own xml file
+        if(self.validate_config_file(self.server_config_str)==False):
+            # If the file is not valid print message.
+            print('Check Server configuration file')
+        else:
+            print('Server Configuration OK')
+            # Insert/Update node_configuration on database
+            await self.save_node_config_async(self.server_config.json, node_id=self.server_config.node_id)
+
+
+    async def check_buffer_async(self):
+        """check_buffer_async coroutine. This coroutine waits for incoming messages and
+        hands them to the next stage. Every control message starts a new client session task.
+        It stops after it receives None, the messages before it are handled.
+        """
+
+        while True:
+            msg = await self.ingest.get()
+            if(msg is None):
+                return
+            self.mqtt.resume_reading()
+
+            # The parsed topic is found and the handler of the topic is awaited.
+            route = self.router.route(msg.topic)
+            if(route.handler is not None):
+                await route.handler(route, msg.payload, msg.received)
+
+
+    async def start_session_async(self,route,payload,received):
+        """start_session_async coroutine. This coroutine adds a control message to the lane of its node.
+        A new lane starts a session task for the node, the messages of a node run in order, one at a time.
+        The session runs on its own, it does not delay the rest of the messages.
+        Args:
+            param1 (Sn_route): The parsed topic of the message.
+            param2 (bytes): The message payload.
+            param3 (float): The time that the message was received.
+        """
+
+        message = (route, payload.decode("utf-8", "replace"))
+        lane = self.session_lanes.get(route.node_id)
+        if(lane is not None):
+            lane.append(message)
+            return
+        self.session_lanes[route.node_id] = collections.deque([message])
+        session = asyncio.get_running_loop().create_task(self.run_session_async(route.node_id))
+        self.sessions.add(session)
+        session.add_done_callback(self.sessions.discard)
+
+
+    async def run_session_async(self,node_id):
+        """run_session_async coroutine. This coroutine handles the control messages of a node in order.
+        The lane is removed when it is empty.
+        Args:
+            param1 (str): The node id.
+        """
+
+        lane = self.session_lanes[node_id]
+        try:
+            while(lane):
+                await self.handle_control_async(*lane[0])
+                # The message leaves the lane after it is handled, so a new message of the node waits for it.
+                lane.popleft()
+        finally:
+            del self.session_lanes[node_id]
+
+
+    async def handle_control_async(self,route,payload):
+        """handle_control_async coroutine. This coroutine handles a control message,
+        a client registration or a severity mode change.
+        Args:
+            param1 (Sn_route): The parsed topic of the message.
+            param2 (str): The message payload.
+        """
+
+        try:
+            if(payload.find("PUB_CONFIG_FILE")!=-1):
+                await self.register_client_async(route, payload)
+
+            elif(payload.find("PUB_CN_SEVERITY_MODE")!=-1):
+                # The severity mode of the current node is written behind, the registry changes at once.
+                sev_mode = self.find_sev_mode(payload)
+                self.node_writer.set(route.node_id, "sev_mode", sev_mode)
+                self.registry.set_sev_mode(route.node_id, sev_mode)
+        except Exception:
+            traceback.print_exc()
+
+
+    async def register_client_async(self,route,payload):
+        """register_client_async coroutine. This coroutine validates the XML file of a new
+        client node, saves it and publishes the $SYS topics.
+        Args:
+            param1 (Sn_route): The parsed topic of the message.
+            param2 (str): The message payload.
+        """
+
+        topic = route.topic
+        xml_start = payload.find('<?xml version="1.0"?>')
+        xml_end = payload.rfind('</nodeConfiguration>')
+        client_config_str = None
+        if(xml_start!=-1 and xml_end!=-1):
+            # string trimming is performed to discard uncesessary data.
+            client_config_str = payload[xml_start:xml_end + len('</nodeConfiguration>')]
+
+        saved = False
+        if(client_config_str is not None):
+            # A configuration that is saved already for this node is not validated and saved again,
+            # a configuration that was found invalid before is rejected without parsing.
+            config_hash = self.config_cache.fingerprint(client_config_str)
+            saved = self.config_cache.is_saved(route.node_id, config_hash)
+            if(not saved and self.config_cache.is_invalid(config_hash)):
+                client_config_str = None
+
+        # The validation runs on a worker thread so it does not block the loop.
+        loop = asyncio.get_running_loop()
+        if(client_config_str is None or (not saved and
+                not await loop.run_in_executor(None, self.validate_config_file, client_config_str))):
+            print("Client node invalid.")
+            if(client_config_str is not None):
+                self.config_cache.remember_invalid(config_hash)
+            # the SN publishes to the same topic a set_node_mode blocked command.
+            self.mqtt.publish(topic=topic, payload="SET_CN_FUNCTIONAL_MODE, blocked,"
+                              " parameter2, parameter3", qos=1, retain=False)
+            return
+
+        print("Client node valid.")
+        # This is the last known severity mode of the current node, it is read from the registry.
+        node = (await self.lookup_nodes_async([route.node_id])).get(route.node_id)
+        # A node that is not registered yet starts in the default mode.
+        last_known_mode = DEFAULT_SEV_MODE
+        if(node is not None and node.sev_mode is not None):
+            last_known_mode = node.sev_mode
+        # the SN publishes to the same topic a set_node_mode active command and severity mode.
+        self.mqtt.publish(topic=topic, payload="SET_CN_FUNCTIONAL_MODE, active," +
+                          last_known_mode + ", parameter2, parameter3", qos=1, retain=False)
+
+        if(saved):
+            # The configuration is unchanged, only the connection time is updated.
+            self.node_writer.set(route.node_id, "last_connected", self.get_local_time())
+        else:
+            client_config_json, summary = self.xml_to_json(client_config_str)
+            await self.save_node_config_async(client_config_json, config_hash, summary.node_id)
+            self.config_cache.remember(route.node_id, config_hash)
+        await asyncio.sleep(1)
+        # After databases update, the SN publishes messages to $SYS topics.
+        await self.active_connections_async(self.server_config, client_config_str)
+
+
+    async def save_node_config_async(self,config_json,config_hash=None,node_id=None):
+        """save_node_config_async coroutine. This coroutine inserts or updates a node configuration
+        on the database and gives it to the snapshot of the JSON file.
+        Args:
+            param1 (str): The node configuration in JSON form.
+            param2 (str): The fingerprint of the configuration XML, or None.
+            param3 (str): The node id of the configuration, or None to find it in the JSON.
+        """
+
+        if(node_id is None):
+            node_id = Sn_db().find_node_id(config_json)
+        # The upsert sets the connection time, an older pending connection time must not replace it.
+        self.node_writer.discard(node_id, "last_connected")
+        connected = datetime.datetime.now().replace(microsecond=0)
+        if(self.spool_required()):
+            self.spool.append_upsert(config_json, str(connected), config_hash, node_id)
+        else:
+            try:
+                await self.db.execute(STATEMENTS["upsert_node"][0], node_id, config_json, connected, config_hash)
+                Sn_db.breaker.success()
+                print("Record inserted successfully")
+            except Exception as exception:
+                print(exception)
+                Sn_db.breaker.failure()
+                self.spool.append_upsert(config_json, str(connected), config_hash, node_id)
+        # The snapshot writer thread writes the file.
+        self.snapshot.update(node_id, config_json)
+
+
+    async def active_connections_async(self,server_config,client_xml_config):
+        """active_connections_async coroutine. This coroutine publishes to all necessary $SYS topics.
+        Args:
+            param1 (Sn_config): The server configuration.
+            param2 (str): The client configuration string.
+        """
+
+        sys_topics = self.find_sys_topics(server_config, client_xml_config)
+
+        # SN publishes data to all $SYS topics.
+        self.mqtt.publish(topic=sys_topics['network_status'], payload="active", qos=1, retain=False)
+        await asyncio.sleep(0.2)
+        self.mqtt.publish(topic=sys_topics['local_time'], payload=self.get_local_time(), qos=1, retain=False)
+        await asyncio.sleep(1)
+        self.mqtt.publish(topic=sys_topics['server_ip'], payload=sys_topics['serverIP'], qos=1, retain=False)
+        await asyncio.sleep(0.2)
+        self.mqtt.publish(topic=sys_topics['server_status'], payload="active", qos=1, retain=False)
+        await asyncio.sleep(0.2)
+        self.mqtt.publish(topic=sys_topics['client_ip'], payload=sys_topics['clientIP'], qos=1, retain=False)
+        await asyncio.sleep(0.2)
+        # The status and the number of active nodes are read from the registry.
+        node = (await self.lookup_nodes_async([sys_topics['clientID']])).get(sys_topics['clientID'])
+        self.mqtt.publish(topic=sys_topics['client_status'], payload=node.status if node is not None else None,
+                          qos=1, retain=False)
+        await asyncio.sleep(0.2)
+        self.mqtt.publish(topic=sys_topics['num_connected_nodes'], payload=self.registry.active_count(),
+                          qos=1, retain=False)
+
+
+    async def lookup_nodes_async(self,node_ids):
+        """lookup_nodes_async coroutine. This coroutine returns a dictionary with the node id as key and
+        the registry node as value. The nodes that are not in the registry are loaded with one query.
+        Args:
+            param1 (list): The node ids.
+        """
+
+        missing = self.registry.missing(node_ids)
+        if(missing and self.db is not None):
+            rows = await self.db.fetch(STATEMENTS["get_node_states_by_id"][0], missing)
+            self.registry.seed([tuple(row) for row in rows])
+        return self.registry.get_many(node_ids)
+
+
+    async def save_sensor_data_async(self,route,payload,received):
+        """save_sensor_data_async coroutine. This coroutine extracts the sensor data from a message
+        and hands the reading to the writer and to the rollup windows. It waits if the writer is too far behind.
+        Args:
+            param1 (Sn_route): The parsed topic of the message.
+            param2 (bytes): The message payload.
+            param3 (float): The time that the message was received.
+        """
+
+        if(route.table is None):
+            # The topic does not belong to a known sensor kind.
+            return
+        try:
+            # The payload is decoded to its type, range and numeric value.
+            data_type, data_range, value = self.find_data_values(payload)
+        except ValueError as exception:
+            print(exception)
+            return
+
+        # The reading is created once and it is written as it is.
+        reading = Sn_reading(route.node_id, route.table, value, received, data_range, data_type)
+        # The reading is added to its rollup windows as it passes.
+        self.rollup.add(reading)
+        await self.rows.put(reading)
+
+
+    async def writer_async(self):
+        """writer_async coroutine. This coroutine collects sensor readings and writes them
+        with COPY, when the batch is full or the oldest reading has waited long enough.
+        It stops after it receives None and writes the last batch.
+        """
+
+        loop = asyncio.get_running_loop()
+        self.specs = Sn_sensor_specs()
+        running = True
+        while running:
+            item = await self.rows.get()
+            if(item is None):
+                break
+            batch = {}
+            count = 0
+            deadline = loop.time() + BATCH_MAX_DELAY
+            while(True):
+                batch.setdefault(item.kind, []).append(item)
+                # A changed type or range of the sensor is written with the batch.
+                spec = self.specs.check(item)
+                if(spec is not None):
+                    batch.setdefault(SENSOR_SPEC_TABLE, []).append(spec)
+                count += 1
+                if(count >= BATCH_MAX_SIZE):
+                    break
+                try:
+                    item = await asyncio.wait_for(self.rows.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if(item is None):
+                    running = False
+                    break
+
+            await self.flush_async(batch)
+
+
+    async def listen_async(self):
+        """listen_async coroutine. This coroutine opens the notification connection
+        and listens to the changes of the nodes table.
+        """
+
+        conn = await asyncpg.connect(database=sn_db.DB_NAME, user=sn_db.DB_USERNAME,
+                                     password=sn_db.DB_PASSWORD, host=sn_db.DB_HOST, port=sn_db.DB_PORT,
+                                     server_settings={'application_name': sn_db.application_name()})
+        await conn.add_listener(sn_db.DB_NOTIFY_CHANNEL, self.on_notification)
+        return conn
+
+
+    async def listener_async(self,conn):
+        """listener_async coroutine. This coroutine watches the notification connection and opens it
+        again when it is lost. The changes of the time without a connection are loaded again.
+        Args:
+            param1 (Connection): The notification connection.
+        """
+
+        try:
+            while True:
+                await asyncio.sleep(NOTIFY_POLL_INTERVAL)
+                if(conn is not None and not conn.is_closed()):
+                    continue
+                try:
+                    conn = await self.listen_async()
+                except (OSError, asyncpg.PostgresError) as exception:
+                    print(exception)
+                    conn = None
+                    await asyncio.sleep(NOTIFY_RECONNECT_DELAY)
+                    continue
+                await self.reload_nodes_async()
+        finally:
+            if(conn is not None):
+                await conn.close()
+
+
+    def on_notification(self,conn,pid,channel,payload):
+        """on_notification callback function. This function applies a change of the nodes table
+        that was made by another server or by an operator.
+        Args:
+            param1 (Connection): The notification connection.
+            param2 (int): The process id of the database backend that made the change.
+            param3 (str): The channel.
+            param4 (str): The notification payload.
+        """
+
+        change = read_change(payload)
+        if(change is None):
+            return
+        try:
+            if(change['op'] == "TRUNCATE"):
+                asyncio.get_running_loop().create_task(self.reload_nodes_async())
+            else:
+                self.apply_node_change(change)
+        except Exception:
+            traceback.print_exc()
+
+
+    def refresh_snapshot(self,node_id=None):
+        """refresh_snapshot function. The configuration of the node is loaded
+        into the snapshot by a task of the event loop.
+        Args:
+            param1 (str): The node id, or None for every node.
+        """
+
+        asyncio.get_running_loop().create_task(self.refresh_snapshot_async(node_id))
+
+
+    async def refresh_snapshot_async(self,node_id):
+        """refresh_snapshot_async coroutine. This coroutine loads the configuration of a node,
+        or of every node, from the database into the snapshot of the JSON file.
+        Args:
+            param1 (str): The node id, or None for every node.
+        """
+
+        if(self.db is None):
+            return
+        try:
+            if(node_id is None):
+                self.snapshot.replace([tuple(row) for row in
+                                       await self.db.fetch(STATEMENTS["get_node_configs"][0])])
+                return
+            config = await self.db.fetchval(STATEMENTS["get_node_config"][0], node_id)
+            if(config is None):
+                self.snapshot.remove(node_id)
+            else:
+                self.snapshot.update(node_id, config)
+        except Exception:
+            traceback.print_exc()
+
+
+    async def reload_nodes_async(self):
+        """reload_nodes_async coroutine. This coroutine loads the registry, the fingerprints and
+        the snapshot again from the database, when the changes of a period are unknown.
+        """
+
+        if(self.db is None):
+            # The nodes are loaded when the database is connected.
+            return
+        try:
+            self.registry.replace([tuple(row) for row in await self.db.fetch(STATEMENTS["get_node_states"][0])])
+            self.config_cache.replace([tuple(row) for row in
+                                       await self.db.fetch(STATEMENTS["get_config_hashes"][0])])
+        except Exception:
+            traceback.print_exc()
+            return
+        await self.refresh_snapshot_async(None)
+
+
+    async def node_writer_async(self):
+        """node_writer_async coroutine. This coroutine writes the pending changes
+        of the nodes table every NODE_FLUSH_INTERVAL seconds. When the server stops,
+        the last changes are written and the coroutine ends.
+        """
+
+        while not self.stopping.is_set():
+            await self.wait_stopping(NODE_FLUSH_INTERVAL)
+            await self.flush_nodes_async()
+        # The changes that were made during the last flush are written too.
+        await self.flush_nodes_async()
+
+
+    async def flush_nodes_async(self):
+        """flush_nodes_async coroutine. This coroutine writes the pending changes
+        of the nodes table with a single statement, or appends them to the spool.
+        """
+
+        params = self.node_writer.take()
+        if(not params[0]):
+            return
+        if(self.spool_required()):
+            self.spool.append_nodes(params)
+            return
+        try:
+            await self.db.execute(STATEMENTS["update_nodes"][0], *params)
+            Sn_db.breaker.success()
+            self.node_writer.nodes_written += len(params[0])
+            self.node_writer.flushes += 1
+        except Exception:
+            traceback.print_exc()
+            Sn_db.breaker.failure()
+            # The updates are kept in the spool and they are written when the database recovers.
+            self.spool.append_nodes(params)
+
+
+    async def rollup_writer_async(self):
+        """rollup_writer_async coroutine. This coroutine writes the finished rollup windows
+        every ROLLUP_FLUSH_INTERVAL seconds. When the server stops, every open window
+        is written and the coroutine ends.
+        """
+
+        while not self.stopping.is_set():
+            await self.wait_stopping(ROLLUP_FLUSH_INTERVAL)
+            await self.flush_rollups_async(time.time())
+        # The windows that are still open are written too.
+        await self.flush_rollups_async(None)
+
+
+    async def status_async(self):
+        """status_async coroutine. This coroutine publishes the status report every STATUS_INTERVAL seconds.
+        The counters are collected on a worker thread, a part can hold its lock while it writes.
+        """
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.status.interval)
+            try:
+                payload = await loop.run_in_executor(None, self.status.payload)
+                self.status.publish(payload)
+            except Exception:
+                # A failing report must not stop the coroutine.
+                traceback.print_exc()
+
+
+    async def wait_stopping(self,timeout):
+        """wait_stopping coroutine. This coroutine waits until the server stops or the timeout passes.
+        Args:
+            param1 (float): The timeout in seconds.
+        """
+
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+    async def flush_rollups_async(self,now):
+        """flush_rollups_async coroutine. This coroutine writes the finished rollup windows,
+        every rollup table with a single statement and all tables in one transaction,
+        or appends them to the spool.
+        Args:
+            param1 (float): The current time, or None to write every open window.
+        """
+
+        rollups = self.rollup.take(now)
+        count = sum([len(params[0]) for params in rollups.values()])
+        if(count == 0):
+            return
+        if(self.spool_required()):
+            self.spool.append_rollups(rollups)
+            self.rollup.windows_spooled += count
+            return
+        try:
+            async with self.db.acquire() as conn:
+                async with conn.transaction():
+                    for table in rollups:
+                        await conn.execute(STATEMENTS["upsert_" + table][0], *rollups[table])
+            Sn_db.breaker.success()
+            self.rollup.windows_written += count
+            self.rollup.flushes += 1
+        except Exception:
+            traceback.print_exc()
+            Sn_db.breaker.failure()
+            # The windows are kept in the spool and they are written when the database recovers.
+            self.spool.append_rollups(rollups)
+            self.rollup.windows_spooled += count
+
+
+    async def flush_async(self,batch):
+        """flush_async coroutine. This coroutine writes a batch of rows, every table with
+        a single COPY and all tables in one transaction. If the database is unavailable,
+        or older writes still wait in the spool, the batch is appended to the spool.
+        Args:
+            param1 (dict): A dictionary with the table name as key and a list of rows as value.
+        """
+
+        if(self.spool_required()):
+            self.spool.append_rows(batch)
+            return
+        db = Sn_db()
+        try:
+            async with self.db.acquire() as conn:
+                async with conn.transaction():
+                    for table in batch:
+                        if(table == SENSOR_SPEC_TABLE):
+                            await conn.execute(STATEMENTS["upsert_sensor_specs"][0],
+                                               *db.spec_params(batch[table]))
+                            continue
+                        # The rows are written in the COPY text format, one line per row.
+                        data = "".join(["\t".join([db.copy_escape(value) for value in row]) + "\n"
+                                        for row in batch[table]])
+                        await conn.copy_to_table(table, source=BytesIO(data.encode("utf-8")),
+                                                 columns=list(CLIENT_DATA_COLUMNS[table]), format="text")
+            Sn_db.breaker.success()
+        except Exception:
+            traceback.print_exc()
+            Sn_db.breaker.failure()
+            # The rows are kept in the spool and they are written when the database recovers.
+            self.spool.append_rows(batch)
+
+
+    def spool_required(self):
+        """spool_required function. This function returns True if a write must go to the spool,
+        because older writes still wait in it, the database is unavailable or it was not connected yet.
+        """
+
+        return self.db is None or self.spool.has_data() or not Sn_db.breaker.allow()
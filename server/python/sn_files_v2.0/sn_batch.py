@@ -0,0 +1,240 @@
+"""
+    File name: sn_batch.py
+    Author: Georgios Vrettos
+    Date created: 27/4/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the batch writer of the sensor data is constructed. Sensor readings are collected
+per table and they are written to the database with COPY in one transaction, when the batch
+is full or when the oldest reading has waited long enough. The batch size is adjusted
+after every flush depending on how long the flush took. If the database is unavailable,
+or older data still waits in the spool, the batch is appended to the spool instead.
+The rows keep only the node id, the numeric value and the UTC time that the reading was received,
+so a batch that waits in the spool keeps the time of its readings. The type and the range of a sensor are
+written to the sensor specification table, with the batch of the first reading that changes them.
+
+
+Todo :
+	*
+"""
+
+import threading
+import time
+import traceback
+from sn_thread import Sn_thread
+from sn_db import Sn_db, SENSOR_SPEC_TABLE
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The batch size on startup.
+BATCH_START_SIZE = 200
+# The limits of the batch size.
+BATCH_MIN_SIZE = 20
+BATCH_MAX_SIZE = 5000
+# The maximum time in seconds that a reading waits before it is written.
+BATCH_MAX_DELAY = 1.0
+# The flush duration in seconds that the batch size is tuned for.
+BATCH_TARGET_LATENCY = 0.2
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_sensor_specs:
+    ''' Base class for the sensor specifications. It contains the last type
+        and range of every sensor of every node.
+    '''
+
+    def __init__(self):
+        """__init__ function. This function creates an empty set of specifications.
+        """
+
+        # A dictionary with (node id, sensor data table) as key and (type, range) as value.
+        self.specs = {}
+        self.changes = 0
+
+
+    def check(self,reading):
+        """check function. This function returns the specification row of a reading if the type
+        or the range of its sensor changed, or None if they are the same as before.
+        Args:
+            param1 (Sn_reading): The sensor reading.
+        """
+
+        key = (reading.node_id, reading.kind)
+        spec = (reading.type, reading.range)
+        if(self.specs.get(key) == spec):
+            return None
+        self.specs[key] = spec
+        self.changes += 1
+        return (reading.node_id, reading.kind, reading.type, reading.range)
+
+
+class Sn_batch_writer:
+    ''' Base class for the batch writer. It contains the pending rows of every table
+        and the thread that writes them to the database.
+    '''
+
+    def __init__(self,spool):
+        """__init__ function. This function initializes the batch and starts the writer thread.
+        Args:
+            param1 (Sn_spool): The spool that takes the batches that cannot be written.
+        """
+
+        self.spool = spool
+        # A dictionary with the table name as key and a list of pending readings as value.
+        self.rows = {}
+        # The specifications of the sensors, a changed one is added to the batch.
+        self.specs = Sn_sensor_specs()
+        self.pending = 0
+        # The arrival time of the oldest pending row.
+        self.first_row_time = None
+        self.batch_size = BATCH_START_SIZE
+        self.running = True
+        self.cond = threading.Condition()
+
+        # Writer counters.
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_spooled = 0
+        self.last_latency = 0.0
+        # The time from the arrival of the oldest reading of the last batch until it was written.
+        self.ingest_latency = 0.0
+
+        self.thread = Sn_thread(id="batch_writer", callback=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def add(self,reading):
+        """add function. This function adds a reading to the batch of its table.
+        If the batch is much larger than the batch size, the caller waits for the writer.
+        Args:
+            param1 (Sn_reading): The sensor reading.
+        """
+
+        with self.cond:
+            while(self.running and self.pending >= BATCH_MAX_SIZE * 2):
+                self.cond.wait()
+            self.rows.setdefault(reading.kind, []).append(reading)
+            spec = self.specs.check(reading)
+            if(spec is not None):
+                self.rows.setdefault(SENSOR_SPEC_TABLE, []).append(spec)
+            self.pending += 1
+            if(self.first_row_time is None):
+                # The writer is woken up to start counting the delay of the batch.
+                self.first_row_time = time.time()
+                self.cond.notify_all()
+            elif(self.pending >= self.batch_size):
+                self.cond.notify_all()
+
+
+    def run(self,id,data):
+        """run function. This is the loop of the writer thread. The thread sleeps
+        until the batch is full or the oldest row reaches the maximum delay.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            with self.cond:
+                while(self.running):
+                    if(self.pending == 0):
+                        self.cond.wait()
+                        continue
+                    remaining = self.first_row_time + BATCH_MAX_DELAY - time.time()
+                    if(self.pending >= self.batch_size or remaining <= 0):
+                        break
+                    self.cond.wait(remaining)
+
+                if(self.pending == 0):
+                    # The writer is stopped and nothing is left to write.
+                    return
+
+                # The pending rows are taken and the batch starts again empty.
+                batch = self.rows
+                count = self.pending
+                self.rows = {}
+                self.pending = 0
+                self.first_row_time = None
+                self.cond.notify_all()
+
+            self.flush(batch, count)
+
+
+    def flush(self,batch,count):
+        """flush function. This function writes a batch to the database.
+        Args:
+            param1 (dict): A dictionary with the table name as key and a list of readings as value.
+            param2 (int): The number of rows in the batch.
+        """
+
+        # The readings are added about in the order they arrived, the first reading of a table is taken as the oldest.
+        oldest = min([rows[0].received for table, rows in batch.items() if table != SENSOR_SPEC_TABLE])
+
+        if(self.spool.has_data() or not Sn_db.breaker.allow()):
+            # Older rows wait in the spool or the database is unavailable.
+            self.spool.append_rows(batch)
+            self.rows_spooled += count
+            return
+
+        start = time.time()
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn == ""):
+                raise RuntimeError("No database connection.")
+            db.copy_client_data(batch)
+            Sn_db.breaker.success()
+            self.rows_written += count
+        except Exception:
+            traceback.print_exc()
+            Sn_db.breaker.failure()
+            # The rows are kept in the spool and they are written when the database recovers.
+            self.spool.append_rows(batch)
+            self.rows_spooled += count
+        finally:
+            db.disconnect_db()
+
+        self.flushes += 1
+        self.last_latency = time.time() - start
+        self.ingest_latency = time.time() - oldest
+        self.tune(self.last_latency)
+
+
+    def tune(self,latency):
+        """tune function. This function adjusts the batch size. Fast flushes
+        make the batch larger and slow flushes make it smaller.
+        Args:
+            param1 (float): The duration of the last flush in seconds.
+        """
+
+        with self.cond:
+            if(latency < BATCH_TARGET_LATENCY / 2):
+                self.batch_size = min(BATCH_MAX_SIZE, self.batch_size * 2)
+            elif(latency > BATCH_TARGET_LATENCY):
+                self.batch_size = max(BATCH_MIN_SIZE, self.batch_size // 2)
+
+
+    def close(self):
+        """close function. This function stops the writer thread after
+        every pending row is written.
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the writer counters in a dictionary.
+        """
+
+        with self.cond:
+            return {'pending': self.pending, 'batch_size': self.batch_size,
+                    'flushes': self.flushes, 'rows_written': self.rows_written,
+                    'rows_spooled': self.rows_spooled, 'last_latency': self.last_latency,
+                    'ingest_latency': self.ingest_latency, 'spec_changes': self.specs.changes}
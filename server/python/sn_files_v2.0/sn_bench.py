@@ -0,0 +1,397 @@
+"""
+    File name: sn_bench.py
+    Author: Georgios Vrettos
+    Date created: 9/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the micro benchmarks of the server are constructed. Every benchmark
+measures a step of the message handling without a broker or a database and prints
+the cost per message of the old and the new way. The storage benchmark compares the
+sensor data rows of the old and the new table layout on the database and the rollup benchmark
+compares a long range query on the readings and on the rollup windows.
+
+Example:
+	$ python sn_bench.py payload
+	$ python3 sn_bench.py record
+	$ python sn_bench.py xml
+	$ python sn_bench.py storage
+	$ python sn_bench.py rollup
+	$ python sn_bench.py all
+
+Todo :
+	*
+"""
+
+import json
+import sys
+import time
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+import xmltodict
+import paho.mqtt.client as mqtt
+import sn_xml
+from sn_db import Sn_db, ROLLUP_TABLES
+from sn_states import ActiveMode
+from sn_router import Sn_router
+from sn_record import Sn_message, Sn_reading
+from sn_rollup import Sn_rollup_windows
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The number of messages of every benchmark.
+BENCH_MESSAGES = 200000
+# The number of repetitions, the fastest one is reported.
+BENCH_REPEAT = 5
+# The topic of the benchmark messages.
+BENCH_TOPIC = "Karlovasi_IoT_network/CN2/Greece/Samos/Karlovasi/AegeanUniversityCampus/indoor/A/A52/indoorTemperatureSensor"
+# The node configuration of the XML benchmark.
+BENCH_XML_FILE_PATH = "../../../NodeMCU/xml/cn2_config.xml"
+# The number of sensors of the large configuration of the XML benchmark.
+BENCH_XML_SENSORS = 500
+# The number of nodes of the storage and the rollup benchmarks.
+BENCH_NODES = 20
+# The number of days that the readings of the rollup benchmark are spread over.
+BENCH_ROLLUP_DAYS = 7
+
+# --------------------------------------------------------------------------------------------------
+
+
+def measure(function,messages):
+    """measure function. This function runs a benchmark function a number of times
+    and returns the fastest time per message in nanoseconds.
+    Args:
+        param1 (function): The benchmark function, it handles every message of the list.
+        param2 (list): The messages.
+    """
+
+    best = None
+    for i in range(BENCH_REPEAT):
+        start = time.time()
+        function(messages)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e9 / len(messages)
+
+
+def report(name,before,after):
+    """report function. This function prints the result of a benchmark.
+    Args:
+        param1 (str): The benchmark name.
+        param2 (float): The cost per message of the old way in nanoseconds.
+        param3 (float): The cost per message of the new way in nanoseconds.
+    """
+
+    print("%-10s before %8.0f ns/msg   after %8.0f ns/msg   speedup %.2fx" % (name, before, after, before / after))
+
+
+def find_in_payload(payload,position):
+    """find_in_payload function. This function extracts a specific item from a data message
+    depending on the position of the item. It is the old way of the payload benchmark, the server
+    decodes the payloads with find_data_values.
+    Args:
+        param1 (str): Message payload.
+        param2 (int): Word position on payload.
+    """
+
+    # Word extraction from the current payload.
+    i=1
+    start = 0
+    end = payload.find(',')
+    # Depending on the position of the item that we need to extract from the payload
+    # the loop runs to locate the item between two ",".
+    while i < position:
+        start = end + 1
+        if(payload.find(',',end + 1)!=-1):
+            end = payload.find(',',end + 1)
+        else:
+            end = len(payload)
+        i = i + 1
+    # when the desired word indexes are found we extract the final item.
+    return payload[start:end]
+
+
+def bench_payload():
+    """bench_payload function. This function compares the three find_in_payload scans
+    with the single pass decoder of the sensor data payloads.
+    """
+
+    # The state is created without its setup, only its parsing functions are used.
+    state = ActiveMode.__new__(ActiveMode)
+    payloads = [("float,0-70,%d.%d" % (i % 70, i % 10)).encode("ascii") for i in range(BENCH_MESSAGES)]
+    texts = [payload.decode("ascii") for payload in payloads]
+
+    def before(messages):
+        for payload in messages:
+            data = {}
+            data['temperature_type'] = find_in_payload(payload, 1)
+            data['temperature_range'] = find_in_payload(payload, 2)
+            data['temperature'] = find_in_payload(payload, 3)
+
+    def after(messages):
+        for payload in messages:
+            state.find_data_values(payload)
+
+    report("payload", measure(before, texts), measure(after, payloads))
+
+
+def measure_memory(function,count):
+    """measure_memory function. This function returns the memory in bytes per message
+    that is still allocated after a function creates count messages.
+    Args:
+        param1 (function): The function, it returns the objects that are kept.
+        param2 (int): The number of messages.
+    """
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    kept = function(count)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del kept
+    return float(used) / count
+
+
+def bench_record():
+    """bench_record function. This function compares the memory that a reading keeps while it waits
+    in the buffer and in the batch: the MQTT message, the dictionary of the extracted data and the row,
+    against the compact message and reading records.
+    """
+
+    if(tracemalloc is None):
+        print("record     the memory benchmark needs Python 3")
+        return
+    state = ActiveMode.__new__(ActiveMode)
+    router = Sn_router()
+    router.add("+/+/+/+/+/+/+/+/+/+", None)
+    count = BENCH_MESSAGES // 4
+
+    def before(count):
+        buffered = []
+        rows = []
+        for i in range(count):
+            msg = mqtt.MQTTMessage(mid=i, topic=BENCH_TOPIC.encode("utf-8"))
+            msg.payload = b"float,0-70,23.5"
+            buffered.append(msg)
+        for msg in buffered:
+            payload = msg.payload.decode("utf-8")
+            data = {}
+            data['temperature_type'] = find_in_payload(payload, 1)
+            data['temperature_range'] = find_in_payload(payload, 2)
+            data['temperature'] = find_in_payload(payload, 3)
+            rows.append(("CN2", data['temperature'], data['temperature_type'], data['temperature_range']))
+        # The messages and the extracted data are kept until the batch is written.
+        return buffered, rows
+
+    def after(count):
+        buffered = []
+        rows = []
+        topics = {}
+        for i in range(count):
+            topic = BENCH_TOPIC
+            buffered.append(Sn_message(topics.setdefault(topic, topic), b"float,0-70,23.5", time.time()))
+        for msg in buffered:
+            route = router.route(msg.topic)
+            data_type, data_range, value = state.find_data_values(msg.payload)
+            rows.append(Sn_reading(route.node_id, "temperature", value, msg.received, data_range, data_type))
+        return buffered, rows
+
+    before_bytes = measure_memory(before, count)
+    after_bytes = measure_memory(after, count)
+    print("%-10s before %8.0f B/msg    after %8.0f B/msg    reduction %.0f%%" %
+          ("record", before_bytes, after_bytes, 100.0 * (before_bytes - after_bytes) / before_bytes))
+
+
+def measure_peak(function,argument):
+    """measure_peak function. This function returns the peak memory in bytes
+    that a function allocates while it runs.
+    Args:
+        param1 (function): The function.
+        param2 (object): The argument of the function.
+    """
+
+    tracemalloc.start()
+    function(argument)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_xml():
+    """bench_xml function. This function compares the conversion of a node configuration
+    with xmltodict and json.dumps and the node id scan of the JSON, against the streaming converter.
+    The large configuration has BENCH_XML_SENSORS sensors.
+    """
+
+    xml_file = open(BENCH_XML_FILE_PATH, 'r')
+    xml_config = xml_file.read()
+    xml_file.close()
+    sensors_start = xml_config.find("<sensor>")
+    sensors_end = xml_config.find("</sensors>")
+    sensor = xml_config[sensors_start:sensors_end]
+    large_config = xml_config[:sensors_start] + sensor * BENCH_XML_SENSORS + xml_config[sensors_end:]
+    db = Sn_db()
+
+    def before(configs):
+        for config in configs:
+            config_json = json.dumps(xmltodict.parse(config))
+            db.find_node_id(config_json)
+
+    def after(configs):
+        for config in configs:
+            sn_xml.convert(config)
+
+    configs = [xml_config] * (BENCH_MESSAGES // 100)
+    report("xml", measure(before, configs), measure(after, configs))
+    large_configs = [large_config] * (BENCH_MESSAGES // 10000)
+    report("xml-large", measure(before, large_configs), measure(after, large_configs))
+
+    if(tracemalloc is not None):
+        before_bytes = measure_peak(before, [large_config])
+        after_bytes = measure_peak(after, [large_config])
+        print("%-10s before %8.0f B peak   after %8.0f B peak   reduction %.0f%%" %
+              ("xml-large", before_bytes, after_bytes, 100.0 * (before_bytes - after_bytes) / before_bytes))
+
+
+def bench_storage():
+    """bench_storage function. This function compares the rows with the value, type and range as text
+    against the rows with a numeric value. It prints the size of a row with its (node_id, time) index
+    and the time of a per node min/avg/max query over every row. The tables are temporary.
+    """
+
+    db = Sn_db()
+    db.connect_db()
+    if(db.conn == ""):
+        print("storage    the storage benchmark needs the database")
+        return
+    # The table, its value columns and the value expression of the query of every layout.
+    layouts = (("bench_text", (("temperature", "text"), ("temperature_type", "text"), ("temperature_range", "text")),
+                "temperature::double precision"),
+               ("bench_typed", (("temperature", "double precision"),), "temperature"))
+    readings = [Sn_reading("CN" + str(i % BENCH_NODES), "temperature", float(i % 70) + 0.5, 0.0, "0-70", "float")
+                for i in range(BENCH_MESSAGES)]
+    sizes = []
+    durations = []
+    try:
+        cur = db.conn.cursor()
+        for table, columns, value in layouts:
+            cur.execute("CREATE TEMPORARY TABLE " + table + " (node_id text, " +
+                        ", ".join([name + " " + kind for name, kind in columns]) +
+                        ", time timestamp NOT NULL DEFAULT now())")
+            rows = StringIO()
+            for reading in readings:
+                if(table == "bench_text"):
+                    # The old rows repeat the type and the range of the sensor.
+                    rows.write("%s\t%r\t%s\t%s\n" % (reading.node_id, reading.value, reading.type, reading.range))
+                else:
+                    rows.write("%s\t%r\n" % (reading.node_id, reading.value))
+            rows.seek(0)
+            cur.copy_from(rows, table, columns=["node_id"] + [name for name, kind in columns])
+            cur.execute("CREATE INDEX ON " + table + " (node_id, time)")
+            cur.execute("ANALYZE " + table)
+            cur.execute("SELECT pg_total_relation_size(%s)", (table,))
+            sizes.append(float(cur.fetchone()[0]) / len(readings))
+
+            best = None
+            for i in range(BENCH_REPEAT):
+                start = time.time()
+                cur.execute("SELECT node_id, min(" + value + "), avg(" + value + "), max(" + value + ") FROM " +
+                            table + " GROUP BY node_id")
+                cur.fetchall()
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            durations.append(best * 1000)
+    finally:
+        # The temporary tables are dropped with the transaction.
+        db.conn.rollback()
+        db.disconnect_db()
+
+    print("%-10s before %8.0f B/row    after %8.0f B/row    reduction %.0f%%" %
+          ("storage", sizes[0], sizes[1], 100.0 * (sizes[0] - sizes[1]) / sizes[0]))
+    print("%-10s before %8.1f ms       after %8.1f ms       speedup %.2fx" %
+          ("aggregate", durations[0], durations[1], durations[0] / durations[1]))
+
+
+def bench_rollup():
+    """bench_rollup function. This function compares a long range query of the daily min/avg/max of a node
+    on the readings against the same query on the hourly rollup windows. The readings are spread over
+    BENCH_ROLLUP_DAYS days and the windows are made by the rollup windows of the server. The tables are temporary.
+    """
+
+    db = Sn_db()
+    db.connect_db()
+    if(db.conn == ""):
+        print("rollup     the rollup benchmark needs the database")
+        return
+    windows = Sn_rollup_windows()
+    end = time.time()
+    step = BENCH_ROLLUP_DAYS * 86400.0 / BENCH_MESSAGES
+    rows = StringIO()
+    for i in range(BENCH_MESSAGES):
+        reading = Sn_reading("CN" + str(i % BENCH_NODES), "temperature", float(i % 70) + 0.5,
+                             end - (BENCH_MESSAGES - i) * step, "0-70", "float")
+        windows.add(reading)
+        rows.write("%s\t%r\t%s\n" % tuple(reading))
+    rollup = windows.take()[ROLLUP_TABLES[-1][1]]
+    # The period of a time, as the period of the statements of the server.
+    period = "to_timestamp(floor(extract(epoch FROM %s) / 86400) * 86400) AT TIME ZONE 'UTC'"
+    queries = ("SELECT " + period % "time" + " AS period, count(*), min(temperature), avg(temperature), "
+               "max(temperature) FROM bench_raw WHERE node_id = 'CN1' GROUP BY period",
+               "SELECT " + period % "bucket" + " AS period, sum(readings), min(value_min), "
+               "sum(value_sum) / sum(readings), max(value_max) FROM bench_rollup WHERE node_id = 'CN1' "
+               "AND sensor = 'temperature' GROUP BY period")
+    durations = []
+    try:
+        cur = db.conn.cursor()
+        cur.execute("CREATE TEMPORARY TABLE bench_raw (node_id text, temperature double precision, "
+                    "time timestamp NOT NULL)")
+        rows.seek(0)
+        cur.copy_from(rows, "bench_raw")
+        cur.execute("CREATE INDEX ON bench_raw (node_id, time)")
+        cur.execute("CREATE TEMPORARY TABLE bench_rollup (node_id text, sensor text, bucket timestamp, "
+                    "readings bigint, value_sum double precision, value_min double precision, "
+                    "value_max double precision, PRIMARY KEY (node_id, sensor, bucket))")
+        cur.execute("INSERT INTO bench_rollup SELECT node_id, sensor, to_timestamp(bucket)::timestamp, readings, "
+                    "value_sum, value_min, value_max FROM unnest(%s::text[], %s::text[], %s::float8[], "
+                    "%s::bigint[], %s::float8[], %s::float8[], %s::float8[]) "
+                    "AS v(node_id, sensor, bucket, readings, value_sum, value_min, value_max)", tuple(rollup))
+        cur.execute("ANALYZE bench_raw")
+        cur.execute("ANALYZE bench_rollup")
+
+        for query in queries:
+            best = None
+            for i in range(BENCH_REPEAT):
+                start = time.time()
+                cur.execute(query)
+                cur.fetchall()
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            durations.append(best * 1000)
+    finally:
+        # The temporary tables are dropped with the transaction.
+        db.conn.rollback()
+        db.disconnect_db()
+
+    print("%-10s before %8.2f ms       after %8.2f ms       speedup %.1fx" %
+          ("rollup", durations[0], durations[1], durations[0] / durations[1]))
+
+
+# The benchmarks by name.
+BENCHMARKS = {"payload": bench_payload, "record": bench_record, "xml": bench_xml, "storage": bench_storage,
+              "rollup": bench_rollup}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or ["all"]
+    if(names == ["all"]):
+        names = sorted(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
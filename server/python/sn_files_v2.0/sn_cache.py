@@ -0,0 +1,162 @@
+"""
+    File name: sn_cache.py
+    Author: Georgios Vrettos
+    Date created: 12/5/2018
+    Date last modified: 17/5/2018
+    Python Version: 2.7
+
+In this module, the configuration fingerprint cache of the server is constructed. The fingerprint
+of a configuration is the SHA-1 hash of its XML. The cache remembers the fingerprint of the last
+saved configuration of every node, so a node that sends the same configuration again is not
+validated, converted and saved again. It also remembers the fingerprints of invalid configurations,
+so a repeated invalid configuration is rejected without parsing it.
+The fingerprints of the saved configurations are kept in the config_hash column of the nodes table
+and the cache is loaded from it on startup.
+
+
+Todo :
+	*
+"""
+
+import collections
+import hashlib
+import threading
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The maximum number of invalid configuration fingerprints that are remembered.
+CONFIG_NEGATIVE_CACHE_SIZE = 1000
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_config_cache:
+    ''' Base class for the configuration fingerprint cache. It contains the fingerprint
+        of every node, the fingerprints of the invalid configurations and the cache counters.
+    '''
+
+    def __init__(self,negative_size=CONFIG_NEGATIVE_CACHE_SIZE):
+        """__init__ function. This function creates an empty cache.
+        Args:
+            param1 (int): The maximum number of invalid configuration fingerprints.
+        """
+
+        # A dictionary with the node id as key and the fingerprint of its saved configuration as value.
+        self.nodes = {}
+        # The fingerprints of the invalid configurations, least recently used first.
+        self.invalid = collections.OrderedDict()
+        self.negative_size = negative_size
+        self.lock = threading.Lock()
+
+        # Cache counters.
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+
+    def fingerprint(self,xml_config):
+        """fingerprint function. This function returns the fingerprint of a configuration.
+        Args:
+            param1 (str): The configuration in XML form.
+        """
+
+        if(not isinstance(xml_config, bytes)):
+            xml_config = xml_config.encode("utf-8")
+        return hashlib.sha1(xml_config).hexdigest()
+
+
+    def seed(self,rows):
+        """seed function. This function loads the fingerprints of the saved configurations.
+        Args:
+            param1 (list): The (node id, fingerprint) rows of the nodes table.
+        """
+
+        with self.lock:
+            for node_id, fingerprint in rows:
+                self.nodes[node_id] = fingerprint
+
+
+    def replace(self,rows):
+        """replace function. This function replaces the fingerprints of the saved configurations.
+        Args:
+            param1 (list): The (node id, fingerprint) rows of the nodes table.
+        """
+
+        with self.lock:
+            self.nodes = dict(rows)
+
+
+    def is_saved(self,node_id,fingerprint):
+        """is_saved function. This function returns True if the configuration
+        is the saved configuration of the node.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The configuration fingerprint.
+        """
+
+        with self.lock:
+            if(self.nodes.get(node_id) == fingerprint):
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+
+    def is_invalid(self,fingerprint):
+        """is_invalid function. This function returns True if the configuration was found invalid before.
+        Args:
+            param1 (str): The configuration fingerprint.
+        """
+
+        with self.lock:
+            if(fingerprint in self.invalid):
+                # The fingerprint is put back as the most recently used one.
+                self.invalid[fingerprint] = self.invalid.pop(fingerprint)
+                self.negative_hits += 1
+                return True
+            return False
+
+
+    def remember(self,node_id,fingerprint):
+        """remember function. This function remembers the saved configuration of a node.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The configuration fingerprint.
+        """
+
+        with self.lock:
+            self.nodes[node_id] = fingerprint
+
+
+    def forget(self,node_id):
+        """forget function. This function forgets the saved configuration of a node,
+        its next configuration is validated and saved.
+        Args:
+            param1 (str): The node id.
+        """
+
+        with self.lock:
+            self.nodes.pop(node_id, None)
+
+
+    def remember_invalid(self,fingerprint):
+        """remember_invalid function. This function remembers an invalid configuration.
+        Args:
+            param1 (str): The configuration fingerprint.
+        """
+
+        with self.lock:
+            self.invalid[fingerprint] = True
+            if(len(self.invalid) > self.negative_size):
+                # The least recently used fingerprint is removed.
+                self.invalid.popitem(last=False)
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the cache counters in a dictionary.
+        """
+
+        with self.lock:
+            return {'nodes': len(self.nodes), 'invalid': len(self.invalid), 'hits': self.hits,
+                    'misses': self.misses, 'negative_hits': self.negative_hits}
@@ -0,0 +1,73 @@
+"""
+    File name: sn_config.py
+    Author: Georgios Vrettos
+    Date created: 14/5/2018
+    Date last modified: 14/5/2018
+    Python Version: 2.7
+
+In this module, the model of the server configuration is constructed. The server configuration
+file is parsed once at startup and the subscription topics and the $SYS topics of the server
+are formed once. The $SYS topics of a client are the $SYS prefix of the server, the client id
+and a suffix.
+
+
+Todo :
+	*
+"""
+
+import sn_xml
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The suffixes of the $SYS topics of a client, after the client id.
+SYS_CLIENT_IP_SUFFIX = "/ipAddress"
+SYS_CLIENT_STATUS_SUFFIX = "/status"
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_config:
+    ''' Base class for the server configuration. It contains the configuration in XML and JSON form,
+        the values of the configuration, the subscription topics and the $SYS topics of the server.
+    '''
+
+    def __init__(self,xml_config):
+        """__init__ function. This function parses the server configuration and forms its topics.
+        Args:
+            param1 (str): The server configuration in XML form.
+        """
+
+        self.xml = xml_config
+        self.json, summary = sn_xml.convert(xml_config)
+        self.node_id = summary.node_id
+        self.ip_address = summary.ip_address
+        self.network = summary.network
+        self.server_id = summary.server_id
+        self.location = summary.location
+
+        # The location words of every topic of the network.
+        location_path = "/".join(self.location)
+
+        # The client control topic and the sensor data topic, every node of the network matches '+'.
+        self.control_topic = self.network + "/+/" + location_path + "/control"
+        self.sensor_data_topic = self.network + "/+/" + location_path + "/+"
+
+        # Every $SYS topic of the server and of its clients starts with this prefix.
+        self.sys_prefix = "$SYS/" + self.network + "/" + self.server_id + "/" + location_path + "/"
+        self.sys_topics = {'local_time': self.sys_prefix + "localDateTime",
+                           'server_status': self.sys_prefix + self.server_id + "/status",
+                           'server_stats': self.sys_prefix + self.server_id + "/stats",
+                           'network_status': self.sys_prefix + "networkStatus",
+                           'server_ip': self.sys_prefix + "ipAddress",
+                           'num_connected_nodes': self.sys_prefix + "numOfConnectedNodes"}
+
+
+    def client_topic(self,client_id,suffix):
+        """client_topic function. This function returns a $SYS topic of a client.
+        Args:
+            param1 (str): The client id.
+            param2 (str): The topic suffix, SYS_CLIENT_IP_SUFFIX or SYS_CLIENT_STATUS_SUFFIX.
+        """
+
+        return self.sys_prefix + client_id + suffix
@@ -2,16 +2,37 @@
     File name: sn_db.py
     Author: Georgios Vrettos
     Date created: 11/12/2017
-    Date last modified: 18/4/2018
+    Date last modified: 20/5/2018
     Python Version: 2.7
 
 In this module, functions from the package "psycopg2" are used. 
 To install the package using pip issue the following command:
 $pip install psycopg2  
 
+The connections are kept open in a pool that is shared by every Sn_db instance.
+connect_db() borrows a connection from the pool and disconnect_db() returns it.
+Every query is a prepared statement from the STATEMENTS registry. A statement is prepared
+once on every connection and it is executed with bound parameters.
+Every change of the nodes table is announced on the DB_NOTIFY_CHANNEL channel by a trigger.
+The connections of every process carry its application name, the DB_APPLICATION_NAME prefix and
+the process id, so a process can tell its own changes apart from the changes of the other processes.
+The sensor data of a time range is read in periods from the coarsest rollup table that fits the periods.
+
 """
 
 import psycopg2
+import psycopg2.extensions
+import numbers
+import os
+import threading
+import time
+
+from sn_record import utc_timestamp
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 
 # Global variables
@@ -21,10 +42,445 @@ DB_USERNAME = "username"
 DB_PASSWORD = "password"
 DB_HOST = "ip"
 DB_PORT = "5432"
+# The prefix of the application name of the connections, the process id is added to it.
+DB_APPLICATION_NAME = "sn_server_"
+# The notification channel of the changes of the nodes table.
+DB_NOTIFY_CHANNEL = "sn_nodes"
+# The number of connections that are opened on startup and kept open.
+DB_POOL_MIN = 2
+# The maximum number of open connections.
+DB_POOL_MAX = 10
+# Seconds to wait for a free connection before giving up.
+DB_POOL_TIMEOUT = 30
+# A connection that stayed idle for more seconds than this is checked before use.
+DB_HEALTH_CHECK_INTERVAL = 30
+# The number of consecutive failures that open the circuit breaker.
+DB_BREAKER_FAILURES = 3
+# Seconds that the circuit breaker stays open before a new attempt is allowed.
+DB_BREAKER_RESET_TIME = 10
+
+# The columns of every sensor data table, in the order that the rows are given. The time is the
+# UTC time that the reading was received, it is given with every row and not left to the default.
+CLIENT_DATA_COLUMNS = {"temperature": ("node_id", "temperature", "time"),
+                       "humidity": ("node_id", "humidity", "time"),
+                       "flame": ("node_id", "flame", "time")}
+# The table of the type and the range of every sensor of every node. In a batch, its rows
+# are (node id, sensor data table, type, range) and they are written with the sensor data.
+SENSOR_SPEC_TABLE = "sensor_spec"
+# The rollup tables of the sensor data, from the finest to the coarsest. A table keeps the number, the sum,
+# the minimum and the maximum of the values of every node and sensor in windows of its number of seconds.
+ROLLUP_TABLES = ((60, "sensor_rollup_1m"), (3600, "sensor_rollup_1h"))
+# Seconds from the end of a window until it is written to the rollup tables, it covers
+# the grace time and the flush interval of the rollup writer.
+ROLLUP_WRITE_DELAY = 15
+
+# The start of the period of a time, for a period length of $4 seconds.
+ROLLUP_PERIOD = "(to_timestamp(floor(extract(epoch FROM %s) / $4::integer) * $4::integer) AT TIME ZONE 'UTC')"
+# The start of the oldest period that may have windows that are not written yet. The times are in UTC.
+ROLLUP_OPEN_PERIOD = ROLLUP_PERIOD % ("(now() AT TIME ZONE 'UTC') - interval '" + str(ROLLUP_WRITE_DELAY) + " seconds'")
+# The windows of a rollup table and the readings of a sensor data table, as rows of the same columns.
+ROLLUP_WINDOWS = ("SELECT " + ROLLUP_PERIOD % "bucket" + " AS period, readings, value_sum, value_min, value_max "
+                  "FROM {rollup} WHERE node_id = $1 AND sensor = '{sensor}' AND bucket >= $2 AND bucket < $3 "
+                  "AND bucket < " + ROLLUP_OPEN_PERIOD)
+RAW_WINDOWS = ("SELECT " + ROLLUP_PERIOD % "time" + " AS period, 1 AS readings, {sensor} AS value_sum, "
+               "{sensor} AS value_min, {sensor} AS value_max FROM {sensor} "
+               "WHERE node_id = $1 AND {sensor} IS NOT NULL AND time >= $2 AND time < $3")
+# The windows are merged to one row for every period.
+ROLLUP_QUERY = ("SELECT period, sum(readings)::bigint, min(value_min), sum(value_sum) / sum(readings), max(value_max) "
+                "FROM ({windows}) AS w GROUP BY period ORDER BY period")
+
+# The prepared statements, the name of every statement is mapped to the query and the number of parameters.
+STATEMENTS = {
+    "upsert_node": ("INSERT INTO nodes (node_id, node_config, last_connected, config_hash) "
+                    "VALUES ($1, $2, $3, $4) "
+                    "ON CONFLICT (node_id) DO UPDATE SET node_config = EXCLUDED.node_config, "
+                    "last_connected = EXCLUDED.last_connected, config_hash = EXCLUDED.config_hash", 4),
+    # A sensor specification is changed only if its type or range is different.
+    "upsert_sensor_specs": ("INSERT INTO sensor_spec AS s (node_id, sensor, data_type, data_range) "
+                            "SELECT * FROM unnest($1::text[], $2::text[], $3::text[], $4::text[]) "
+                            "ON CONFLICT (node_id, sensor) DO UPDATE SET data_type = EXCLUDED.data_type, "
+                            "data_range = EXCLUDED.data_range, updated = now() "
+                            "WHERE (s.data_type, s.data_range) IS DISTINCT FROM "
+                            "(EXCLUDED.data_type, EXCLUDED.data_range)", 4),
+    "get_node_configs": ("SELECT node_id, cast(node_config as text) FROM nodes", 0),
+    "get_node_config": ("SELECT cast(node_config as text) FROM nodes WHERE node_id = $1", 1),
+    "get_config_hashes": ("SELECT node_id, config_hash FROM nodes WHERE config_hash IS NOT NULL", 0),
+    "get_node_states": ("SELECT node_id, node_status, sev_mode FROM nodes", 0),
+    "get_node_states_by_id": ("SELECT node_id, node_status, sev_mode FROM nodes WHERE node_id = ANY($1)", 1),
+    # The columns that are NULL in the arrays keep their value.
+    "update_nodes": ("UPDATE nodes AS n SET sev_mode = COALESCE(v.sev_mode, n.sev_mode), "
+                     "last_connected = COALESCE(v.last_connected::timestamp, n.last_connected), "
+                     "node_status = COALESCE(v.node_status, n.node_status) "
+                     "FROM unnest($1::text[], $2::text[], $3::text[], $4::text[]) "
+                     "AS v(node_id, sev_mode, last_connected, node_status) "
+                     "WHERE n.node_id = v.node_id", 4),
+}
+
+# The windows of every rollup table are added to the stored windows, so a window
+# that was written in parts, by more than one shard or before a restart, is merged.
+# The window starts are seconds since the epoch, they are stored as UTC times.
+STATEMENTS.update(("upsert_" + table,
+                   ("INSERT INTO " + table + " AS r (node_id, sensor, bucket, readings, value_sum, value_min, value_max) "
+                    "SELECT v.node_id, v.sensor, to_timestamp(v.bucket) AT TIME ZONE 'UTC', v.readings, v.value_sum, "
+                    "v.value_min, v.value_max "
+                    "FROM unnest($1::text[], $2::text[], $3::float8[], $4::bigint[], $5::float8[], $6::float8[], "
+                    "$7::float8[]) AS v(node_id, sensor, bucket, readings, value_sum, value_min, value_max) "
+                    "ON CONFLICT (node_id, sensor, bucket) DO UPDATE SET readings = r.readings + EXCLUDED.readings, "
+                    "value_sum = r.value_sum + EXCLUDED.value_sum, value_min = least(r.value_min, EXCLUDED.value_min), "
+                    "value_max = greatest(r.value_max, EXCLUDED.value_max)", 7))
+                  for seconds, table in ROLLUP_TABLES)
+
+# The (period, readings, min, avg, max) rows of a node and sensor from $2 to $3, in periods of $4 seconds.
+# The query of a sensor data table alone is used for the periods that no rollup table fits. The query
+# of a rollup table reads the periods that may still have open windows from the sensor data table.
+STATEMENTS.update(("get_periods_" + sensor, (ROLLUP_QUERY.format(windows=RAW_WINDOWS.format(sensor=sensor)), 4))
+                  for sensor in CLIENT_DATA_COLUMNS)
+STATEMENTS.update(("get_periods_" + sensor + "_" + table,
+                   (ROLLUP_QUERY.format(windows=(ROLLUP_WINDOWS + " UNION ALL " + RAW_WINDOWS + " AND time >= " +
+                                                 ROLLUP_OPEN_PERIOD).format(sensor=sensor, rollup=table)), 4))
+                  for sensor in CLIENT_DATA_COLUMNS for seconds, table in ROLLUP_TABLES)
+
+# The schema changes that are applied on startup, every change can be applied more than once.
+MIGRATIONS = [
+    "ALTER TABLE nodes ADD COLUMN IF NOT EXISTS config_hash text",
+    # Every change of a node is announced with its new status and severity mode. The fingerprint
+    # is sent when it changes with the configuration, a configuration change without a new
+    # fingerprint sends NULL. A TRUNCATE is announced without a node id.
+    "CREATE OR REPLACE FUNCTION sn_notify_nodes() RETURNS trigger AS $$ "
+    "DECLARE node nodes; "
+    "BEGIN "
+    "IF (TG_OP = 'TRUNCATE') THEN "
+    "PERFORM pg_notify('" + DB_NOTIFY_CHANNEL + "', json_build_object('op', TG_OP, "
+    "'source', current_setting('application_name'))::text); "
+    "RETURN NULL; "
+    "END IF; "
+    "IF (TG_OP = 'DELETE') THEN node := OLD; ELSE node := NEW; END IF; "
+    "PERFORM pg_notify('" + DB_NOTIFY_CHANNEL + "', json_build_object('op', TG_OP, "
+    "'node_id', node.node_id, 'status', node.node_status, 'sev_mode', node.sev_mode, "
+    "'config_changed', TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND "
+    "OLD.node_config::text IS DISTINCT FROM NEW.node_config::text), "
+    "'config_hash', CASE WHEN TG_OP = 'INSERT' OR OLD.config_hash IS DISTINCT FROM NEW.config_hash "
+    "THEN node.config_hash END, "
+    "'source', current_setting('application_name'))::text); "
+    "RETURN NULL; "
+    "END; $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS sn_nodes_changed ON nodes",
+    "CREATE TRIGGER sn_nodes_changed AFTER INSERT OR UPDATE OR DELETE ON nodes "
+    "FOR EACH ROW EXECUTE PROCEDURE sn_notify_nodes()",
+    "DROP TRIGGER IF EXISTS sn_nodes_truncated ON nodes",
+    "CREATE TRIGGER sn_nodes_truncated AFTER TRUNCATE ON nodes "
+    "FOR EACH STATEMENT EXECUTE PROCEDURE sn_notify_nodes()",
+]
 
 # --------------------------------------------------------------------------------------------------
 
 
+def application_name():
+    """application_name function. This function returns the application name of the connections
+    of the current process. It is read when a connection opens, so every shard process has its own name.
+    """
+
+    return DB_APPLICATION_NAME + str(os.getpid())
+
+
+class Sn_connection(psycopg2.extensions.connection):
+    ''' The connection class of the pool. It remembers the statements
+        that are already prepared on the connection.
+    '''
+
+    def __init__(self,*args,**kwargs):
+        """__init__ function. This function opens the connection.
+        """
+
+        psycopg2.extensions.connection.__init__(self, *args, **kwargs)
+        self.prepared = set()
+
+
+class Sn_statements:
+    ''' Base class for the statement registry. It prepares the statements on the connections
+        and keeps timing counters for every statement.
+    '''
+
+    # Class functionality variables.
+    # A dictionary with the statement name as key and a [calls, total time, max time] list as value.
+    counters = {}
+    lock = threading.Lock()
+
+    def execute(self,conn,name,params=()):
+        """execute function. This function executes a prepared statement with bound parameters.
+        The statement is prepared first if the connection has not seen it before.
+        Args:
+            param1 (Sn_connection): The connection.
+            param2 (str): The statement name.
+            param3 (tuple): The statement parameters.
+        """
+
+        query, nparams = STATEMENTS[name]
+        cur = conn.cursor()
+        if(name not in conn.prepared):
+            self.prepare(cur, name, query)
+            conn.prepared.add(name)
+
+        start = time.time()
+        if(nparams == 0):
+            cur.execute("EXECUTE " + name)
+        else:
+            cur.execute("EXECUTE " + name + " (" + ", ".join(["%s"] * nparams) + ")", params)
+        self.count(name, time.time() - start)
+        return cur
+
+    def prepare(self,cur,name,query):
+        """prepare function. This function prepares a statement on the connection of the cursor.
+        A statement may already exist if the connection lost track of it after a rollback.
+        Args:
+            param1 (cursor): A cursor of the connection.
+            param2 (str): The statement name.
+            param3 (str): The query.
+        """
+
+        cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+        if(cur.fetchone() is None):
+            cur.execute("PREPARE " + name + " AS " + query)
+
+    def count(self,name,duration):
+        """count function. This function updates the timing counters of a statement.
+        Args:
+            param1 (str): The statement name.
+            param2 (float): The execution time in seconds.
+        """
+
+        with self.lock:
+            counter = self.counters.setdefault(name, [0, 0.0, 0.0])
+            counter[0] += 1
+            counter[1] += duration
+            counter[2] = max(counter[2], duration)
+
+    def get_stats(self):
+        """get_stats function. This function returns the timing counters of every statement.
+        """
+
+        with self.lock:
+            return dict((name, {'calls': c[0], 'total_time': c[1], 'max_time': c[2],
+                                'avg_time': c[1] / c[0]}) for name, c in self.counters.items())
+
+
+class Sn_breaker:
+    ''' Base class for the database circuit breaker. After a number of consecutive failures
+        the breaker opens and the database is left alone for a while. After that time one attempt
+        is allowed, a success closes the breaker and a failure opens it again.
+    '''
+
+    def __init__(self,failures=DB_BREAKER_FAILURES,reset_time=DB_BREAKER_RESET_TIME):
+        """__init__ function. This function initializes a closed breaker.
+        Args:
+            param1 (int): The number of consecutive failures that open the breaker.
+            param2 (float): The seconds that the breaker stays open.
+        """
+
+        self.max_failures = failures
+        self.reset_time = reset_time
+        self.failures = 0
+        self.opened = None
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """allow function. This function returns True if the database may be used.
+        """
+
+        with self.lock:
+            if(self.opened is None):
+                return True
+            if(time.time() - self.opened >= self.reset_time):
+                # Half open, one attempt is allowed and the timer starts again.
+                self.opened = time.time()
+                return True
+            return False
+
+    def is_open(self):
+        """is_open function. This function returns True if the breaker is open.
+        """
+
+        return self.opened is not None
+
+    def success(self):
+        """success function. This function closes the breaker after a successful database operation.
+        """
+
+        with self.lock:
+            if(self.opened is not None):
+                print("Database available again.")
+            self.failures = 0
+            self.opened = None
+
+    def failure(self):
+        """failure function. This function counts a failed database operation and opens the breaker
+        when the failures are too many.
+        """
+
+        with self.lock:
+            self.failures += 1
+            if(self.failures >= self.max_failures and self.opened is None):
+                print("Database unavailable, circuit breaker open.")
+                self.opened = time.time()
+                self.times_opened += 1
+
+
+class Sn_db_pool:
+    ''' Base class for the database connection pool. It keeps a number of long-lived
+        connections, checks idle connections before they are used and replaces the broken ones.
+    '''
+
+    def __init__(self,minconn=DB_POOL_MIN,maxconn=DB_POOL_MAX):
+        """__init__ function. This function opens the minimum number of connections.
+        Args:
+            param1 (int): The number of connections that are kept open.
+            param2 (int): The maximum number of open connections.
+        """
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        # A list of (connection, time of last use) pairs.
+        self.idle = []
+        # The number of open connections, idle or borrowed.
+        self.size = 0
+        self.cond = threading.Condition()
+
+        for i in range(minconn):
+            try:
+                self.idle.append((self.connect(), time.time()))
+                self.size += 1
+            except psycopg2.DatabaseError as exception:
+                # The rest of the connections will be opened on demand.
+                print(exception)
+                break
+
+    def connect(self):
+        """connect function. This function opens a new connection to the database.
+        """
+
+        #Connecting to database using the connect function from the "psycopg2" package.
+        # As parameters we use the database name, username and password as well as host address and port.
+        return psycopg2.connect(database=DB_NAME, user=DB_USERNAME, password=DB_PASSWORD,
+                                host=DB_HOST, port=DB_PORT, application_name=application_name(),
+                                connection_factory=Sn_connection)
+
+    def get(self):
+        """get function. This function borrows a connection from the pool. If every connection
+        is in use and the pool is full, the caller waits for a connection to be returned.
+        """
+
+        deadline = time.time() + DB_POOL_TIMEOUT
+        with self.cond:
+            while True:
+                if(self.idle):
+                    # The most recently used connection is preferred.
+                    conn, last_used = self.idle.pop()
+                    break
+                if(self.size < self.maxconn):
+                    # A place for a new connection is reserved.
+                    conn, last_used = None, None
+                    self.size += 1
+                    break
+                remaining = deadline - time.time()
+                if(remaining <= 0):
+                    raise psycopg2.OperationalError("No free database connection in the pool.")
+                self.cond.wait(remaining)
+
+        if(conn is not None and self.healthy(conn, last_used)):
+            return conn
+
+        # The connection is new or it was found broken, so a new one is opened.
+        if(conn is not None):
+            self.close(conn)
+        try:
+            return self.connect()
+        except psycopg2.DatabaseError:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+
+    def put(self,conn):
+        """put function. This function returns a borrowed connection to the pool.
+        Open transactions are rolled back and broken connections are dropped.
+        Args:
+            param1 (connection): The borrowed connection.
+        """
+
+        try:
+            if(not conn.closed and conn.get_transaction_status() !=
+                    psycopg2.extensions.TRANSACTION_STATUS_IDLE):
+                conn.rollback()
+                # Statements prepared in the rolled back transaction are checked again on their next use.
+                conn.prepared.clear()
+        except psycopg2.DatabaseError:
+            self.close(conn)
+
+        with self.cond:
+            if(conn.closed):
+                self.size -= 1
+            else:
+                self.idle.append((conn, time.time()))
+            self.cond.notify()
+
+    def healthy(self,conn,last_used):
+        """healthy function. This function checks if a connection can be used.
+        Connections that were used recently are trusted, the others are tested with a query.
+        Args:
+            param1 (connection): The connection to be checked.
+            param2 (float): The time of the last use.
+        """
+
+        if(conn.closed):
+            return False
+        if(time.time() - last_used < DB_HEALTH_CHECK_INTERVAL):
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.DatabaseError:
+            return False
+
+    def close(self,conn):
+        """close function. This function closes a connection and ignores any error.
+        Args:
+            param1 (connection): The connection to be closed.
+        """
+
+        try:
+            conn.close()
+        except psycopg2.DatabaseError:
+            pass
+
+    def discard(self,conn):
+        """discard function. This function rolls back a borrowed connection that cannot be used
+        any more, closes it and frees its place in the pool.
+        Args:
+            param1 (connection): The borrowed connection.
+        """
+
+        try:
+            conn.rollback()
+        except psycopg2.DatabaseError:
+            pass
+        self.close(conn)
+        self.put(conn)
+
+    def close_all(self):
+        """close_all function. This function closes every idle connection of the pool.
+        """
+
+        with self.cond:
+            for conn, last_used in self.idle:
+                self.close(conn)
+                self.size -= 1
+            self.idle = []
+
+
 class Sn_db:
     ''' Base class for the DB connection handler. It contains all 
         the necessary functions concerning the database functionalities.
@@ -34,213 +490,282 @@ class Sn_db:
 
     # This variable holds the connection object and is widely used across many functions.
     conn = ""
+    # The connection pool that is shared by all instances.
+    pool = None
+    # A lock for the creation of the pool.
+    pool_lock = threading.Lock()
+    # The statement registry that is shared by all instances.
+    statements = Sn_statements()
+    # The circuit breaker that is shared by all instances.
+    breaker = Sn_breaker()
+    # True after the schema changes are applied or rejected once by this process.
+    migrated = False
 
     def connect_db(self):
-        """connect_db function. This function is used for the database connection.
+        """connect_db function. This function is used to borrow a database connection from the pool.
+        The pool is created and the schema changes are applied on the first call.
         Args:
             param1 (Sn_db): Object instance
         """
 
-        #Connecting to database using the connect function from the "psycopg2" package.
-        # As parameters we use the database name, username and password as well as host address and port.
         try:
-            self.conn = psycopg2.connect(database=DB_NAME, user=DB_USERNAME,
-                                         password=DB_PASSWORD, host=DB_HOST, port=DB_PORT)
-
-        except psycopg2.DatabaseError, exception:
-            print exception
-
-
-
-    def upsert_node_db(self,data,datetime):
+            with Sn_db.pool_lock:
+                if(Sn_db.pool is None):
+                    Sn_db.pool = Sn_db_pool()
+            self.conn = Sn_db.pool.get()
+            if(not Sn_db.migrated):
+                with Sn_db.pool_lock:
+                    if(not Sn_db.migrated):
+                        try:
+                            self.migrate()
+                        except psycopg2.DatabaseError:
+                            # The connection is in an aborted transaction, it is not given to the caller.
+                            Sn_db.pool.discard(self.conn)
+                            self.conn = ""
+                            raise
+                        Sn_db.migrated = True
+
+        except psycopg2.DatabaseError as exception:
+            print(exception)
+
+
+
+    def upsert_node_db(self,data,datetime,config_hash=None,node_id=None):
         """upsert_db function. This function is used 
         to insert or update node configuration data inside the database.
         Args:
             param1 (conn): The connection instance
             param2 (str): The data to be inserted into the dataabase
             param3 (str): The current timestamp
+            param4 (str): The fingerprint of the configuration XML, or None
+            param5 (str): The node id, or None to extract it from the configuration
         """
 
-        # Node id extraction from the configuration file.
-        id_start = data.find('"ID": "')
-        id_end = data.find('"',id_start + len('"ID": "'))
-        node_id = data[id_start + len('"ID": "'):id_end]
-
-        #A cursor for handling the queries is created
-        cur = self.conn.cursor()
-        #The final insertion query
-        query = "INSERT INTO nodes (node_id, node_config, last_connected) VALUES " + \
-                "('" + node_id + "','" + data + "','" + datetime + "') " + \
-                "ON CONFLICT (node_id) DO UPDATE SET node_config = '" +\
-                data + "', last_connected = '" + datetime + "';"
+        if(node_id is None):
+            # Node id extraction from the configuration file.
+            node_id = self.find_node_id(data)
 
         #Query execution and database commit.
-        cur.execute(query)
+        self.statements.execute(self.conn, "upsert_node", (node_id, data, datetime, config_hash))
         self.conn.commit()
-        print "Record inserted successfully"
-        # After data insertion, the server saves all node configurations on a JSON file.
-        self.backup_node_config();
+        print("Record inserted successfully")
 
-    def insert_client_data(self,node_id,table,data):
-        """insert_client_data function. This function is used 
-        to insert data from a specific client to the database.
+    def migrate(self):
+        """migrate function. This function applies the schema changes of the MIGRATIONS list.
+        A change that the database rejects, for example a trigger that the user is not permitted
+        to create, is reported once and the server runs without it. If the database is unavailable
+        the error is raised and the changes are applied on the next connection.
         Args:
             param1 (conn): The connection instance
-            param2 (str): The node id.
-            param3 (str): The table name.
-            param4 (dict): The data to be inserted into the database.
         """
 
-        #A cursor for handling the queries is created
         cur = self.conn.cursor()
+        for migration in MIGRATIONS:
+            # Every change has a savepoint, a rejected change does not undo the others.
+            cur.execute("SAVEPOINT sn_migration")
+            try:
+                cur.execute(migration)
+            except psycopg2.OperationalError:
+                raise
+            except psycopg2.DatabaseError as exception:
+                cur.execute("ROLLBACK TO SAVEPOINT sn_migration")
+                print("Schema change not applied, the server runs without it: " + str(exception).strip())
+        self.conn.commit()
 
+    def get_config_hashes(self):
+        """get_config_hashes function. This function is used to get the
+        configuration fingerprint of every node.
+        Args:
+            param1 (conn): The connection instance
+        """
 
-        # Depending on the table name, the data is inserted accordingly
-        if(table == "temperature"):
-            # The insertion query
-            query = "INSERT INTO " + table + " (node_id, temperature, temperature_type, temperature_range)" \
-                    " VALUES ('" + node_id + "','" + data['temperature'] +\
-                    "','"+ data['temperature_type'] +"','" + data['temperature_range'] + "');"
-
-        elif(table == "humidity"):
-            # The insertion query
-            query = "INSERT INTO " + table + " (node_id, humidity, humidity_type, humidity_range)" \
-                    " VALUES ('" + node_id + "','" + data['humidity'] +\
-                    "','"+ data['humidity_type'] +"','" + data['humidity_range'] + "');"
-
-        elif(table == "flame"):
-            # The insertion query
-            query = "INSERT INTO " + table + " (node_id, flame, flame_type, flame_range)" \
-                    " VALUES ('" + node_id + "','" + data['flame'] +\
-                    "','"+ data['flame_type'] +"','" + data['flame_range'] + "');"
-
+        # Query execution.
+        cur = self.statements.execute(self.conn, "get_config_hashes")
+        # The function returns a list of (node id, fingerprint) rows.
+        return cur.fetchall()
 
-        #Query execution and database commit.
-        cur.execute(query)
-        self.conn.commit()
-        #print "Record inserted successfully"
+    def find_node_id(self,data):
+        """find_node_id function. This function extracts the node id from
+        a node configuration in JSON form.
+        Args:
+            param1 (str): The node configuration.
+        """
 
+        id_start = data.find('"ID": "')
+        id_end = data.find('"',id_start + len('"ID": "'))
+        return data[id_start + len('"ID": "'):id_end]
 
-    def get_node_status(self,node_id):
-        """get_node_status function. This function is used 
-        to get the status of a selected node.
+    def copy_client_data(self,batch):
+        """copy_client_data function. This function is used to insert many rows
+        of client data at once. Every table is loaded with a single COPY and
+        all tables are committed in one transaction.
         Args:
             param1 (conn): The connection instance
-            param2 (str): The selected node.
-
+            param2 (dict): A dictionary with the table name as key and a list of rows as value.
+            A row is a sequence or a reading with the values in the order of the table columns,
+            the rows of an older spool may have no time or a type and a range after the value.
         """
 
         #A cursor for handling the queries is created
         cur = self.conn.cursor()
 
-        # The selection query
-        query = "SELECT node_status FROM nodes WHERE node_id = '" + node_id + "';"
-        # Query execution.
-        cur.execute(query)
-
-        row = cur.fetchone()
-        # The function returns the status of the selected node.
-        return row[0]
+        specs = list(batch.get(SENSOR_SPEC_TABLE, []))
+        for table in batch:
+            if(table == SENSOR_SPEC_TABLE):
+                continue
+            # The rows are written in the COPY text format, one line per row.
+            rows = StringIO()
+            for row in batch[table]:
+                if(isinstance(row, list) and len(row) == 4):
+                    # A row of an older spool has the type and the range after the value.
+                    specs.append((row[0], table, row[2], row[3]))
+                    row = row[:2]
+                if(isinstance(row, list) and len(row) == 2):
+                    # A row of an older spool has no time, the time of the replay is the nearest known.
+                    row = [row[0], row[1], utc_timestamp(time.time())]
+                rows.write("\t".join([self.copy_escape(value) for value in row]) + "\n")
+            rows.seek(0)
+            cur.copy_from(rows, table, columns=CLIENT_DATA_COLUMNS[table])
+        if(specs):
+            self.statements.execute(self.conn, "upsert_sensor_specs", self.spec_params(specs))
+
+        # One commit for the whole batch.
+        self.conn.commit()
 
+    def spec_params(self,specs):
+        """spec_params function. This function returns the parameters of the upsert_sensor_specs statement:
+        a list of node ids, sensor data tables, types and ranges. The last row of a sensor is kept.
+        Args:
+            param1 (list): The (node id, sensor data table, type, range) rows.
+        """
 
-    def get_active_nodes_count(self):
-        """get_active_nodes_count function. This function is used 
-        to get the number of the active nodes.
+        latest = dict(((node_id, sensor), (data_type, data_range))
+                      for node_id, sensor, data_type, data_range in specs)
+        params = ([], [], [], [])
+        for (node_id, sensor), (data_type, data_range) in latest.items():
+            params[0].append(node_id)
+            params[1].append(sensor)
+            params[2].append(data_type)
+            params[3].append(data_range)
+        return params
+
+    def copy_escape(self,value):
+        """copy_escape function. This function escapes a value for the COPY text format.
         Args:
-            param1 (conn): The connection instance
+            param1 (str): The value, numbers are written as they are.
         """
-        #A cursor for handling the queries is created
-        cur = self.conn.cursor()
 
-        # The selection query
-        query = "SELECT COUNT (*) FROM nodes WHERE node_status = 'active';"
+        if(isinstance(value, float)):
+            # repr keeps every digit of the value.
+            return repr(value)
+        if(isinstance(value, numbers.Number)):
+            return str(value)
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
 
-        # Query execution.
-        cur.execute(query)
+    def upsert_rollups(self,rollups):
+        """upsert_rollups function. This function is used to write the windows
+        of the rollup tables. All tables are committed in one transaction.
+        Args:
+            param1 (conn): The connection instance
+            param2 (dict): A dictionary with the rollup table as key and the parameters
+                           of its upsert statement as value.
+        """
 
-        row = cur.fetchone()
-        # the result is parsed to integer before return.
-        return int(row[0])
+        for table in rollups:
+            self.statements.execute(self.conn, "upsert_" + table, tuple(rollups[table]))
+        #Database commit.
+        self.conn.commit()
 
-    def get_node_sev_mode(self,node_id):
-        """get_node_sev_mode function. This function is used 
-        to get the severity mode of a specific node.
+    def get_sensor_periods(self,node_id,sensor,start,end,resolution):
+        """get_sensor_periods function. This function is used to get the number of readings, the minimum,
+        the average and the maximum value of a sensor of a node in every period of a time range.
+        The coarsest rollup table with windows that fit in the periods is read.
         Args:
             param1 (conn): The connection instance
             param2 (str): The ID of the node
-
+            param3 (str): The sensor data table
+            param4 (datetime): The start of the time range
+            param5 (datetime): The end of the time range
+            param6 (int): The length of a period in seconds
         """
 
-        #A cursor for handling the queries is created
-        cur = self.conn.cursor()
+        if(sensor not in CLIENT_DATA_COLUMNS):
+            raise ValueError("Unknown sensor data table " + sensor)
+        # Without a rollup table that fits, the readings are read.
+        name = "get_periods_" + sensor
+        for seconds, table in ROLLUP_TABLES:
+            if(resolution % seconds == 0):
+                name = "get_periods_" + sensor + "_" + table
 
-        # The selection query
-        query = "SELECT sev_mode FROM nodes WHERE node_id = '" + node_id + "';"
         # Query execution.
-        cur.execute(query)
+        cur = self.statements.execute(self.conn, name, (node_id, start, end, int(resolution)))
+        # The function returns a list of (start of the period, readings, min, avg, max) rows.
+        return cur.fetchall()
 
-        row = cur.fetchone()
-        # The function returns the severity mode of the selected node.
-        return row[0]
 
-    def update_node_column(self,column, data, node_id):
-        """update_node_column function. This function is used 
-        to update a single column of the selected node.
+    def get_node_states(self,node_ids=None):
+        """get_node_states function. This function is used to get the status and
+        the severity mode of every node, or of a list of nodes.
         Args:
             param1 (conn): The connection instance
-            param2 (str): The data to be updated on the database
-            param3 (str): The ID of the node
+            param2 (list): The IDs of the nodes, or None for every node
+
         """
 
-        #A cursor for handling the queries is created
-        cur = self.conn.cursor()
-        #The final update query
-        query = "UPDATE nodes SET " + column + "='" + data + \
-                "' WHERE node_id = '" + node_id + "';"
+        # Query execution.
+        if(node_ids is None):
+            cur = self.statements.execute(self.conn, "get_node_states")
+        else:
+            cur = self.statements.execute(self.conn, "get_node_states_by_id", (list(node_ids),))
+        # The function returns a list of (node id, status, severity mode) rows.
+        return cur.fetchall()
+
+    def update_nodes(self,params):
+        """update_nodes function. This function is used to update
+        the columns of many nodes with a single statement.
+        Args:
+            param1 (conn): The connection instance
+            param2 (tuple): A list of node ids and a list of sev_mode, last_connected and
+                            node_status values, None for a column that does not change
+        """
 
         #Query execution and database commit.
-        cur.execute(query)
+        self.statements.execute(self.conn, "update_nodes", tuple(params))
         self.conn.commit()
-        print "Node updated successfully"
 
 
-
-    def backup_node_config(self):
-        """backup_table function. This function is used 
-        to retrieve JSON data from the database and save tha data to a file
+    def get_node_config(self,node_id):
+        """get_node_config function. This function is used to get the configuration of a node.
         Args:
             param1 (conn): The connection instance
+            param2 (str): The ID of the node
         """
-        # A cursor for handling the queries is created
-        cur = self.conn.cursor()
-
-        # The selection query
-        query = "SELECT cast(node_config as text) FROM nodes;"
 
         # Query execution.
-        cur.execute(query)
-        rows = cur.fetchall()
+        cur = self.statements.execute(self.conn, "get_node_config", (node_id,))
 
-        # File operations. Fetched data must be stored with the correct format.
-        file = open("nodes_config.json","w")
-        file_str = '{"nodes":['
+        row = cur.fetchone()
+        # The function returns the configuration in JSON form, or None if the node does not exist.
+        return row[0] if row is not None else None
 
-        for row in rows:
-            # Every new table line fetched from the server, is added to the string.
-            file_str = file_str + (row[0]) + ",\n"
+    def get_node_configs(self):
+        """get_node_configs function. This function is used to get the configuration of every node.
+        Args:
+            param1 (conn): The connection instance
+        """
 
-        # Some final string formating.
-        file_str = file_str[:-2] + "]}"
-        # The string content is being written on the JSON file.
-        file.write(file_str)
-        file.close()
-        print("Configuration file saved.")
+        # Query execution.
+        cur = self.statements.execute(self.conn, "get_node_configs")
+        # The function returns a list of (node id, configuration in JSON form) rows.
+        return cur.fetchall()
 
 
     def disconnect_db(self):
-        """disconnect_db function. This function is used for database disconnect.
+        """disconnect_db function. This function returns the connection to the pool.
         Args:
             param1 (DbHandler): Object instance
         """
 
-        self.conn.close()
+        if(self.conn != ""):
+            Sn_db.pool.put(self.conn)
+            self.conn = ""
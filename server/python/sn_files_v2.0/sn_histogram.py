@@ -0,0 +1,85 @@
+"""
+    File name: sn_histogram.py
+    Author: Georgios Vrettos
+    Date created: 11/5/2018
+    Date last modified: 11/5/2018
+    Python Version: 2.7
+
+In this module, a latency histogram is constructed. Every measured duration is counted
+in the first bucket that it fits, so the distribution of the durations is kept
+with a fixed amount of memory.
+
+
+Todo :
+	*
+"""
+
+import bisect
+import threading
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The default upper bounds of the buckets in seconds, the last bucket has no upper bound.
+HISTOGRAM_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_histogram:
+    ''' Base class for the latency histogram. It contains the bucket bounds
+        and the number of durations in every bucket.
+    '''
+
+    def __init__(self,buckets=HISTOGRAM_BUCKETS):
+        """__init__ function. This function creates an empty histogram.
+        Args:
+            param1 (tuple): The upper bounds of the buckets in seconds, in ascending order.
+        """
+
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+
+    def observe(self,duration):
+        """observe function. This function counts a duration.
+        Args:
+            param1 (float): The duration in seconds.
+        """
+
+        with self.lock:
+            self.counts[bisect.bisect_left(self.bounds, duration)] += 1
+            self.count += 1
+            self.total += duration
+            self.max = max(self.max, duration)
+
+
+    def quantile(self,q):
+        """quantile function. This function returns the upper bound of the bucket
+        that contains a quantile. It is called with the lock held.
+        Args:
+            param1 (float): The quantile, between 0 and 1.
+        """
+
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if(seen >= rank and count > 0):
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return 0.0
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the histogram in a dictionary.
+        The buckets are (upper bound, count) pairs, the last bound is None.
+        """
+
+        with self.lock:
+            return {'count': self.count, 'avg': self.total / self.count if self.count > 0 else 0.0,
+                    'max': self.max, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+                    'buckets': list(zip(self.bounds + (None,), self.counts))}
@@ -0,0 +1,192 @@
+"""
+    File name: sn_lanes.py
+    Author: Georgios Vrettos
+    Date created: 2/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the priority lanes of the incoming messages are constructed. Every message
+is put in the lane of its kind (control, alert or routine) and the lanes are drained in priority
+order, so control and alert messages never wait behind a burst of routine sensor data.
+The time that the messages spend in every lane is measured.
+When the lanes fill up to the high watermark, or a lane reaches its size, the accepting event is cleared
+and the MQTT network loop stops reading. It is set again when the lanes drain to the low watermark
+and every lane is below its size. A message that is received is never rejected and the network loop never
+waits, a lane may pass its size by the few messages that the network loop read before it stopped.
+On shutdown the lanes are closed, the messages that are left are still taken and then the reader stops.
+
+
+Todo :
+	*
+"""
+
+import collections
+import threading
+import time
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The lanes in priority order.
+LANES = ("control", "alert", "routine")
+# The number of messages in every lane that stops reading from the network.
+LANE_SIZES = {"control": 1000, "alert": 5000, "routine": 10000}
+# In weighted mode, the number of messages taken from every lane in each round.
+LANE_WEIGHTS = {"control": 8, "alert": 4, "routine": 1}
+# The number of messages in all lanes that stops reading from the network...
+HIGH_WATERMARK = 8000
+# ...and the number of messages that starts it again.
+LOW_WATERMARK = 2000
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_lanes:
+    ''' Base class for the priority lanes. It contains a bounded FIFO queue for every lane
+        and the wait time counters of every lane.
+    '''
+
+    def __init__(self,weighted=False):
+        """__init__ function. This function creates the empty lanes.
+        Args:
+            param1 (bool): If True the lanes are drained by weight, otherwise by strict priority.
+        """
+
+        self.weighted = weighted
+        self.cond = threading.Condition()
+        # Every lane holds (arrival time, message) pairs.
+        self.lanes = dict((lane, collections.deque()) for lane in LANES)
+        self.total = 0
+        # True after close(), no message is added any more.
+        self.closed = False
+
+        # Lane counters, a [messages, total wait, max wait] list for every lane.
+        self.counters = dict((lane, [0, 0.0, 0.0]) for lane in LANES)
+        # The number of times that every lane reached its size and stopped the reading.
+        self.full = dict((lane, 0) for lane in LANES)
+
+        # This event is set while new messages are welcome.
+        self.accepting = threading.Event()
+        self.accepting.set()
+        # Throttle counters.
+        self.throttle_events = 0
+        self.throttle_start = None
+        self.throttled_time = 0.0
+
+
+    def put(self,lane,msg):
+        """put function. This function adds a message to the end of a lane and returns True.
+        The message is never rejected while the lanes are open, the caller never waits.
+        If the lanes are closed False is returned.
+        Args:
+            param1 (str): The lane name.
+            param2 (obj): The message.
+        """
+
+        with self.cond:
+            if(self.closed):
+                return False
+            self.lanes[lane].append((time.time(), msg))
+            self.total += 1
+            full = len(self.lanes[lane]) >= LANE_SIZES[lane]
+            if(full and self.accepting.is_set()):
+                self.full[lane] += 1
+            if((full or self.total >= HIGH_WATERMARK) and self.accepting.is_set()):
+                # The high watermark or the size of the lane is reached, the network loop must stop reading.
+                self.accepting.clear()
+                self.throttle_events += 1
+                self.throttle_start = time.time()
+            self.cond.notify_all()
+            return True
+
+
+    def get_batch(self,max_size):
+        """get_batch function. This function waits until at least one message is available and
+        returns up to max_size messages, higher priority lanes first. An empty batch is returned
+        when the lanes are closed and every message is taken.
+        Args:
+            param1 (int): The maximum number of messages.
+        """
+
+        with self.cond:
+            while(self.total == 0):
+                if(self.closed):
+                    return []
+                self.cond.wait()
+
+            batch = []
+            now = time.time()
+            if(self.weighted):
+                # Every round takes up to the weight of each lane, until the batch is full or the lanes are empty.
+                while(self.total > 0 and len(batch) < max_size):
+                    for lane in LANES:
+                        self.take(lane, min(LANE_WEIGHTS[lane], max_size - len(batch)), batch, now)
+            else:
+                for lane in LANES:
+                    self.take(lane, max_size - len(batch), batch, now)
+
+            if(self.total <= LOW_WATERMARK and not self.accepting.is_set() and
+                    not [lane for lane in LANES if len(self.lanes[lane]) >= LANE_SIZES[lane]]):
+                # The lanes drained to the low watermark, the network loop may read again.
+                self.throttled_time += now - self.throttle_start
+                self.accepting.set()
+            self.cond.notify_all()
+            return batch
+
+
+    def take(self,lane,count,batch,now):
+        """take function. This function moves up to count messages from the start of a lane
+        to the batch and counts their wait time. It is called with the lock held.
+        Args:
+            param1 (str): The lane name.
+            param2 (int): The maximum number of messages.
+            param3 (list): The batch.
+            param4 (float): The current time.
+        """
+
+        queue = self.lanes[lane]
+        counter = self.counters[lane]
+        while(count > 0 and queue):
+            arrived, msg = queue.popleft()
+            batch.append(msg)
+            wait = now - arrived
+            counter[0] += 1
+            counter[1] += wait
+            counter[2] = max(counter[2], wait)
+            self.total -= 1
+            count -= 1
+
+
+    def close(self):
+        """close function. This function closes the lanes. The messages that are in the lanes
+        can still be taken, the reader gets an empty batch after the last one.
+        """
+
+        with self.cond:
+            self.closed = True
+            self.accepting.set()
+            self.cond.notify_all()
+
+
+    def qsize(self):
+        """qsize function. This function returns the number of messages in all lanes.
+        """
+
+        with self.cond:
+            return self.total
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the depth, the wait time and the full counters of every lane
+        and the throttle counters.
+        """
+
+        with self.cond:
+            stats = dict((lane, {'depth': len(self.lanes[lane]), 'messages': c[0],
+                                 'avg_wait': c[1] / c[0] if c[0] > 0 else 0.0, 'max_wait': c[2],
+                                 'full': self.full[lane]})
+                         for lane, c in self.counters.items())
+            stats['throttled'] = not self.accepting.is_set()
+            stats['throttle_events'] = self.throttle_events
+            stats['throttled_time'] = self.throttled_time
+            return stats
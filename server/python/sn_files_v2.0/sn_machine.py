@@ -2,7 +2,7 @@
     File name: sn_machine.py
     Author: Georgios Vrettos
     Date created: 11/12/2017
-    Date last modified: 14/12/2017
+    Date last modified: 6/5/2018
     Python Version: 2.7
 
 
@@ -26,15 +26,23 @@ class ServerMachine(object):
     This class describes our main server device as a state machine.
     """
 
-    def __init__(self):
+    def __init__(self,runtime="threads",shards=0):
         """ __init__ function. This is the constructor of the state machine class.
             The server machine starts with the Active mode enabled my default.
+        Args:
+            param1 (str): The runtime of the Active mode, "threads" or "asyncio".
+            param2 (int): The number of shard processes of the threads runtime, 0 for none.
         """
 
         # The machine enters Active mode on startup.
         # This is done by setting the state object as an Active one.
 
-        self.state = ActiveMode()
+        if(runtime == "asyncio"):
+            # The asyncio runtime is imported only when it is used, it needs Python 3.
+            from sn_async import AsyncActiveMode
+            self.state = AsyncActiveMode()
+        else:
+            self.state = ActiveMode(shards)
 
     def on_event(self,event):
         """
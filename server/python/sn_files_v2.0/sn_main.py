@@ -2,22 +2,38 @@
     File name: sn_main.py
     Author: Georgios Vrettos
     Date created: 11/12/2017
-    Date last modified: 14/12/2017
+    Date last modified: 20/5/2018
     Python Version: 2.7
 
 
 Example:
 	$ python sn_main.py
+	$ python3 sn_main.py --runtime asyncio
+	$ python sn_main.py --shards 4
 
 Todo :
 
 """
+import argparse
 from sn_machine import ServerMachine
 
 # --------------------------------------------------------------------------------------------------
 
-# The instance of the state machine.
-machine = ServerMachine()
+# The startup options.
+parser = argparse.ArgumentParser(description="Server node of the MQTT sensor network.")
+parser.add_argument("--runtime", choices=["threads", "asyncio"], default="threads",
+                    help="threads (default) or asyncio, the asyncio runtime needs Python 3.7+")
+parser.add_argument("--shards", type=int, default=0,
+                    help="the number of processes that handle the messages of the threads runtime, "
+                         "sharded by node id (default 0, every message is handled in one process)")
+
+
+if __name__ == "__main__":
+    # The shard processes import this module again on the platforms that do not fork.
+    args = parser.parse_args()
+
+    # The instance of the state machine.
+    machine = ServerMachine(args.runtime, args.shards)
 
 
 
@@ -2,7 +2,7 @@
     File name: sn_mqtt.py
     Author: Georgios Vrettos
     Date created: 11/12/2017
-    Date last modified: 19/4/2018
+    Date last modified: 20/5/2018
     Python Version: 2.7
 
 In this module, functions from the package "paho-mqtt" are used. 
@@ -18,6 +18,8 @@ import paho.mqtt.client as mqtt
 import time
 import ssl
 from sn_thread import Sn_thread
+from sn_lanes import Sn_lanes
+from sn_record import Sn_message
 
 # Global variables
 # --------------------------------------------------------------------------------------------------
@@ -26,6 +28,12 @@ BROKER_USERNAME = "username"
 BROKER_PASSWORD = "password"
 BROKER_IP = "ip"
 BROKER_PORT = "8883"
+# Seconds between two checks of the network while reading is paused.
+THROTTLE_CHECK_INTERVAL = 0.5
+# Seconds to wait before a reconnection attempt.
+RECONNECT_DELAY = 1
+# The maximum number of topic strings that are shared by the received messages.
+TOPIC_CACHE_SIZE = 10000
 
 # --------------------------------------------------------------------------------------------------
 
@@ -34,8 +42,15 @@ class SnMqtt(mqtt.Client):
     'Base class for the MQTT client (SN)'
 
     # Class functionality variables.
-    # A message buffer
-    buffer = []
+    # A bounded message buffer with one lane per message priority. The network loop puts
+    # messages in it and the buffer thread of the server blocks on it until a message arrives.
+    buffer = Sn_lanes()
+    # The nodes that reported danger mode, their readings use the alert lane.
+    danger_nodes = set()
+    # The topic strings of the received messages, every message of a topic shares the same string.
+    topics = {}
+    # The (topic, qos) pairs that the client subscribes to on every connection.
+    subscriptions = []
 
 
 
@@ -50,6 +65,9 @@ class SnMqtt(mqtt.Client):
         """
 
         print('SN connected. Return code=' + str(rc))
+        if(rc == 0 and self.subscriptions):
+            # A new session starts without subscriptions, so the topics are subscribed on every connection.
+            self.subscribe(self.subscriptions)
 
     def on_disconnect(self,mqttc, userdata, rc):
         """on_disconnect callback function. This function is executed
@@ -71,8 +89,42 @@ class SnMqtt(mqtt.Client):
             param3 (MQTTMessage): An instance of MQTTMessage, contains topic,payload,qos,retain
         """
 
-        # In the event of a message arrival, the message is added to the buffer
-        self.buffer.append(msg)
+        # In the event of a message arrival, the message is added to the lane of its kind.
+        # The message is acknowledged already, so it is never dropped. A full lane stops the reading instead.
+        record = self.make_record(msg)
+        self.buffer.put(self.find_lane(record.topic), record)
+
+
+    def make_record(self,msg):
+        """make_record function. This function returns a compact record of a message.
+        Only the topic, the payload and the arrival time are kept, the MQTT message is released.
+        Args:
+            param1 (MQTTMessage): The received message.
+        """
+
+        topic = msg.topic
+        if(len(self.topics) >= TOPIC_CACHE_SIZE):
+            self.topics.clear()
+        return Sn_message(self.topics.setdefault(topic, topic), msg.payload, time.time())
+
+
+    def find_lane(self,topic):
+        """find_lane function. This function returns the priority lane of a message.
+        Control messages come first, then flame readings and readings of nodes
+        in danger mode, then every other reading.
+        Args:
+            param1 (str): The message topic.
+        """
+
+        if(topic.rfind("control")!=-1):
+            return "control"
+        if(topic.rfind("Flame")!=-1):
+            return "alert"
+        # The node id is the second word of the topic.
+        start = topic.find('/') + 1
+        if(topic[start:topic.find('/', start)] in self.danger_nodes):
+            return "alert"
+        return "routine"
 
 
 
@@ -139,16 +191,31 @@ class SnMqtt(mqtt.Client):
     def mqtt_loop(self):
         """mqtt_loop function. This function is used for the MQTT network loop.
         The incoming message is saved from the broker's buffer after the execution of
-        a loop function.
+        a loop function. The function blocks, the loop waits on the socket while there is
+        no traffic and it reconnects if the connection is lost.
+        While the message buffer is above its high watermark the socket is not read, so TCP and
+        the broker hold the other messages back. Outgoing messages and keepalive pings are still handled.
+        If the connection is lost while reading is paused, the client reconnects after the buffer drains,
+        the acknowledgement of the broker could not be read before.
         Args:
             param1 (Client): The client instance.
         """
 
-        # Starting the loop
-        self.loop_start()
-
-
-
-
-
-
+        while True:
+            if(self.buffer.accepting.is_set()):
+                rc = self.loop(timeout=1.0)
+            else:
+                # Reading stops until the buffer drains to the low watermark.
+                self.buffer.accepting.wait(THROTTLE_CHECK_INTERVAL)
+                rc = self.loop_write()
+                if(rc == mqtt.MQTT_ERR_SUCCESS):
+                    rc = self.loop_misc()
+
+            if(rc != mqtt.MQTT_ERR_SUCCESS):
+                # The connection is lost, a reconnection is attempted when reading is allowed.
+                time.sleep(RECONNECT_DELAY)
+                self.buffer.accepting.wait()
+                try:
+                    self.reconnect()
+                except Exception:
+                    print("Reconnection failed.")
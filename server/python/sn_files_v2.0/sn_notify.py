@@ -0,0 +1,201 @@
+"""
+    File name: sn_notify.py
+    Author: Georgios Vrettos
+    Date created: 17/5/2018
+    Date last modified: 17/5/2018
+    Python Version: 2.7
+
+In this module, the listener of the changes of the nodes table is constructed. A trigger of the
+nodes table announces every change on the DB_NOTIFY_CHANNEL channel. The listener keeps its own
+connection, it waits for the notifications and it gives every change that was made by another
+process, another server or an operator to a callback, so the registry, the fingerprint cache and
+the snapshot stay correct without polling. The changes of this process are skipped by their
+application name, the changes of the shard processes of the same server are not.
+Notifications are lost while the connection is down, so after a reconnection the callback
+for a full reload is called.
+
+
+Todo :
+	*
+"""
+
+import json
+import select
+import time
+import psycopg2
+import psycopg2.extensions
+import sn_db
+from sn_thread import Sn_thread
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# Seconds between two checks of the connection and of the stop request.
+NOTIFY_POLL_INTERVAL = 1.0
+# Seconds to wait before a new connection attempt.
+NOTIFY_RECONNECT_DELAY = 5.0
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_change(payload):
+    """read_change function. This function returns the change of a notification as a dictionary,
+    or None if the change was made by this process or the notification cannot be read.
+    Args:
+        param1 (str): The notification payload.
+    """
+
+    try:
+        change = json.loads(payload)
+    except ValueError:
+        print("A notification of the nodes table cannot be read.")
+        return None
+    if(change.get('source') == sn_db.application_name()):
+        return None
+    return change
+
+
+class Sn_node_listener:
+    ''' Base class for the listener. It contains the notification connection
+        and the thread that waits for the notifications.
+    '''
+
+    def __init__(self,on_change,on_reload):
+        """__init__ function. This function opens the connection and starts listening.
+        The notifications wait on the connection until start() is called.
+        Args:
+            param1 (function): The callback of a change, it takes the change dictionary.
+            param2 (function): The callback of a full reload, it takes no arguments.
+        """
+
+        self.on_change = on_change
+        self.on_reload = on_reload
+        self.conn = None
+        self.running = True
+
+        # Listener counters.
+        self.received = 0
+        self.skipped = 0
+        self.reloads = 0
+
+        try:
+            self.connect()
+        except psycopg2.DatabaseError as exception:
+            # The thread connects later and reloads everything.
+            print(exception)
+        self.thread = Sn_thread(id="node_listener", callback=self.run)
+        self.thread.daemon = True
+
+
+    def connect(self):
+        """connect function. This function opens the notification connection and listens on the channel.
+        """
+
+        self.conn = psycopg2.connect(database=sn_db.DB_NAME, user=sn_db.DB_USERNAME,
+                                     password=sn_db.DB_PASSWORD, host=sn_db.DB_HOST, port=sn_db.DB_PORT,
+                                     application_name=sn_db.application_name())
+        # A notification is delivered only outside a transaction.
+        self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        self.conn.cursor().execute("LISTEN " + sn_db.DB_NOTIFY_CHANNEL)
+
+
+    def start(self):
+        """start function. This function starts the listener thread.
+        """
+
+        self.thread.start()
+
+
+    def run(self,id,data):
+        """run function. This is the loop of the listener thread. It waits for notifications
+        and it opens the connection again when it is lost.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(self.running):
+            if(self.conn is None):
+                try:
+                    self.connect()
+                except psycopg2.DatabaseError as exception:
+                    print(exception)
+                    self.conn = None
+                    time.sleep(NOTIFY_RECONNECT_DELAY)
+                    continue
+                # The changes of the time without a connection are unknown.
+                self.reload()
+
+            try:
+                if(select.select([self.conn], [], [], NOTIFY_POLL_INTERVAL)[0]):
+                    self.conn.poll()
+                    while(self.conn.notifies):
+                        self.dispatch(self.conn.notifies.pop(0).payload)
+            except (psycopg2.DatabaseError, select.error, ValueError) as exception:
+                print("Notification connection lost: " + str(exception))
+                self.disconnect()
+
+        self.disconnect()
+
+
+    def dispatch(self,payload):
+        """dispatch function. This function gives a change to the callback.
+        Args:
+            param1 (str): The notification payload.
+        """
+
+        self.received += 1
+        change = read_change(payload)
+        if(change is None):
+            self.skipped += 1
+            return
+        try:
+            if(change['op'] == "TRUNCATE"):
+                self.reload()
+            else:
+                self.on_change(change)
+        except Exception as exception:
+            # A change that cannot be applied must not stop the listener.
+            print(exception)
+
+
+    def reload(self):
+        """reload function. This function calls the callback of a full reload.
+        """
+
+        self.reloads += 1
+        try:
+            self.on_reload()
+        except Exception as exception:
+            print(exception)
+
+
+    def disconnect(self):
+        """disconnect function. This function closes the notification connection.
+        """
+
+        if(self.conn is not None):
+            try:
+                self.conn.close()
+            except psycopg2.Error:
+                pass
+            self.conn = None
+
+
+    def close(self):
+        """close function. This function stops the listener thread and closes the connection.
+        """
+
+        self.running = False
+        if(self.thread.is_alive()):
+            self.thread.join()
+        else:
+            self.disconnect()
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the listener counters in a dictionary.
+        """
+
+        return {'connected': self.conn is not None, 'received': self.received,
+                'skipped': self.skipped, 'reloads': self.reloads}
@@ -0,0 +1,132 @@
+"""
+    File name: sn_pool.py
+    Author: Georgios Vrettos
+    Date created: 25/4/2018
+    Date last modified: 25/4/2018
+    Python Version: 2.7
+
+In this module, a fixed size pool of worker threads is constructed. The workers are
+Sn_thread objects that take jobs from a bounded queue, so the number of threads stays
+the same no matter how many messages arrive.
+
+
+Todo :
+	*
+"""
+
+import threading
+import time
+import traceback
+from sn_thread import Sn_thread
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The default number of worker threads.
+POOL_WORKERS = 4
+# The default maximum number of jobs that wait for a free worker.
+POOL_QUEUE_SIZE = 5000
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_pool:
+    ''' Base class for the worker pool. It contains the job queue, the worker threads
+        and the counters that describe the pool load.
+    '''
+
+    def __init__(self,name="pool",workers=POOL_WORKERS,queue_size=POOL_QUEUE_SIZE):
+        """__init__ function. This function creates the job queue and starts the workers.
+        Args:
+            param1 (str): The name of the pool, it is used for the thread ids.
+            param2 (int): The number of worker threads.
+            param3 (int): The maximum number of waiting jobs.
+        """
+
+        self.name = name
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+        # Pool counters.
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy = 0
+        self.busy_time = 0.0
+
+        self.workers = []
+        for i in range(workers):
+            worker = Sn_thread(id=name + "_" + str(i), callback=self.work)
+            # Workers must not keep the program alive on exit.
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+
+    def submit(self,callback,*args):
+        """submit function. This function adds a job to the queue. If the queue is full
+        the caller waits until a worker frees a place.
+        Args:
+            param1 (function): The function to be executed by a worker.
+            param2 (obj): The arguments of the function.
+        """
+
+        self.jobs.put((callback, args))
+        with self.lock:
+            self.submitted += 1
+
+
+    def work(self,id,data):
+        """work function. This is the loop of every worker thread. The worker sleeps
+        until a job is available and executes it.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            callback, args = self.jobs.get()
+            start = time.time()
+            with self.lock:
+                self.busy += 1
+            try:
+                callback(*args)
+                failed = False
+            except Exception:
+                # A failing job must not stop the worker.
+                traceback.print_exc()
+                failed = True
+            with self.lock:
+                self.busy -= 1
+                self.busy_time += time.time() - start
+                if(failed):
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            self.jobs.task_done()
+
+
+    def join(self):
+        """join function. This function waits until every submitted job is finished.
+        """
+
+        self.jobs.join()
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the pool counters in a dictionary.
+        Utilisation is the share of the elapsed time that the workers spent on jobs.
+        """
+
+        with self.lock:
+            elapsed = (time.time() - self.started) * len(self.workers)
+            return {'workers': len(self.workers), 'queue_depth': self.jobs.qsize(),
+                    'busy_workers': self.busy, 'submitted': self.submitted,
+                    'completed': self.completed, 'failed': self.failed,
+                    'utilisation': self.busy_time / elapsed if elapsed > 0 else 0.0}
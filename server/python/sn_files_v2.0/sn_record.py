@@ -0,0 +1,91 @@
+"""
+    File name: sn_record.py
+    Author: Georgios Vrettos
+    Date created: 10/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the compact records of the ingest are constructed. A received message keeps
+only its topic, payload and arrival time, instead of the whole MQTT message. A sensor reading
+is created once, when the payload is decoded, and the same object is batched and written
+to the database. Both classes use __slots__, so the objects have no attribute dictionary.
+The row of a reading carries the time it was received as a UTC timestamp, so a reading that is
+spooled and written later keeps its own time.
+
+
+Todo :
+	*
+"""
+import datetime
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The start of the epoch, the receive times are counted from it.
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def utc_timestamp(seconds):
+    """utc_timestamp function. This function returns a time in seconds since the epoch
+    as a UTC timestamp in text form, as it is written to the time column of the sensor data tables.
+    Args:
+        param1 (float): The time in seconds since the epoch.
+    """
+
+    return (EPOCH + datetime.timedelta(seconds=seconds)).isoformat(" ")
+
+
+class Sn_message(object):
+    ''' A received message. It has the topic and payload attributes
+        of an MQTT message and the time it was received.
+    '''
+
+    __slots__ = ("topic", "payload", "received")
+
+    def __init__(self,topic,payload,received):
+        """__init__ function. This function creates the message.
+        Args:
+            param1 (str): The message topic.
+            param2 (bytes): The message payload.
+            param3 (float): The time that the message was received.
+        """
+
+        self.topic = topic
+        self.payload = payload
+        self.received = received
+
+
+class Sn_reading(object):
+    ''' A decoded sensor reading. Iterating a reading gives the values
+        of a row in the column order of its sensor data table.
+    '''
+
+    __slots__ = ("node_id", "kind", "value", "received", "range", "type")
+
+    def __init__(self,node_id,kind,value,received,data_range,data_type):
+        """__init__ function. This function creates the reading.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The sensor kind, it is the name of the sensor data table.
+            param3 (float): The value.
+            param4 (float): The time that the message was received.
+            param5 (str): The range of the sensor.
+            param6 (str): The value type.
+        """
+
+        self.node_id = node_id
+        self.kind = kind
+        self.value = value
+        self.received = received
+        self.range = data_range
+        self.type = data_type
+
+    def __iter__(self):
+        """__iter__ function. This function returns the row values: node id, value and the time
+        that the reading was received as a UTC timestamp. The type and the range are kept
+        in the sensor specification table.
+        """
+
+        return iter((self.node_id, self.value, utc_timestamp(self.received)))
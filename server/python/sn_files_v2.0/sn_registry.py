@@ -0,0 +1,192 @@
+"""
+    File name: sn_registry.py
+    Author: Georgios Vrettos
+    Date created: 16/5/2018
+    Date last modified: 17/5/2018
+    Python Version: 2.7
+
+In this module, the node registry of the server is constructed. The registry keeps the status
+and the severity mode of every node of the nodes table. It is loaded on startup and it is
+updated after every write of the server, so the status, the severity mode and the number of
+active nodes are read without a query. The number of active nodes is kept in a counter that
+changes with every status change. A node that is not in the registry is loaded from the
+database on its first lookup.
+
+
+Todo :
+	*
+"""
+
+import threading
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The status of an active node.
+ACTIVE_STATUS = "active"
+# The severity mode of a node that has none yet, the mode that every node starts in.
+DEFAULT_SEV_MODE = "normalMode"
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_node(object):
+    ''' A node of the registry, with its status and severity mode.
+    '''
+
+    __slots__ = ("node_id", "status", "sev_mode")
+
+    def __init__(self,node_id,status,sev_mode):
+        """__init__ function. This function creates the node.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The node status.
+            param3 (str): The severity mode.
+        """
+
+        self.node_id = node_id
+        self.status = status
+        self.sev_mode = sev_mode
+
+
+class Sn_node_registry:
+    ''' Base class for the node registry. It contains every known node
+        and the number of the active nodes.
+    '''
+
+    def __init__(self):
+        """__init__ function. This function creates an empty registry.
+        """
+
+        # A dictionary with the node id as key and the node as value.
+        self.nodes = {}
+        self.active = 0
+        self.lock = threading.Lock()
+
+        # Registry counters.
+        self.hits = 0
+        self.misses = 0
+
+
+    def seed(self,rows):
+        """seed function. This function adds or replaces nodes.
+        Args:
+            param1 (list): The (node id, status, severity mode) rows of the nodes table.
+        """
+
+        with self.lock:
+            for node_id, status, sev_mode in rows:
+                self.put(node_id, status, sev_mode)
+
+
+    def replace(self,rows):
+        """replace function. This function replaces every node of the registry.
+        Args:
+            param1 (list): The (node id, status, severity mode) rows of the nodes table.
+        """
+
+        with self.lock:
+            self.nodes = {}
+            self.active = 0
+            for node_id, status, sev_mode in rows:
+                self.put(node_id, status, sev_mode)
+
+
+    def put(self,node_id,status,sev_mode):
+        """put function. This function adds or replaces a node. It is called with the lock held.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The node status.
+            param3 (str): The severity mode.
+        """
+
+        node = self.nodes.get(node_id)
+        if(node is None):
+            self.nodes[node_id] = Sn_node(node_id, status, sev_mode)
+            if(status == ACTIVE_STATUS):
+                self.active += 1
+        else:
+            # The counter changes only if the node becomes active or stops being active.
+            if(node.status == ACTIVE_STATUS and status != ACTIVE_STATUS):
+                self.active -= 1
+            elif(node.status != ACTIVE_STATUS and status == ACTIVE_STATUS):
+                self.active += 1
+            node.status = status
+            node.sev_mode = sev_mode
+
+
+    def missing(self,node_ids):
+        """missing function. This function returns the node ids that are not in the registry.
+        Args:
+            param1 (list): The node ids.
+        """
+
+        with self.lock:
+            return [node_id for node_id in node_ids if node_id not in self.nodes]
+
+
+    def get_many(self,node_ids):
+        """get_many function. This function returns a dictionary with the node id as key
+        and the node as value, for the node ids that are in the registry.
+        Args:
+            param1 (list): The node ids.
+        """
+
+        with self.lock:
+            found = {}
+            for node_id in node_ids:
+                node = self.nodes.get(node_id)
+                if(node is not None):
+                    found[node_id] = node
+            self.hits += len(found)
+            self.misses += len(node_ids) - len(found)
+            return found
+
+
+    def get(self,node_id):
+        """get function. This function returns a node, or None if it is not in the registry.
+        Args:
+            param1 (str): The node id.
+        """
+
+        return self.get_many([node_id]).get(node_id)
+
+
+    def set_sev_mode(self,node_id,sev_mode):
+        """set_sev_mode function. This function changes the severity mode of a node that is in the registry.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The severity mode.
+        """
+
+        with self.lock:
+            node = self.nodes.get(node_id)
+            if(node is not None):
+                node.sev_mode = sev_mode
+
+
+    def forget(self,node_id):
+        """forget function. This function removes a node, it is loaded again on its next lookup.
+        Args:
+            param1 (str): The node id.
+        """
+
+        with self.lock:
+            node = self.nodes.pop(node_id, None)
+            if(node is not None and node.status == ACTIVE_STATUS):
+                self.active -= 1
+
+
+    def active_count(self):
+        """active_count function. This function returns the number of the active nodes.
+        """
+
+        return self.active
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the registry counters in a dictionary.
+        """
+
+        with self.lock:
+            return {'nodes': len(self.nodes), 'active': self.active, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,202 @@
+"""
+    File name: sn_rollup.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the streaming rollups of the sensor data are constructed. Every reading that is saved
+is also added to a window of every rollup table, one window for every node, sensor and period of the
+table, by the time that the reading was received. A window keeps only the number of readings and the sum,
+the minimum and the maximum of the values. A window is finished ROLLUP_GRACE seconds after its end and
+every ROLLUP_FLUSH_INTERVAL seconds the finished windows are written together in one transaction.
+If the database is unavailable, or older writes still wait in the spool, the windows are appended
+to the spool. The open windows are written when the writer closes, a window that is written
+in parts is merged by the database.
+
+
+Todo :
+	*
+"""
+
+import threading
+import time
+import traceback
+from sn_thread import Sn_thread
+from sn_db import Sn_db, ROLLUP_TABLES
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# Seconds that a window stays open after its end, for the readings that are saved late.
+ROLLUP_GRACE = 2.0
+# Seconds between two writes of the finished windows.
+ROLLUP_FLUSH_INTERVAL = 10.0
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_rollup_windows:
+    ''' Base class for the rollup windows. It contains the open windows
+        of every rollup table.
+    '''
+
+    def __init__(self):
+        """__init__ function. This function creates an empty set of windows.
+        """
+
+        # A dictionary with (rollup table, node id, sensor, window start) as key
+        # and a [readings, sum, min, max] list as value.
+        self.windows = {}
+        self.cond = threading.Condition()
+
+        # Window counters.
+        self.readings = 0
+        self.windows_written = 0
+        self.windows_spooled = 0
+        self.flushes = 0
+
+
+    def add(self,reading):
+        """add function. This function adds a reading to its window of every rollup table.
+        Args:
+            param1 (Sn_reading): The sensor reading.
+        """
+
+        value = reading.value
+        with self.cond:
+            for seconds, table in ROLLUP_TABLES:
+                key = (table, reading.node_id, reading.kind, reading.received // seconds * seconds)
+                window = self.windows.get(key)
+                if(window is None):
+                    self.windows[key] = [1, value, value, value]
+                else:
+                    window[0] += 1
+                    window[1] += value
+                    if(value < window[2]):
+                        window[2] = value
+                    elif(value > window[3]):
+                        window[3] = value
+            self.readings += 1
+
+
+    def take(self,now=None):
+        """take function. This function removes the finished windows and returns them as a dictionary
+        with the rollup table as key and the parameters of its upsert statement as value: a list of
+        node ids, sensors, window starts, numbers of readings, sums, minimums and maximums.
+        Args:
+            param1 (float): The current time, or None to take every window.
+        """
+
+        seconds = dict((table, length) for length, table in ROLLUP_TABLES)
+        rollups = {}
+        with self.cond:
+            if(now is None):
+                finished = list(self.windows)
+            else:
+                finished = [key for key in self.windows if key[3] + seconds[key[0]] + ROLLUP_GRACE <= now]
+            for key in finished:
+                table, node_id, sensor, start = key
+                readings, total, minimum, maximum = self.windows.pop(key)
+                params = rollups.get(table)
+                if(params is None):
+                    params = rollups[table] = ([], [], [], [], [], [], [])
+                for values, value in zip(params, (node_id, sensor, start, readings, total, minimum, maximum)):
+                    values.append(value)
+        return rollups
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the window counters in a dictionary.
+        """
+
+        with self.cond:
+            return {'open': len(self.windows), 'readings': self.readings,
+                    'windows_written': self.windows_written, 'windows_spooled': self.windows_spooled,
+                    'flushes': self.flushes}
+
+
+class Sn_rollup_writer(Sn_rollup_windows):
+    ''' The writer of the rollup tables. It contains the open windows
+        and the thread that writes the finished ones to the database.
+    '''
+
+    def __init__(self,spool,interval=ROLLUP_FLUSH_INTERVAL):
+        """__init__ function. This function creates the writer and starts the writer thread.
+        Args:
+            param1 (Sn_spool): The spool that takes the windows that cannot be written.
+            param2 (float): Seconds between two writes.
+        """
+
+        Sn_rollup_windows.__init__(self)
+        self.spool = spool
+        self.interval = interval
+        self.running = True
+
+        self.thread = Sn_thread(id="rollup_writer", callback=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def run(self,id,data):
+        """run function. This is the loop of the writer thread. Every interval the finished
+        windows are written, when the writer stops every open window is written.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            with self.cond:
+                if(self.running):
+                    self.cond.wait(self.interval)
+                running = self.running
+            # When the writer stops, the open windows are written too.
+            self.flush(self.take(time.time() if running else None))
+            if(not running):
+                return
+
+
+    def flush(self,rollups):
+        """flush function. This function writes the windows to the database.
+        Args:
+            param1 (dict): A dictionary with the rollup table as key and the parameters of its upsert statement as value.
+        """
+
+        count = sum([len(params[0]) for params in rollups.values()])
+        if(count == 0):
+            return
+        if(self.spool.has_data() or not Sn_db.breaker.allow()):
+            # Older writes wait in the spool or the database is unavailable.
+            self.spool.append_rollups(rollups)
+            self.windows_spooled += count
+            return
+
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn == ""):
+                raise RuntimeError("No database connection.")
+            db.upsert_rollups(rollups)
+            Sn_db.breaker.success()
+            self.windows_written += count
+        except Exception:
+            traceback.print_exc()
+            Sn_db.breaker.failure()
+            # The windows are kept in the spool and they are written when the database recovers.
+            self.spool.append_rollups(rollups)
+            self.windows_spooled += count
+        finally:
+            db.disconnect_db()
+        self.flushes += 1
+
+
+    def close(self):
+        """close function. This function stops the writer thread after every open window is written.
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if(self.thread.is_alive()):
+            self.thread.join()
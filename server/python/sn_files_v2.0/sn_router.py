@@ -0,0 +1,178 @@
+"""
+    File name: sn_router.py
+    Author: Georgios Vrettos
+    Date created: 8/5/2018
+    Date last modified: 8/5/2018
+    Python Version: 2.7
+
+In this module, the topic router of the server is constructed. Handlers are registered
+with MQTT topic filters, the filters are kept in a trie with one level of the topic per node
+and the '+' and '#' wildcards are supported. A topic is split and matched once, the result
+is kept in a least recently used cache, so the repeated topics of every node cost one lookup.
+
+
+Todo :
+	*
+"""
+
+import collections
+import threading
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The maximum number of topics in the cache.
+ROUTER_CACHE_SIZE = 10000
+# The sensor data table of every sensor kind, the kind is found in the last word of the topic.
+SENSOR_TABLES = (("Temperature", "temperature"), ("Humidity", "humidity"), ("Flame", "flame"))
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_route(object):
+    ''' A parsed topic. It contains the words of the topic that the server uses
+        and the handler of the topic.
+    '''
+
+    __slots__ = ("topic", "network", "node_id", "location", "kind", "table", "handler")
+
+    def __init__(self,topic,handler):
+        """__init__ function. This function splits the topic.
+        Topics have the form network/node id/country/district/city/area description/area/building/room/kind.
+        Args:
+            param1 (str): The topic.
+            param2 (function): The handler of the topic or None.
+        """
+
+        words = topic.split("/")
+        self.topic = topic
+        self.network = words[0]
+        self.node_id = words[1] if len(words) > 1 else ""
+        # The location path, from the country to the room.
+        self.location = "/".join(words[2:-1])
+        self.kind = words[-1]
+        # The sensor data table of the topic, None for control and unknown topics.
+        self.table = None
+        if(self.kind.find("Sensor")!=-1):
+            for name, table in SENSOR_TABLES:
+                if(self.kind.find(name)!=-1):
+                    self.table = table
+                    break
+        self.handler = handler
+
+
+class Sn_router:
+    ''' Base class for the topic router. It contains the trie of the topic filters
+        and the cache of the parsed topics.
+    '''
+
+    def __init__(self,cache_size=ROUTER_CACHE_SIZE):
+        """__init__ function. This function creates an empty router.
+        Args:
+            param1 (int): The maximum number of topics in the cache.
+        """
+
+        # Every trie node is a [children, handler] list, the children are keyed by the topic word.
+        self.root = [{}, None]
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+        # Cache counters.
+        self.hits = 0
+        self.misses = 0
+
+
+    def add(self,topic_filter,handler):
+        """add function. This function registers the handler of a topic filter.
+        Args:
+            param1 (str): The topic filter, it may contain '+' and '#' wildcards.
+            param2 (function): The handler.
+        """
+
+        with self.lock:
+            node = self.root
+            for word in topic_filter.split("/"):
+                node = node[0].setdefault(word, [{}, None])
+            node[1] = handler
+            # The cached routes may have a different handler now.
+            self.cache.clear()
+
+
+    def match(self,topic):
+        """match function. This function returns the handler of a topic or None.
+        An exact word is preferred over '+' and '+' is preferred over '#'.
+        Args:
+            param1 (str): The topic.
+        """
+
+        words = topic.split("/")
+        # Topics that start with '$' do not match wildcards on the first level.
+        return self.match_node(self.root, words, 0, not topic.startswith("$"))
+
+
+    def match_node(self,node,words,level,wildcards):
+        """match_node function. This function matches the rest of a topic from a trie node.
+        Args:
+            param1 (list): The trie node.
+            param2 (list): The words of the topic.
+            param3 (int): The level of the next word.
+            param4 (bool): If False the wildcards are not matched on this level.
+        """
+
+        if(level == len(words)):
+            if(node[1] is not None):
+                return node[1]
+            # '#' matches the parent level too.
+            child = node[0].get("#")
+            return child[1] if child is not None else None
+
+        children = node[0]
+        child = children.get(words[level])
+        if(child is not None):
+            handler = self.match_node(child, words, level + 1, True)
+            if(handler is not None):
+                return handler
+        if(wildcards):
+            child = children.get("+")
+            if(child is not None):
+                handler = self.match_node(child, words, level + 1, True)
+                if(handler is not None):
+                    return handler
+            child = children.get("#")
+            if(child is not None):
+                return child[1]
+        return None
+
+
+    def route(self,topic):
+        """route function. This function returns the parsed route of a topic.
+        Known topics are taken from the cache, new topics are parsed, matched and cached.
+        Args:
+            param1 (str): The topic.
+        """
+
+        with self.lock:
+            route = self.cache.pop(topic, None)
+            if(route is not None):
+                # The topic is put back as the most recently used one.
+                self.cache[topic] = route
+                self.hits += 1
+                return route
+
+        route = Sn_route(topic, self.match(topic))
+        with self.lock:
+            self.misses += 1
+            self.cache[topic] = route
+            if(len(self.cache) > self.cache_size):
+                # The least recently used topic is removed.
+                self.cache.popitem(last=False)
+        return route
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the cache counters in a dictionary.
+        """
+
+        with self.lock:
+            return {'cached_topics': len(self.cache), 'hits': self.hits, 'misses': self.misses}
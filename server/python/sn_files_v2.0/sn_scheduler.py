@@ -0,0 +1,154 @@
+"""
+    File name: sn_scheduler.py
+    Author: Georgios Vrettos
+    Date created: 7/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the per node scheduler of the server is constructed. Every node has a FIFO lane
+of jobs and at most one worker of the pool runs the jobs of a lane at a time, so the messages of
+a node are handled one after the other in the order they arrived. Lanes of different nodes
+run in parallel. A lane exists only while it has jobs, an empty lane is removed.
+The time that every job waits from its submission until a worker runs it is measured.
+
+
+Todo :
+	*
+"""
+
+import collections
+import threading
+import time
+import traceback
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The maximum number of jobs of all lanes that wait to run.
+SCHEDULER_MAX_PENDING = 5000
+# The number of jobs that a worker runs from a lane before it gives the turn to the other lanes.
+SCHEDULER_LANE_BATCH = 50
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_scheduler:
+    ''' Base class for the per node scheduler. It contains the lane of every node
+        that has jobs and the counters of the lanes.
+    '''
+
+    def __init__(self,pool,max_pending=SCHEDULER_MAX_PENDING):
+        """__init__ function. This function creates the scheduler.
+        Args:
+            param1 (Sn_pool): The worker pool that runs the lanes. Its queue must hold
+            at least max_pending jobs.
+            param2 (int): The maximum number of jobs that wait to run.
+        """
+
+        self.pool = pool
+        self.max_pending = max_pending
+        self.cond = threading.Condition()
+        # A dictionary with the node id as key and a FIFO queue of (callback, args, submit time) tuples as value.
+        self.lanes = {}
+        self.pending = 0
+
+        # Scheduler counters.
+        self.lanes_created = 0
+        self.lanes_removed = 0
+        self.max_lane_depth = 0
+        # Wait time counters, from the submission of a job until it runs.
+        self.jobs_run = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+    def submit(self,key,callback,*args):
+        """submit function. This function adds a job to the end of the lane of a node.
+        A new lane is handed to the pool, the jobs of an existing lane run after the jobs
+        before them. If too many jobs wait, the caller waits until a place is freed.
+        Args:
+            param1 (str): The node id.
+            param2 (function): The function to be executed.
+            param3 (obj): The arguments of the function.
+        """
+
+        with self.cond:
+            while(self.pending >= self.max_pending):
+                self.cond.wait()
+            self.pending += 1
+            lane = self.lanes.get(key)
+            if(lane is not None):
+                lane.append((callback, args, time.time()))
+                self.max_lane_depth = max(self.max_lane_depth, len(lane))
+                return
+            self.lanes[key] = collections.deque([(callback, args, time.time())])
+            self.lanes_created += 1
+
+        # The lane is new, a worker of the pool starts running it.
+        self.pool.submit(self.run_lane, key)
+
+
+    def run_lane(self,key):
+        """run_lane function. This function runs the jobs of a lane in order. The lane is
+        removed when it is empty, or it is handed back to the pool after a number of jobs,
+        so a busy node does not keep a worker from the other nodes.
+        Args:
+            param1 (str): The node id.
+        """
+
+        lane = self.lanes[key]
+        for i in range(SCHEDULER_LANE_BATCH):
+            with self.cond:
+                if(not lane):
+                    # The lane is idle, it is removed.
+                    del self.lanes[key]
+                    self.lanes_removed += 1
+                    self.cond.notify_all()
+                    return
+                callback, args, submitted = lane[0]
+                wait = time.time() - submitted
+                self.jobs_run += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+            try:
+                callback(*args)
+            except Exception:
+                # A failing job must not stop the lane.
+                traceback.print_exc()
+
+            with self.cond:
+                # The job leaves the lane only after it is finished, so a new job
+                # of the node is appended to the lane and is not handed to another worker.
+                lane.popleft()
+                self.pending -= 1
+                self.cond.notify_all()
+
+        with self.cond:
+            if(not lane):
+                del self.lanes[key]
+                self.lanes_removed += 1
+                self.cond.notify_all()
+                return
+        self.pool.submit(self.run_lane, key)
+
+
+    def join(self):
+        """join function. This function waits until every submitted job is finished.
+        """
+
+        with self.cond:
+            while(self.pending > 0):
+                self.cond.wait()
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the scheduler counters in a dictionary.
+        """
+
+        with self.cond:
+            return {'lanes': len(self.lanes), 'pending': self.pending,
+                    'lanes_created': self.lanes_created, 'lanes_removed': self.lanes_removed,
+                    'max_lane_depth': self.max_lane_depth, 'jobs_run': self.jobs_run,
+                    'avg_wait': self.total_wait / self.jobs_run if self.jobs_run > 0 else 0.0,
+                    'max_wait': self.max_wait}
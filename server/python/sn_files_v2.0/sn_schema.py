@@ -0,0 +1,552 @@
+"""
+    File name: sn_schema.py
+    Author: Georgios Vrettos
+    Date created: 18/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the schema of the sensor data tables is constructed and maintained. Every sensor
+data table is partitioned by the time of its rows, one partition for every day, and it has an index
+on (node_id, time), so a query of a node in a time range reads only the partitions of the range.
+A row with a time that no day partition covers is kept in the default partition of the table.
+A table that exists without partitions is renamed and a partitioned table takes its place at once.
+Its rows are moved in batches by the maintenance thread, their times are moved from the local time
+of the database to UTC and their windows are added to the rollup tables. The times are in UTC,
+the server writes the time that every reading was received and the day of that time decides the
+partition of the row, the default of the time column is only for the other writers. The partitions of the
+next SCHEMA_PARTITIONS_AHEAD days are created in advance and the partitions that are older than
+SCHEMA_RETENTION_DAYS days are dropped, so old readings are removed without a DELETE.
+The values are kept in double precision columns. The type and the range of every sensor
+of every node are kept once in the sensor specification table instead of on every row.
+The rollup tables are created with the windows of the readings that the tables already have.
+The windows of the finest rollup table are kept as long as the readings, the windows of the coarser
+tables are kept SCHEMA_ROLLUP_RETENTION_DAYS days.
+The maintenance runs on startup and every SCHEMA_MAINTENANCE_INTERVAL seconds on its own connection.
+
+
+Todo :
+	*
+"""
+
+import datetime
+import re
+import threading
+import traceback
+import psycopg2
+import sn_db
+from sn_db import CLIENT_DATA_COLUMNS, SENSOR_SPEC_TABLE, ROLLUP_TABLES
+from sn_thread import Sn_thread
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The column of the sensor data tables that the partitions are formed by.
+SCHEMA_TIME_COLUMN = "time"
+# The default of the time column, the times of the sensor data tables are in UTC. The server gives
+# the time that every reading was received, the default is used only by the other writers.
+SCHEMA_TIME_DEFAULT = "(now() AT TIME ZONE 'UTC')"
+# The number of days that the partitions are created in advance.
+SCHEMA_PARTITIONS_AHEAD = 7
+# The number of days that the readings are kept.
+SCHEMA_RETENTION_DAYS = 90
+# The number of days that the windows of the coarser rollup tables are kept.
+SCHEMA_ROLLUP_RETENTION_DAYS = 730
+# Seconds between two maintenance runs.
+SCHEMA_MAINTENANCE_INTERVAL = 3600
+# The suffix of a table that existed without partitions, until its rows are moved.
+SCHEMA_LEGACY_SUFFIX = "_legacy"
+# The suffix of the partition of the rows of a table before it was partitioned.
+SCHEMA_HISTORY_SUFFIX = "_history"
+# The suffix of the partition of the rows that no other partition covers.
+SCHEMA_DEFAULT_SUFFIX = "_default"
+# The number of pages of a legacy table whose rows are moved in one transaction.
+SCHEMA_BACKFILL_PAGES = 128
+# The advisory lock that keeps two servers from changing the schema at the same time.
+SCHEMA_LOCK_ID = 7301
+
+# A text value that can be converted to a number, the other values become NULL.
+SCHEMA_NUMBER_PATTERN = r"^\s*[-+]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$"
+
+# The bounds of a range partition, as they are given by pg_get_expr.
+PARTITION_BOUND = re.compile(r"FOR VALUES FROM \((.*?)\) TO \((.*?)\)")
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read_bound(value):
+    """read_bound function. This function returns a partition bound as a datetime,
+    or None for MINVALUE and MAXVALUE.
+    Args:
+        param1 (str): The bound, as it is given by pg_get_expr.
+    """
+
+    if(value in ("MINVALUE", "MAXVALUE")):
+        return None
+    return datetime.datetime.strptime(value.strip("'")[:19], "%Y-%m-%d %H:%M:%S")
+
+
+def overlaps(lower,upper,other_lower,other_upper):
+    """overlaps function. This function returns True if two time ranges overlap.
+    A bound that is None is unlimited.
+    Args:
+        param1 (datetime): The start of the first range.
+        param2 (datetime): The end of the first range.
+        param3 (datetime): The start of the second range.
+        param4 (datetime): The end of the second range.
+    """
+
+    return ((lower is None or other_upper is None or lower < other_upper) and
+            (other_lower is None or upper is None or other_lower < upper))
+
+
+class Sn_schema:
+    ''' Base class for the schema maintenance of the sensor data tables. It contains
+        the thread that creates and drops the partitions.
+    '''
+
+    def __init__(self,retention_days=SCHEMA_RETENTION_DAYS,ahead_days=SCHEMA_PARTITIONS_AHEAD,
+                 interval=SCHEMA_MAINTENANCE_INTERVAL,rollup_retention_days=SCHEMA_ROLLUP_RETENTION_DAYS):
+        """__init__ function. This function creates the maintenance thread.
+        Args:
+            param1 (int): The number of days that the readings are kept.
+            param2 (int): The number of days that the partitions are created in advance.
+            param3 (float): Seconds between two maintenance runs.
+            param4 (int): The number of days that the windows of the coarser rollup tables are kept.
+        """
+
+        self.retention_days = retention_days
+        self.ahead_days = ahead_days
+        self.interval = interval
+        self.rollup_retention_days = rollup_retention_days
+        self.running = True
+        self.cond = threading.Condition()
+
+        # Maintenance counters.
+        self.runs = 0
+        self.failures = 0
+        self.created = 0
+        self.dropped = 0
+        self.windows_dropped = 0
+        self.backfilled = 0
+
+        self.thread = Sn_thread(id="schema", callback=self.run)
+        self.thread.daemon = True
+
+
+    def start(self):
+        """start function. This function maintains the tables once and starts the maintenance thread.
+        """
+
+        self.maintain()
+        self.thread.start()
+
+
+    def run(self,id,data):
+        """run function. This is the loop of the maintenance thread.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            # The rows of the tables that were partitioned are moved first.
+            self.backfill()
+            with self.cond:
+                if(self.running):
+                    self.cond.wait(self.interval)
+                if(not self.running):
+                    return
+            self.maintain()
+
+
+    def maintain(self):
+        """maintain function. This function partitions the tables that are not partitioned yet,
+        creates the partitions of the next days, drops the expired partitions and creates the rollup tables.
+        Every table is changed in its own transaction, a failing table does not stop the others.
+        """
+
+        conn = self.connect()
+        if(conn is None):
+            return
+        try:
+            for table in CLIENT_DATA_COLUMNS:
+                try:
+                    cur = conn.cursor()
+                    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+                    # The days are counted in UTC, as the times of the readings.
+                    cur.execute("SELECT date_trunc('day', " + SCHEMA_TIME_DEFAULT + ")")
+                    today = cur.fetchone()[0]
+                    self.create_spec_table(cur)
+                    self.partition_table(cur, table, today)
+                    self.type_table(cur, table)
+                    self.create_partitions(cur, table, today)
+                    self.drop_partitions(cur, table, today)
+                    conn.commit()
+                except psycopg2.DatabaseError:
+                    traceback.print_exc()
+                    conn.rollback()
+                    self.failures += 1
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+                cur.execute("SELECT date_trunc('day', " + SCHEMA_TIME_DEFAULT + ")")
+                today = cur.fetchone()[0]
+                self.create_rollup_tables(cur)
+                self.drop_windows(cur, today)
+                conn.commit()
+            except psycopg2.DatabaseError:
+                traceback.print_exc()
+                conn.rollback()
+                self.failures += 1
+        finally:
+            conn.close()
+        self.runs += 1
+
+
+    def connect(self):
+        """connect function. This function opens the connection of the maintenance.
+        It returns None if the database is unavailable.
+        """
+
+        try:
+            return psycopg2.connect(database=sn_db.DB_NAME, user=sn_db.DB_USERNAME,
+                                    password=sn_db.DB_PASSWORD, host=sn_db.DB_HOST, port=sn_db.DB_PORT,
+                                    application_name=sn_db.application_name())
+        except psycopg2.DatabaseError as exception:
+            print(exception)
+            self.failures += 1
+            return None
+
+
+    def partition_table(self,cur,table,today):
+        """partition_table function. This function creates a table as a partitioned table.
+        A table without partitions is renamed and a new partitioned table takes its place. The rows of the
+        renamed table are moved later by the backfill, their partition covers the days before today.
+        The new table is ready without reading the rows of the old one.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (str): The table name.
+            param3 (datetime): The start of the current day.
+        """
+
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        row = cur.fetchone()
+        if(row is None or row[0] == "r"):
+            if(row is not None):
+                cur.execute("ALTER TABLE " + table + " RENAME TO " + table + SCHEMA_LEGACY_SUFFIX)
+            # The node id and the value of the reading are followed by the time of the row.
+            cur.execute("CREATE TABLE " + table + " (node_id text, " + table + " double precision, " +
+                        SCHEMA_TIME_COLUMN + " timestamp NOT NULL DEFAULT " + SCHEMA_TIME_DEFAULT + ") "
+                        "PARTITION BY RANGE (" + SCHEMA_TIME_COLUMN + ")")
+            if(row is not None):
+                cur.execute("CREATE TABLE " + table + SCHEMA_HISTORY_SUFFIX + " PARTITION OF " + table +
+                            " FOR VALUES FROM (MINVALUE) TO (%s)", (today,))
+                print("Table " + table + " partitioned, its rows are moved from " +
+                      table + SCHEMA_LEGACY_SUFFIX + " in the background.")
+            else:
+                print("Table " + table + " created.")
+
+        # A reading with a time that no day partition covers does not fail its batch.
+        cur.execute("CREATE TABLE IF NOT EXISTS " + table + SCHEMA_DEFAULT_SUFFIX + " PARTITION OF " +
+                    table + " DEFAULT")
+        # A table of an older version has the local time of the database as default.
+        cur.execute("ALTER TABLE " + table + " ALTER COLUMN " + SCHEMA_TIME_COLUMN +
+                    " SET DEFAULT " + SCHEMA_TIME_DEFAULT)
+        # The index is created on every partition, the new partitions get it too.
+        cur.execute("CREATE INDEX IF NOT EXISTS " + table + "_node_id_time_idx ON " + table +
+                    " (node_id, " + SCHEMA_TIME_COLUMN + ")")
+
+
+    def create_spec_table(self,cur):
+        """create_spec_table function. This function creates the sensor specification table.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+        """
+
+        cur.execute("CREATE TABLE IF NOT EXISTS " + SENSOR_SPEC_TABLE + " (node_id text NOT NULL, "
+                    "sensor text NOT NULL, data_type text, data_range text, "
+                    "updated timestamp NOT NULL DEFAULT now(), PRIMARY KEY (node_id, sensor))")
+
+
+    def create_rollup_tables(self,cur):
+        """create_rollup_tables function. This function creates the rollup tables. A new rollup table
+        is filled with the windows of the readings that are already in the sensor data tables.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+        """
+
+        for seconds, rollup in ROLLUP_TABLES:
+            cur.execute("SELECT to_regclass(%s)", (rollup,))
+            if(cur.fetchone()[0] is not None):
+                # The old windows are found by the index of the window start.
+                cur.execute("CREATE INDEX IF NOT EXISTS " + rollup + "_bucket_idx ON " + rollup + " (bucket)")
+                continue
+            cur.execute("CREATE TABLE " + rollup + " (node_id text NOT NULL, sensor text NOT NULL, "
+                        "bucket timestamp NOT NULL, readings bigint NOT NULL, value_sum double precision, "
+                        "value_min double precision, value_max double precision, "
+                        "PRIMARY KEY (node_id, sensor, bucket))")
+            cur.execute("CREATE INDEX " + rollup + "_bucket_idx ON " + rollup + " (bucket)")
+            for table in CLIENT_DATA_COLUMNS:
+                cur.execute("SELECT to_regclass(%s)", (table,))
+                if(cur.fetchone()[0] is None):
+                    continue
+                # The windows start at the multiples of their length, as the windows of the rollup writer.
+                cur.execute("INSERT INTO " + rollup + " (node_id, sensor, bucket, readings, value_sum, "
+                            "value_min, value_max) SELECT node_id, %s, to_timestamp(floor(extract(epoch FROM " +
+                            SCHEMA_TIME_COLUMN + ") / %s) * %s) AT TIME ZONE 'UTC' AS bucket, count(*), sum(" +
+                            table + "), min(" + table + "), max(" + table + ") FROM " + table +
+                            " WHERE node_id IS NOT NULL AND " + table + " IS NOT NULL GROUP BY node_id, bucket",
+                            (table, seconds, seconds))
+            print("Table " + rollup + " created.")
+
+
+    def type_table(self,cur,table):
+        """type_table function. This function converts the text values of a table to numbers.
+        The last type and range of every node are moved to the sensor specification table
+        and the type and range columns are dropped.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (str): The table name.
+        """
+
+        columns = self.columns(cur, table)
+        type_column = table + "_type"
+        range_column = table + "_range"
+
+        if(type_column in columns and range_column in columns):
+            # The specification of the last reading of every node is kept.
+            cur.execute("INSERT INTO " + SENSOR_SPEC_TABLE + " (node_id, sensor, data_type, data_range) "
+                        "SELECT DISTINCT ON (node_id) node_id, %s, " + type_column + ", " + range_column +
+                        " FROM " + table + " WHERE node_id IS NOT NULL "
+                        "ORDER BY node_id, " + SCHEMA_TIME_COLUMN + " DESC "
+                        "ON CONFLICT (node_id, sensor) DO NOTHING", (table,))
+            print("Sensor specifications of " + table + " moved.")
+        if(columns.get(table) in ("text", "character varying")):
+            cur.execute("ALTER TABLE " + table + " ALTER COLUMN " + table + " TYPE double precision "
+                        "USING CASE WHEN " + table + " ~ %s THEN " + table + "::double precision END",
+                        (SCHEMA_NUMBER_PATTERN,))
+            print("Values of " + table + " converted to numbers.")
+        if(type_column in columns or range_column in columns):
+            cur.execute("ALTER TABLE " + table + " DROP COLUMN IF EXISTS " + type_column +
+                        ", DROP COLUMN IF EXISTS " + range_column)
+
+
+    def partitions(self,cur,table):
+        """partitions function. This function returns the (name, start, end) of every range
+        partition of a table. A bound that is None is unlimited.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (str): The table name.
+        """
+
+        cur.execute("SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                    "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)", (table,))
+        found = []
+        for name, bound in cur.fetchall():
+            match = PARTITION_BOUND.match(bound or "")
+            if(match is not None):
+                found.append((name, read_bound(match.group(1)), read_bound(match.group(2))))
+        return found
+
+
+    def create_partitions(self,cur,table,today):
+        """create_partitions function. This function creates the partition of every day from today
+        until SCHEMA_PARTITIONS_AHEAD days later, unless the day is covered by another partition.
+        The rows of the day that are in the default partition are moved to the new partition.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (str): The table name.
+            param3 (datetime): The start of the current day.
+        """
+
+        existing = self.partitions(cur, table)
+        default = table + SCHEMA_DEFAULT_SUFFIX
+        for day in range(self.ahead_days + 1):
+            lower = today + datetime.timedelta(days=day)
+            upper = lower + datetime.timedelta(days=1)
+            if(any(overlaps(lower, upper, start, end) for name, start, end in existing)):
+                continue
+            name = table + "_p" + lower.strftime("%Y%m%d")
+            cur.execute("SELECT 1 FROM " + default + " WHERE " + SCHEMA_TIME_COLUMN + " >= %s AND " +
+                        SCHEMA_TIME_COLUMN + " < %s LIMIT 1", (lower, upper))
+            if(cur.fetchone() is None):
+                cur.execute("CREATE TABLE " + name + " PARTITION OF " + table +
+                            " FOR VALUES FROM (%s) TO (%s)", (lower, upper))
+            else:
+                # A partition cannot be created while the default partition has rows of its range.
+                cur.execute("CREATE TABLE " + name + " (LIKE " + table + " INCLUDING DEFAULTS)")
+                cur.execute("WITH moved AS (DELETE FROM " + default + " WHERE " + SCHEMA_TIME_COLUMN + " >= %s AND " +
+                            SCHEMA_TIME_COLUMN + " < %s RETURNING *) INSERT INTO " + name + " SELECT * FROM moved",
+                            (lower, upper))
+                cur.execute("ALTER TABLE " + table + " ATTACH PARTITION " + name +
+                            " FOR VALUES FROM (%s) TO (%s)", (lower, upper))
+            self.created += 1
+
+
+    def drop_partitions(self,cur,table,today):
+        """drop_partitions function. This function drops the partitions that end
+        more than SCHEMA_RETENTION_DAYS days ago.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (str): The table name.
+            param3 (datetime): The start of the current day.
+        """
+
+        cutoff = today - datetime.timedelta(days=self.retention_days)
+        for name, start, end in self.partitions(cur, table):
+            if(end is not None and end <= cutoff):
+                cur.execute("DROP TABLE " + name)
+                print("Partition " + name + " dropped.")
+                self.dropped += 1
+
+
+    def backfill(self):
+        """backfill function. This function moves the rows of the tables that existed without partitions
+        to the partitioned tables, SCHEMA_BACKFILL_PAGES pages of rows in every transaction, so the writers
+        are not blocked and a stopped backfill goes on from the rows that are left. The legacy table
+        is dropped when it is empty.
+        """
+
+        conn = None
+        try:
+            for table in CLIENT_DATA_COLUMNS:
+                legacy = table + SCHEMA_LEGACY_SUFFIX
+                page = 0
+                while(self.running):
+                    if(conn is None):
+                        conn = self.connect()
+                        if(conn is None):
+                            return
+                    try:
+                        cur = conn.cursor()
+                        cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_ID,))
+                        cur.execute("SELECT pg_relation_size(to_regclass(%s)) / "
+                                    "current_setting('block_size')::bigint", (legacy,))
+                        pages = cur.fetchone()[0]
+                        if(pages is None):
+                            # The table has no legacy rows.
+                            conn.commit()
+                            break
+                        if(page == 0):
+                            self.move_specs(cur, table, legacy)
+                        if(page < pages):
+                            self.backfilled += self.move_rows(cur, table, legacy, page, page + SCHEMA_BACKFILL_PAGES)
+                            page += SCHEMA_BACKFILL_PAGES
+                        else:
+                            # Every row is moved, the legacy table is not written by anyone.
+                            cur.execute("DROP TABLE " + legacy)
+                            print("Rows of " + legacy + " moved to " + table + ".")
+                        conn.commit()
+                    except psycopg2.DatabaseError:
+                        traceback.print_exc()
+                        conn.rollback()
+                        self.failures += 1
+                        break
+        finally:
+            if(conn is not None):
+                conn.close()
+
+
+    def move_specs(self,cur,table,legacy):
+        """move_specs function. This function keeps the type and range of the last reading of every node
+        of a legacy table in the sensor specification table, if the node has no specification yet.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (str): The table name.
+            param3 (str): The legacy table name.
+        """
+
+        columns = self.columns(cur, legacy)
+        type_column = table + "_type"
+        range_column = table + "_range"
+        if(type_column in columns and range_column in columns):
+            order = (", " + SCHEMA_TIME_COLUMN + " DESC") if SCHEMA_TIME_COLUMN in columns else ""
+            cur.execute("INSERT INTO " + SENSOR_SPEC_TABLE + " (node_id, sensor, data_type, data_range) "
+                        "SELECT DISTINCT ON (node_id) node_id, %s, " + type_column + ", " + range_column +
+                        " FROM " + legacy + " WHERE node_id IS NOT NULL ORDER BY node_id" + order +
+                        " ON CONFLICT (node_id, sensor) DO NOTHING", (table,))
+
+
+    def move_rows(self,cur,table,legacy,first_page,last_page):
+        """move_rows function. This function moves the rows of a range of pages of a legacy table
+        to the partitioned table and adds their windows to the rollup tables. The value is converted
+        to a number and the time from the local time of the database to UTC. It returns the number of rows.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (str): The table name.
+            param3 (str): The legacy table name.
+            param4 (int): The first page.
+            param5 (int): The page after the last page.
+        """
+
+        columns = self.columns(cur, legacy)
+        if(SCHEMA_TIME_COLUMN in columns):
+            time = "coalesce(" + SCHEMA_TIME_COLUMN + "::timestamptz AT TIME ZONE 'UTC', " + SCHEMA_TIME_DEFAULT + ")"
+        else:
+            # The rows of a table without a time column get the time of the backfill.
+            time = SCHEMA_TIME_DEFAULT
+        value = "CASE WHEN " + table + "::text ~ %s THEN " + table + "::text::double precision END"
+        # The rows are found by their position, the rows of a page range are read without a scan of the table.
+        query = ("WITH moved AS (DELETE FROM " + legacy + " WHERE ctid >= %s::tid AND ctid < %s::tid "
+                 "RETURNING node_id, " + value + " AS value, " + time + " AS time), "
+                 "inserted AS (INSERT INTO " + table + " (node_id, " + table + ", " + SCHEMA_TIME_COLUMN + ") "
+                 "SELECT node_id, value, time FROM moved RETURNING node_id, " + table + " AS value, " +
+                 SCHEMA_TIME_COLUMN + " AS time)")
+        params = ["(%d,0)" % first_page, "(%d,0)" % last_page, SCHEMA_NUMBER_PATTERN]
+        for seconds, rollup in ROLLUP_TABLES:
+            # The windows are added to the windows that are already written, as the rollup writer does.
+            query += (", " + rollup + " AS (INSERT INTO " + rollup + " AS r (node_id, sensor, bucket, readings, "
+                      "value_sum, value_min, value_max) SELECT node_id, %s, to_timestamp(floor(extract(epoch FROM time) "
+                      "/ %s) * %s) AT TIME ZONE 'UTC' AS bucket, count(*), sum(value), min(value), max(value) "
+                      "FROM inserted WHERE node_id IS NOT NULL AND value IS NOT NULL GROUP BY node_id, bucket "
+                      "ON CONFLICT (node_id, sensor, bucket) DO UPDATE SET readings = r.readings + EXCLUDED.readings, "
+                      "value_sum = r.value_sum + EXCLUDED.value_sum, value_min = least(r.value_min, EXCLUDED.value_min), "
+                      "value_max = greatest(r.value_max, EXCLUDED.value_max))")
+            params.extend([table, seconds, seconds])
+        cur.execute(query + " SELECT count(*) FROM inserted", params)
+        return cur.fetchone()[0]
+
+
+    def columns(self,cur,table):
+        """columns function. This function returns the columns of a table and their types in a dictionary.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (str): The table name.
+        """
+
+        cur.execute("SELECT column_name, data_type FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = %s", (table,))
+        return dict(cur.fetchall())
+
+
+    def drop_windows(self,cur,today):
+        """drop_windows function. This function deletes the windows of the rollup tables that start
+        before their retention. The finest table keeps its windows as long as the readings are kept.
+        Args:
+            param1 (cursor): The cursor of the transaction.
+            param2 (datetime): The start of the current day.
+        """
+
+        for seconds, rollup in ROLLUP_TABLES:
+            days = self.retention_days if rollup == ROLLUP_TABLES[0][1] else self.rollup_retention_days
+            cur.execute("DELETE FROM " + rollup + " WHERE bucket < %s", (today - datetime.timedelta(days=days),))
+            self.windows_dropped += cur.rowcount
+
+
+    def close(self):
+        """close function. This function stops the maintenance thread.
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if(self.thread.is_alive()):
+            self.thread.join()
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the maintenance counters in a dictionary.
+        """
+
+        return {'runs': self.runs, 'failures': self.failures, 'created': self.created,
+                'dropped': self.dropped, 'windows_dropped': self.windows_dropped, 'backfilled': self.backfilled}
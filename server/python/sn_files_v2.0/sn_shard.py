@@ -0,0 +1,418 @@
+"""
+    File name: sn_shard.py
+    Author: Georgios Vrettos
+    Date created: 6/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the sharded ingest of the server is constructed. The messages are handled by
+a number of worker processes instead of threads, so parsing and validation run on more than one core.
+The receiver hashes the node id of every message and sends it to the process of that shard,
+so all messages of a node are handled by the same process in the order they arrived.
+Messages are sent in batches through a pipe as marshalled (topic, payload, arrival time) tuples.
+Every process owns its own database connections, batch writer, rollup writer, node writer and spool.
+Replies that must be published are sent back to the receiver, which owns the MQTT connection.
+The spool of a shard that is not started, because the number of shards is smaller than before,
+is replayed by the receiver. The shard processes are started before the receiver starts any thread.
+
+
+Todo :
+	*
+"""
+
+import marshal
+import multiprocessing
+import signal
+import threading
+import time
+import traceback
+import zlib
+from sn_thread import Sn_thread
+from sn_record import Sn_message
+from sn_states import ActiveMode, DB_WORKERS, DB_QUEUE_SIZE, CONTROL_WORKERS, CONTROL_QUEUE_SIZE
+from sn_db import Sn_db, Sn_statements, Sn_breaker
+from sn_pool import Sn_pool
+from sn_scheduler import Sn_scheduler
+from sn_batch import Sn_batch_writer
+from sn_rollup import Sn_rollup_writer
+from sn_spool import Sn_spool, shard_spool_dir
+from sn_writeback import Sn_node_writer
+from sn_notify import Sn_node_listener
+from validate_xml import XmlValidator
+from sn_config import Sn_config
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The default number of shard processes.
+SHARD_COUNT = multiprocessing.cpu_count()
+# Seconds that the shards are given to handle their last messages on shutdown, before they are terminated.
+SHARD_STOP_TIMEOUT = 30
+
+# --------------------------------------------------------------------------------------------------
+
+
+def shard_of(node_id,count):
+    """shard_of function. This function returns the shard that handles the messages of a node.
+    Args:
+        param1 (str): The node id.
+        param2 (int): The number of shards.
+    """
+
+    return (zlib.crc32(node_id.encode("utf-8")) & 0xffffffff) % count
+
+
+class Sn_shard_nodes(object):
+    ''' The set of danger mode nodes inside a shard process. Changes are sent
+        to the receiver, which routes the readings to the priority lanes.
+        Every shard hears the changes of every node, only the shard of the node sends them.
+    '''
+
+    def __init__(self,replies,shard,count):
+        """__init__ function. This function creates the set.
+        Args:
+            param1 (Queue): The reply queue of the receiver.
+            param2 (int): The shard number.
+            param3 (int): The number of shards.
+        """
+
+        self.replies = replies
+        self.shard = shard
+        self.count = count
+
+    def add(self,node_id):
+        """add function. This function adds a node to the danger mode nodes.
+        Args:
+            param1 (str): The node id.
+        """
+
+        if(shard_of(node_id, self.count) == self.shard):
+            self.replies.put(("danger", node_id, True))
+
+    def discard(self,node_id):
+        """discard function. This function removes a node from the danger mode nodes.
+        Args:
+            param1 (str): The node id.
+        """
+
+        if(shard_of(node_id, self.count) == self.shard):
+            self.replies.put(("danger", node_id, False))
+
+
+class Sn_shard_snapshot(object):
+    ''' The snapshot of the node configurations inside a shard process. Changes are sent
+        to the receiver, which keeps the only snapshot and writes the file.
+    '''
+
+    def __init__(self,replies):
+        """__init__ function. This function creates the snapshot.
+        Args:
+            param1 (Queue): The reply queue of the receiver.
+        """
+
+        self.replies = replies
+
+    def update(self,node_id,config):
+        """update function. This function sends the configuration of a node to the receiver.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The node configuration in JSON form.
+        """
+
+        self.replies.put(("snapshot", node_id, config))
+
+
+class Sn_shard_mqtt(object):
+    ''' The MQTT connection inside a shard process. Every publish is sent to the
+        receiver, which publishes it on the real connection.
+    '''
+
+    def __init__(self,replies,shard,count):
+        """__init__ function. This function creates the connection.
+        Args:
+            param1 (Queue): The reply queue of the receiver.
+            param2 (int): The shard number.
+            param3 (int): The number of shards.
+        """
+
+        self.replies = replies
+        self.danger_nodes = Sn_shard_nodes(replies, shard, count)
+
+    def publish(self,topic,payload=None,qos=0,retain=False):
+        """publish function. This function sends a message to be published to the receiver.
+        Args:
+            param1 (str): The message topic.
+            param2 (str): The message payload.
+            param3 (int): The quality of service.
+            param4 (bool): The retain flag.
+        """
+
+        self.replies.put(("publish", topic, payload, qos, retain))
+
+
+class ShardMode(ActiveMode):
+    """
+    This state runs inside a shard process. It handles the messages of its shard
+    the same way as the active mode does.
+    """
+
+    def __init__(self,shard,count,server_config_str,channel,replies):
+        """ __init__ function. This is the constructor of the shard state.
+        The setup of the active mode is not repeated, the receiver has done it.
+        Args:
+            param1 (int): The shard number.
+            param2 (int): The number of shards.
+            param3 (str): The server configuration string.
+            param4 (Connection): The end of the pipe that the messages arrive from.
+            param5 (Queue): The reply queue of the receiver.
+        """
+
+        self.shard = shard
+        self.server_config_str = server_config_str
+        self.server_config = Sn_config(server_config_str)
+        self.channel = channel
+        self.mqtt = Sn_shard_mqtt(replies, shard, count)
+        self.snapshot = Sn_shard_snapshot(replies)
+        self.router = self.initial_routes(self.server_config, self.handle_control, self.save_sensor_data)
+
+    def run(self):
+        """run function. This function is the main loop of the shard process. It handles
+        every batch that arrives until the receiver closes the pipe.
+        """
+
+        # The receiver stops the shards in order, a keyboard interrupt is left to it.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # The process starts with its own connection pool, statement registry and circuit breaker.
+        Sn_db.pool = None
+        Sn_db.pool_lock = threading.Lock()
+        Sn_db.breaker = Sn_breaker()
+        Sn_statements.lock = threading.Lock()
+        # The validation pool of the receiver cannot be used by this process.
+        XmlValidator.pool = None
+
+        self.spool = Sn_spool(shard_spool_dir(self.shard))
+        self.writer = Sn_batch_writer(self.spool)
+        self.rollup = Sn_rollup_writer(self.spool)
+        self.node_writer = Sn_node_writer(self.spool)
+        # The changes of the nodes table by others keep the registry and the fingerprints of the shard correct.
+        self.listener = Sn_node_listener(self.apply_node_change, self.reload_nodes)
+        self.config_cache = self.load_config_cache()
+        self.registry = self.load_registry()
+        self.listener.start()
+        self.db_pool = Sn_pool(name="db", workers=DB_WORKERS, queue_size=DB_QUEUE_SIZE)
+        self.scheduler = Sn_scheduler(self.db_pool, max_pending=DB_QUEUE_SIZE)
+        self.control_pool = Sn_pool(name="control", workers=CONTROL_WORKERS, queue_size=CONTROL_QUEUE_SIZE)
+        self.control_scheduler = Sn_scheduler(self.control_pool, max_pending=CONTROL_QUEUE_SIZE)
+        # Every shard publishes the counters of its own parts through the receiver.
+        self.status = self.status_report(self.server_config.sys_topics['server_stats'] + "/shard" + str(self.shard))
+        self.status.start()
+
+        while(True):
+            try:
+                frame = self.channel.recv_bytes()
+            except EOFError:
+                # The receiver is gone.
+                break
+            if(not frame):
+                # An empty frame is the end of the input.
+                break
+            try:
+                self.handle_message(self.mqtt, [Sn_message(topic, payload, received)
+                                                for topic, payload, received in marshal.loads(frame)])
+            except Exception:
+                # A failing batch must not stop the shard.
+                traceback.print_exc()
+
+        self.shutdown()
+
+    def refresh_snapshot(self,node_id=None):
+        """refresh_snapshot function. The receiver keeps the only snapshot
+        and it listens to the changes of the nodes table itself.
+        Args:
+            param1 (str): The node id, or None for every node.
+        """
+
+        pass
+
+    def shutdown(self):
+        """shutdown function. This function finishes the pending jobs of the shard
+        and writes its pending sensor data and node changes.
+        """
+
+        self.status.close()
+        self.listener.close()
+        self.control_scheduler.join()
+        self.scheduler.join()
+        self.control_pool.join()
+        self.db_pool.join()
+        self.writer.close()
+        self.rollup.close()
+        self.node_writer.close()
+        self.spool.close()
+        if(Sn_db.pool is not None):
+            Sn_db.pool.close_all()
+
+
+def run_shard(shard,count,server_config_str,channel,replies,inherited):
+    """run_shard function. This function is the target of every shard process.
+    Args:
+        param1 (int): The shard number.
+        param2 (int): The number of shards.
+        param3 (str): The server configuration string.
+        param4 (Connection): The end of the pipe that the messages arrive from.
+        param5 (Queue): The reply queue of the receiver.
+        param6 (list): The sending ends of the pipes of the other shards.
+    """
+
+    # The sending ends of the other shards are closed, so every shard sees
+    # the end of its input when the receiver exits.
+    for sender in inherited:
+        sender.close()
+    ShardMode(shard, count, server_config_str, channel, replies).run()
+
+
+class Sn_shards:
+    ''' Base class for the shard set. It contains the shard processes, the pipes
+        that the messages are sent through and the thread that publishes the replies.
+    '''
+
+    def __init__(self,server_config_str,count=SHARD_COUNT):
+        """__init__ function. This function starts the shard processes. It must be called
+        before any thread is started and before the MQTT connection is opened, so the processes
+        do not inherit the socket or a lock that is held by another thread.
+        Args:
+            param1 (str): The server configuration string.
+            param2 (int): The number of shard processes.
+        """
+
+        self.count = count
+        self.mqtt = None
+        self.snapshot = None
+        self.replies = multiprocessing.Queue()
+        self.channels = []
+        self.processes = []
+        # The number of messages sent to every shard.
+        self.messages = [0] * count
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # The open connections are closed, the processes must not share their sockets.
+        if(Sn_db.pool is not None):
+            Sn_db.pool.close_all()
+
+        for shard in range(count):
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=run_shard, name="shard_" + str(shard),
+                                              args=(shard, count, server_config_str, receiver, self.replies,
+                                                    list(self.channels)))
+            process.daemon = True
+            process.start()
+            # The receiving end belongs to the shard process now.
+            receiver.close()
+            self.channels.append(sender)
+            self.processes.append(process)
+
+        self.thread = Sn_thread(id="shard_replies", callback=self.publish_replies)
+        self.thread.daemon = True
+
+
+    def start(self,mqtt,snapshot):
+        """start function. This function starts publishing the replies of the shards.
+        Args:
+            param1 (SnMqtt): The mqtt connection instance.
+            param2 (Sn_snapshot): The snapshot of the node configurations.
+        """
+
+        self.mqtt = mqtt
+        self.snapshot = snapshot
+        self.thread.start()
+
+
+    def find_shard(self,topic):
+        """find_shard function. This function returns the shard of a message.
+        The node id is the second word of the topic.
+        Args:
+            param1 (str): The message topic.
+        """
+
+        start = topic.find('/') + 1
+        end = topic.find('/', start)
+        node_id = topic[start:end] if end != -1 else topic[start:]
+        return shard_of(node_id, self.count)
+
+
+    def dispatch(self,msg_buffer):
+        """dispatch function. This function sends a batch of messages to the shards.
+        Every shard receives one frame with its messages in their original order.
+        Args:
+            param1 (list): A list of messages from the temporary buffer.
+        """
+
+        frames = [[] for i in range(self.count)]
+        for msg in msg_buffer:
+            frames[self.find_shard(msg.topic)].append((msg.topic, msg.payload, msg.received))
+
+        with self.lock:
+            if(self.closed):
+                return
+            for shard in range(self.count):
+                if(frames[shard]):
+                    self.channels[shard].send_bytes(marshal.dumps(frames[shard]))
+                    self.messages[shard] += len(frames[shard])
+
+
+    def publish_replies(self,id,data):
+        """publish_replies function. This is the loop of the reply thread. It publishes
+        the messages of the shards and updates the danger mode nodes and the snapshot.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            reply = self.replies.get()
+            if(reply is None):
+                return
+            if(reply[0] == "publish"):
+                self.mqtt.publish(topic=reply[1], payload=reply[2], qos=reply[3], retain=reply[4])
+            elif(reply[0] == "danger"):
+                if(reply[2]):
+                    self.mqtt.danger_nodes.add(reply[1])
+                else:
+                    self.mqtt.danger_nodes.discard(reply[1])
+            elif(reply[0] == "snapshot"):
+                self.snapshot.update(reply[1], reply[2])
+
+
+    def close(self):
+        """close function. This function stops the shards after they handle every message
+        that was sent to them, and then stops the reply thread. A shard that is still running
+        after SHARD_STOP_TIMEOUT seconds is terminated.
+        """
+
+        with self.lock:
+            self.closed = True
+            for channel in self.channels:
+                # An empty frame is the end of the input.
+                channel.send_bytes(b"")
+                channel.close()
+        deadline = time.time() + SHARD_STOP_TIMEOUT
+        for process in self.processes:
+            process.join(max(deadline - time.time(), 0))
+            if(process.is_alive()):
+                # A shard that does not stop in time is terminated, the records of its spool are replayed on the next start.
+                print("Shard " + process.name + " did not stop in time, it is terminated.")
+                process.terminate()
+                process.join()
+        self.replies.put(None)
+        if(self.thread.is_alive()):
+            self.thread.join()
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the number of messages sent to every shard
+        and the shards that are still running.
+        """
+
+        return {'shards': self.count, 'messages': list(self.messages),
+                'alive': [process.is_alive() for process in self.processes]}
@@ -0,0 +1,243 @@
+"""
+    File name: sn_snapshot.py
+    Author: Georgios Vrettos
+    Date created: 15/5/2018
+    Date last modified: 17/5/2018
+    Python Version: 2.7
+
+In this module, the snapshot of the node configurations is constructed. The snapshot keeps
+the configuration of every node in memory and writes all of them to the nodes_config.json file.
+The file is written at most once every SNAPSHOT_INTERVAL seconds, so many registrations
+in a short time cause one write. The configurations are written one by one to a temporary
+file, which then replaces the old file, so the file is never found half written.
+
+
+Todo :
+	*
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+import traceback
+from sn_thread import Sn_thread
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The file of the node configurations.
+SNAPSHOT_FILE_PATH = "nodes_config.json"
+# The minimum time in seconds between two writes of the file.
+SNAPSHOT_INTERVAL = 5.0
+
+# --------------------------------------------------------------------------------------------------
+
+
+def replace_file(source,destination):
+    """replace_file function. This function renames a file over an existing file.
+    Args:
+        param1 (str): The new file.
+        param2 (str): The file that is replaced.
+    """
+
+    if(hasattr(os, "replace")):
+        os.replace(source, destination)
+    else:
+        if(os.name == "nt" and os.path.exists(destination)):
+            # Windows cannot rename over an existing file on Python 2.
+            os.remove(destination)
+        os.rename(source, destination)
+
+
+class Sn_snapshot:
+    ''' Base class for the snapshot. It contains the configuration of every node
+        and the thread that writes the file.
+    '''
+
+    def __init__(self,path=SNAPSHOT_FILE_PATH,interval=SNAPSHOT_INTERVAL):
+        """__init__ function. This function creates an empty snapshot and starts the writer thread.
+        Args:
+            param1 (str): The file of the node configurations.
+            param2 (float): The minimum time in seconds between two writes.
+        """
+
+        self.path = path
+        self.interval = interval
+        # A dictionary with the node id as key and the node configuration in JSON form as value.
+        self.configs = collections.OrderedDict()
+        self.dirty = False
+        self.last_write = 0.0
+        self.running = True
+        self.cond = threading.Condition()
+
+        # Snapshot counters.
+        self.updates = 0
+        self.writes = 0
+        self.last_duration = 0.0
+
+        self.thread = Sn_thread(id="snapshot", callback=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def seed(self,rows):
+        """seed function. This function loads the node configurations without writing the file.
+        Args:
+            param1 (list): The (node id, configuration) rows of the nodes table.
+        """
+
+        with self.cond:
+            for node_id, config in rows:
+                self.configs[node_id] = config
+
+
+    def replace(self,rows):
+        """replace function. This function replaces every node configuration and writes the file.
+        Args:
+            param1 (list): The (node id, configuration) rows of the nodes table.
+        """
+
+        with self.cond:
+            self.configs = collections.OrderedDict(rows)
+            self.updates += 1
+            self.dirty = True
+            self.cond.notify_all()
+
+
+    def seed_file(self):
+        """seed_file function. This function loads the node configurations of the existing file.
+        It is used when the database is unavailable on startup, so the next write keeps them.
+        """
+
+        if(not os.path.exists(self.path)):
+            return
+        try:
+            with open(self.path) as snapshot_file:
+                nodes = json.load(snapshot_file)["nodes"]
+        except (ValueError, KeyError, TypeError) as exception:
+            print("The node configuration file cannot be loaded: " + str(exception))
+            return
+        rows = []
+        for config in nodes:
+            try:
+                rows.append((config["nodeConfiguration"]["nodeInfo"]["ID"], json.dumps(config)))
+            except (KeyError, TypeError):
+                # A configuration without a node id cannot be updated, it is not kept.
+                print("A node configuration without a node id is skipped.")
+        self.seed(rows)
+
+
+    def update(self,node_id,config):
+        """update function. This function changes the configuration of a node.
+        The file is written by the writer thread.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The node configuration in JSON form.
+        """
+
+        with self.cond:
+            self.configs[node_id] = config
+            self.updates += 1
+            if(not self.dirty):
+                self.dirty = True
+                self.cond.notify_all()
+
+
+    def remove(self,node_id):
+        """remove function. This function removes the configuration of a node.
+        Args:
+            param1 (str): The node id.
+        """
+
+        with self.cond:
+            if(self.configs.pop(node_id, None) is not None):
+                self.updates += 1
+                self.dirty = True
+                self.cond.notify_all()
+
+
+    def run(self,id,data):
+        """run function. This is the loop of the writer thread. The thread sleeps until a
+        configuration changes and at least SNAPSHOT_INTERVAL seconds passed since the last write.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            with self.cond:
+                while(self.running):
+                    if(not self.dirty):
+                        self.cond.wait()
+                        continue
+                    remaining = self.last_write + self.interval - time.time()
+                    if(remaining <= 0):
+                        break
+                    self.cond.wait(remaining)
+
+                if(not self.dirty):
+                    # The snapshot is closed and the file has every change.
+                    return
+                # The configurations are copied, updates continue while the file is written.
+                configs = list(self.configs.values())
+                self.dirty = False
+
+            try:
+                self.write(configs)
+            except Exception:
+                traceback.print_exc()
+                with self.cond:
+                    # The file is written again on the next turn, unless the snapshot is closed.
+                    self.dirty = self.dirty or self.running
+            with self.cond:
+                self.last_write = time.time()
+
+
+    def write(self,configs):
+        """write function. This function writes the configurations to a temporary file
+        and puts it in the place of the file.
+        Args:
+            param1 (list): The node configurations in JSON form.
+        """
+
+        start = time.time()
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as snapshot_file:
+            # The configurations are written one by one, the whole document is never built.
+            snapshot_file.write('{"nodes":[')
+            separator = ""
+            for config in configs:
+                snapshot_file.write(separator)
+                snapshot_file.write(config)
+                separator = ",\n"
+            snapshot_file.write("]}")
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        replace_file(temporary_path, self.path)
+        self.last_duration = time.time() - start
+        self.writes += 1
+        print("Configuration file saved.")
+
+
+    def close(self):
+        """close function. This function writes the pending changes and stops the writer thread.
+        """
+
+        with self.cond:
+            self.running = False
+            # The pending changes are written now, the interval is not waited.
+            self.last_write = 0.0
+            self.cond.notify_all()
+        if(self.thread.is_alive()):
+            self.thread.join()
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the snapshot counters in a dictionary.
+        """
+
+        with self.cond:
+            return {'nodes': len(self.configs), 'updates': self.updates, 'writes': self.writes,
+                    'last_duration': self.last_duration, 'pending': self.dirty}
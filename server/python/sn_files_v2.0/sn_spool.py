@@ -0,0 +1,468 @@
+"""
+    File name: sn_spool.py
+    Author: Georgios Vrettos
+    Date created: 30/4/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the on-disk spool of the server is constructed. When the database is slow
+or unreachable, the writes are appended to segment files instead of being lost. A replay thread
+writes the spooled records to the database in the order they were appended, as soon as the
+database is available again. When the replay has caught up, the last records are replayed with the lock
+held, so the writers wait for a moment and then write to the database directly again.
+A record that the database rejects for its data is moved to the dead letter file, so it does not
+stop the replay of the records after it. The lines of the file keep the format of the segments. Records are delivered at least once, a segment that is interrupted
+by a restart is replayed from its start. Every shard process has its own spool directory inside the
+spool directory. The spools of the shards that are not started, because the server runs with fewer
+shards than before, are found by orphaned_spools and they are replayed by the receiver.
+
+
+Todo :
+	*
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+import psycopg2
+from sn_thread import Sn_thread
+from sn_db import Sn_db
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The directory of the segment files.
+SPOOL_DIR = "spool"
+# The prefix of the spool directory of every shard process, inside the spool directory.
+SPOOL_SHARD_PREFIX = "shard_"
+# The size in bytes after which a new segment file is started.
+SPOOL_SEGMENT_SIZE = 16 * 1024 * 1024
+# The data is synced to disk after this number of records...
+SPOOL_FSYNC_RECORDS = 100
+# ...or after this number of seconds, whichever comes first.
+SPOOL_FSYNC_INTERVAL = 1.0
+# Seconds between two replay attempts.
+SPOOL_REPLAY_INTERVAL = 2.0
+# The maximum number of rows that are written to the database in one replay transaction.
+SPOOL_REPLAY_BATCH = 5000
+# The replay takes the lock for the last records when no more than this number of bytes is left.
+SPOOL_HANDOFF_SIZE = 1024 * 1024
+# The file of the records that the database rejects, inside the spool directory.
+SPOOL_DEAD_LETTER = "dead_letter.records"
+# The errors of a record that fails again on every replay. Any other error is taken as a database failure.
+SPOOL_DATA_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+# --------------------------------------------------------------------------------------------------
+
+
+def shard_spool_dir(shard,directory=SPOOL_DIR):
+    """shard_spool_dir function. This function returns the spool directory of a shard process.
+    Args:
+        param1 (int): The shard number.
+        param2 (str): The spool directory of the server.
+    """
+
+    return os.path.join(directory, SPOOL_SHARD_PREFIX + str(shard))
+
+
+def orphaned_spools(shards,directory=SPOOL_DIR):
+    """orphaned_spools function. This function returns the spool directories of the shards
+    with a number from shards up that still have segments. No shard process replays them.
+    Args:
+        param1 (int): The number of shard processes that are started, 0 for none.
+        param2 (str): The spool directory of the server.
+    """
+
+    found = []
+    if(not os.path.isdir(directory)):
+        return found
+    for name in sorted(os.listdir(directory)):
+        number = name[len(SPOOL_SHARD_PREFIX):]
+        path = os.path.join(directory, name)
+        if(not name.startswith(SPOOL_SHARD_PREFIX) or not number.isdigit() or int(number) < shards
+           or not os.path.isdir(path)):
+            continue
+        if([segment for segment in os.listdir(path) if segment.endswith(".spool")]):
+            found.append(path)
+    return found
+
+
+class Sn_spool:
+    ''' Base class for the spool. It contains the segment files, the functions that
+        append records to them and the thread that replays them to the database.
+    '''
+
+    def __init__(self,directory=SPOOL_DIR):
+        """__init__ function. This function opens the spool directory. Segments that were left
+        from a previous run are kept and they are replayed first.
+        Args:
+            param1 (str): The spool directory.
+        """
+
+        self.directory = directory
+        if(not os.path.isdir(directory)):
+            os.makedirs(directory)
+
+        # The lock is taken again by replay_segment, while the replay holds it for the last records.
+        self.lock = threading.RLock()
+        # The closed segments, oldest first.
+        self.segments = sorted([int(name[:-len(".spool")]) for name in os.listdir(directory)
+                                if name.endswith(".spool")])
+        self.next_segment = self.segments[-1] + 1 if self.segments else 0
+        # The segment that is open for appends.
+        self.current = None
+        self.current_file = None
+        self.current_size = 0
+        # The byte offset that the replay reached in the oldest segment.
+        self.replay_offset = 0
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+        # Spool counters.
+        self.bytes = sum([os.path.getsize(self.path(segment)) for segment in self.segments])
+        self.records_spooled = 0
+        self.records_replayed = 0
+        self.rows_replayed = 0
+        self.records_dead = 0
+        self.replay_rate = 0.0
+
+        self.thread = Sn_thread(id="spool_replay", callback=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def path(self,segment):
+        """path function. This function returns the file path of a segment.
+        Args:
+            param1 (int): The segment number.
+        """
+
+        return os.path.join(self.directory, "%012d.spool" % segment)
+
+
+    def has_data(self):
+        """has_data function. This function returns True if there are records that wait for replay.
+        While the spool has data, every new write must go through the spool to keep the order.
+        """
+
+        with self.lock:
+            return bool(self.segments) or self.current_size > 0
+
+
+    def append_rows(self,batch):
+        """append_rows function. This function appends a batch of sensor data rows.
+        Args:
+            param1 (dict): A dictionary with the table name as key and a list of rows or readings as value.
+        """
+
+        # Every row is stored as a list of its column values, the receive time included.
+        self.append({'kind': 'rows', 'batch': dict((table, [list(row) for row in rows])
+                                                   for table, rows in batch.items())})
+
+
+    def append_upsert(self,data,datetime,config_hash=None,node_id=None):
+        """append_upsert function. This function appends a node configuration upsert.
+        Args:
+            param1 (str): The node configuration in JSON form.
+            param2 (str): The timestamp of the upsert.
+            param3 (str): The fingerprint of the configuration XML, or None.
+            param4 (str): The node id of the configuration, or None.
+        """
+
+        self.append({'kind': 'upsert', 'data': data, 'datetime': datetime, 'config_hash': config_hash,
+                     'node_id': node_id})
+
+
+    def append_nodes(self,params):
+        """append_nodes function. This function appends a batch of node column updates.
+        Args:
+            param1 (tuple): The parameters of the update_nodes statement.
+        """
+
+        self.append({'kind': 'nodes', 'params': [list(values) for values in params]})
+
+
+    def append_rollups(self,rollups):
+        """append_rollups function. This function appends a batch of rollup windows.
+        Args:
+            param1 (dict): A dictionary with the rollup table as key and the parameters of its upsert statement as value.
+        """
+
+        self.append({'kind': 'rollups', 'rollups': dict((table, [list(values) for values in params])
+                                                        for table, params in rollups.items())})
+
+
+    def append(self,record):
+        """append function. This function appends a record as a JSON line to the open segment.
+        Args:
+            param1 (dict): The record.
+        """
+
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            if(self.current is None):
+                self.current = self.next_segment
+                self.next_segment += 1
+                self.current_file = open(self.path(self.current), "a")
+                self.current_size = 0
+            self.current_file.write(line)
+            self.current_size += len(line)
+            self.bytes += len(line)
+            self.records_spooled += 1
+            self.unsynced += 1
+            if(self.unsynced >= SPOOL_FSYNC_RECORDS or
+                    time.time() - self.last_sync >= SPOOL_FSYNC_INTERVAL):
+                self.sync()
+            if(self.current_size >= SPOOL_SEGMENT_SIZE):
+                self.roll()
+
+
+    def sync(self):
+        """sync function. This function forces the open segment to disk. It is called with the lock held.
+        """
+
+        if(self.current_file is not None and self.unsynced > 0):
+            self.current_file.flush()
+            os.fsync(self.current_file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+
+    def roll(self):
+        """roll function. This function closes the open segment and makes it ready for replay.
+        It is called with the lock held.
+        """
+
+        if(self.current is not None):
+            self.sync()
+            self.current_file.close()
+            self.segments.append(self.current)
+            self.current = None
+            self.current_file = None
+            self.current_size = 0
+
+
+    def run(self,id,data):
+        """run function. This is the loop of the replay thread. It syncs the open segment
+        periodically and replays the segments when the database is available.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            time.sleep(SPOOL_REPLAY_INTERVAL)
+            with self.lock:
+                self.sync()
+            if(self.has_data() and Sn_db.breaker.allow()):
+                self.replay()
+
+
+    def replay(self):
+        """replay function. This function writes the spooled records to the database in order.
+        Consecutive row records are grouped and written with one COPY transaction.
+        The records that are appended during the replay are replayed in the next round. When less than
+        SPOOL_HANDOFF_SIZE bytes are left, they are replayed with the lock held and the spool is empty
+        at the end, so the writers that wait for the lock write to the database directly.
+        """
+
+        with self.lock:
+            # The open segment is closed, so that everything spooled until now is replayed.
+            self.roll()
+            segments = list(self.segments)
+
+        start = time.time()
+        rows = 0
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn == ""):
+                raise RuntimeError("No database connection.")
+            while(True):
+                for segment in segments:
+                    rows += self.replay_segment(db, segment)
+                with self.lock:
+                    self.roll()
+                    segments = list(self.segments)
+                    if(self.bytes <= SPOOL_HANDOFF_SIZE):
+                        # The replay caught up, the writers wait until the last records are written.
+                        for segment in segments:
+                            rows += self.replay_segment(db, segment)
+                        break
+            Sn_db.breaker.success()
+        except Exception:
+            traceback.print_exc()
+            Sn_db.breaker.failure()
+        finally:
+            db.disconnect_db()
+
+        if(rows > 0):
+            self.replay_rate = rows / max(time.time() - start, 0.000001)
+            print(str(rows) + " spooled rows replayed.")
+
+
+    def replay_segment(self,db,segment):
+        """replay_segment function. This function replays a single segment from the point
+        that the last replay reached and deletes the segment file at the end.
+        Args:
+            param1 (Sn_db): The database connection instance.
+            param2 (int): The segment number.
+        """
+
+        rows = 0
+        records = 0
+        # The (line, record) pairs that are written together.
+        group = []
+        count = 0
+        segment_file = open(self.path(segment), "rb")
+        try:
+            segment_file.seek(self.replay_offset)
+            offset = self.replay_offset
+            for line in iter(segment_file.readline, b""):
+                if(not line.endswith(b"\n")):
+                    # A line that was cut by a crash is the end of the segment.
+                    break
+                record = json.loads(line.decode("utf-8"))
+                offset += len(line)
+                records += 1
+                group.append((line, record))
+                if(record['kind'] == 'rows'):
+                    count += sum([len(table_rows) for table_rows in record['batch'].values()])
+
+                if(record['kind'] in ('upsert', 'nodes', 'rollups') or count >= SPOOL_REPLAY_BATCH):
+                    rows += self.replay_group(db, group)
+                    group = []
+                    count = 0
+                    # Everything up to this line is in the database or in the dead letter file.
+                    self.replay_offset = offset
+                    self.records_replayed += records
+                    records = 0
+
+            if(group):
+                rows += self.replay_group(db, group)
+            self.records_replayed += records
+        finally:
+            segment_file.close()
+
+        # The whole segment is in the database, the file is removed.
+        with self.lock:
+            self.bytes -= os.path.getsize(self.path(segment))
+            os.remove(self.path(segment))
+            self.segments.remove(segment)
+            self.replay_offset = 0
+        self.rows_replayed += rows
+        return rows
+
+
+    def replay_group(self,db,group):
+        """replay_group function. This function writes a group of records and returns the number of rows.
+        The rows spooled before a node or rollup write are written first, all of them with one COPY transaction.
+        If the database rejects the data of the group, the records are written one by one and the
+        records that are rejected are moved to the dead letter file.
+        Args:
+            param1 (Sn_db): The database connection instance.
+            param2 (list): The (line, record) pairs, a node or rollup write can only be the last one.
+        """
+
+        row_records = [(line, record) for line, record in group if record['kind'] == 'rows']
+        rows = 0
+        if(row_records):
+            try:
+                rows = self.write_records(db, [record for line, record in row_records])
+            except SPOOL_DATA_ERRORS:
+                db.conn.rollback()
+                for line, record in row_records:
+                    rows += self.write_rejected(db, line, record)
+        for line, record in group:
+            if(record['kind'] != 'rows'):
+                self.write_rejected(db, line, record)
+        return rows
+
+
+    def write_rejected(self,db,line,record):
+        """write_rejected function. This function writes a single record and returns the number of rows.
+        A record that the database rejects is moved to the dead letter file.
+        Args:
+            param1 (Sn_db): The database connection instance.
+            param2 (bytes): The line of the record.
+            param3 (dict): The record.
+        """
+
+        try:
+            return self.write_records(db, [record])
+        except SPOOL_DATA_ERRORS as exception:
+            db.conn.rollback()
+            self.dead_letter(line, exception)
+            return 0
+
+
+    def write_records(self,db,records):
+        """write_records function. This function writes the rows of row records with one COPY transaction,
+        or a single node or rollup write. It returns the number of rows.
+        Args:
+            param1 (Sn_db): The database connection instance.
+            param2 (list): The records.
+        """
+
+        if(records[0]['kind'] == 'upsert'):
+            record = records[0]
+            db.upsert_node_db(record['data'], record['datetime'], record.get('config_hash'), record.get('node_id'))
+            return 0
+        if(records[0]['kind'] == 'nodes'):
+            db.update_nodes(records[0]['params'])
+            return 0
+        if(records[0]['kind'] == 'rollups'):
+            db.upsert_rollups(dict((str(table), params) for table, params in records[0]['rollups'].items()))
+            return 0
+
+        batch = {}
+        count = 0
+        for record in records:
+            for table in record['batch']:
+                batch.setdefault(str(table), []).extend(record['batch'][table])
+                count += len(record['batch'][table])
+        db.copy_client_data(batch)
+        return count
+
+
+    def dead_letter(self,line,exception):
+        """dead_letter function. This function appends a record that the database rejects
+        to the dead letter file. The record is not replayed again.
+        Args:
+            param1 (bytes): The line of the record.
+            param2 (Exception): The error of the database.
+        """
+
+        print("Spooled record rejected by the database: " + str(exception).strip())
+        with self.lock:
+            dead_file = open(os.path.join(self.directory, SPOOL_DEAD_LETTER), "ab")
+            try:
+                dead_file.write(line)
+                dead_file.flush()
+                os.fsync(dead_file.fileno())
+            finally:
+                dead_file.close()
+            self.records_dead += 1
+
+
+    def close(self):
+        """close function. This function syncs and closes the open segment.
+        The records stay on disk and they are replayed on the next start.
+        """
+
+        with self.lock:
+            self.roll()
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the spool counters in a dictionary.
+        """
+
+        with self.lock:
+            return {'segments': len(self.segments) + (1 if self.current is not None else 0),
+                    'bytes': self.bytes, 'records_spooled': self.records_spooled,
+                    'records_replayed': self.records_replayed, 'rows_replayed': self.rows_replayed,
+                    'records_dead': self.records_dead,
+                    'replay_rows_per_sec': self.replay_rate}
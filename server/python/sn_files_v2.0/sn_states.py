@@ -2,13 +2,11 @@
     File name: sn_states.py
     Author: Georgios Vrettos
     Date created: 11/12/2017
-    Date last modified: 18/4/2018
+    Date last modified: 20/5/2018
     Python Version: 2.7
 
 This module contains the server funcitons for connection and message handling.
-In this module, functions from the package "xmltodict" are used. 
-To install the package using pip issue the following command:
-$pip install xmltodict 
+The node configuration files are converted from XML to JSON by the streaming converter of sn_xml.
 
 Todo :
 	* 
@@ -16,21 +14,56 @@ Todo :
 """
 
 from state import State
-from validate_xml import XmlValidator
+from validate_xml import XmlValidator, start_pool, close_pool
 from sn_mqtt import SnMqtt
-import xmltodict
-from json import dumps
-from sn_db import Sn_db
+import sn_xml
+from sn_db import Sn_db, Sn_statements
 import datetime
-import time
+import math
+import signal
+import sys
+import threading
 from sn_thread import Sn_thread
-
+from sn_pool import Sn_pool
+from sn_scheduler import Sn_scheduler
+from sn_router import Sn_router
+from sn_record import Sn_reading
+from sn_cache import Sn_config_cache
+from sn_config import Sn_config, SYS_CLIENT_IP_SUFFIX, SYS_CLIENT_STATUS_SUFFIX
+from sn_batch import Sn_batch_writer
+from sn_rollup import Sn_rollup_writer
+from sn_spool import Sn_spool, orphaned_spools
+from sn_snapshot import Sn_snapshot
+from sn_registry import Sn_node_registry, DEFAULT_SEV_MODE
+from sn_writeback import Sn_node_writer
+from sn_notify import Sn_node_listener
+from sn_schema import Sn_schema
+from sn_status import Sn_status
 
 
 
 # Global variables
 # --------------------------------------------------------------------------------------------------
 XML_FILE_PATH = "/home/vrettel/Dropbox/Thesis/Code/PC Server/sn_files/sn_config.xml"
+# The maximum number of messages that are moved from the main buffer for processing at once.
+DRAIN_BATCH_SIZE = 500
+# The number of worker threads that handle the messages.
+DB_WORKERS = 4
+# The maximum number of messages that wait to be handled.
+DB_QUEUE_SIZE = 5000
+# The number of worker threads that handle the control messages, apart from the sensor data.
+CONTROL_WORKERS = 2
+# The maximum number of control messages that wait to be handled.
+CONTROL_QUEUE_SIZE = 1000
+# The $SYS topics that are published after a node registers, with the seconds before every message.
+SYS_PUBLISH_DELAYS = (("network_status", 1.0), ("local_time", 0.2), ("server_ip", 1.0), ("server_status", 0.2),
+                      ("client_ip", 0.2), ("client_status", 0.2), ("num_connected_nodes", 0.2))
+# The parts of the server that are added to the status report, a part that is not created is left out.
+STATUS_SOURCES = ("writer", "rollup", "node_writer", "spool", "db_pool", "scheduler", "control_pool",
+                  "control_scheduler", "router", "registry", "config_cache", "snapshot", "listener",
+                  "schema", "shards")
+# The value types of the sensor data payloads, every type is mapped to its name and its conversion function.
+VALUE_TYPES = {b"float": ("float", float), b"int": ("int", int)}
 
 # --------------------------------------------------------------------------------------------------
 
@@ -43,17 +76,55 @@ class ActiveMode(State):
     # Class functionality variables.
     # server configuration file in str form.
     server_config_str = ""
+    # the server configuration, parsed once, with its topics.
+    server_config = None
     # the mqtt object
     mqtt = None
     # a list that contains all the nodes that publish messages of any kind.
     connected_nodes = []
     # a list that works as a message buffer.
     msg_buffer = []
-
-    def __init__(self):
+    # the worker pool that handles the messages.
+    db_pool = None
+    # the scheduler that keeps the messages of every node in order.
+    scheduler = None
+    # the worker pool and the scheduler of the control messages, they never wait behind sensor data.
+    control_pool = None
+    control_scheduler = None
+    # the router that finds the handler of every topic.
+    router = None
+    # the fingerprints of the saved and the invalid node configurations.
+    config_cache = None
+    # the batch writer of the sensor data tables.
+    writer = None
+    # the writer of the rollup windows of the sensor data.
+    rollup = None
+    # the snapshot of the node configurations on the JSON file.
+    snapshot = None
+    # the status and the severity mode of every node.
+    registry = None
+    # the on-disk spool for writes that cannot reach the database.
+    spool = None
+    # the spools of the shards that are not started, this process replays them.
+    orphan_spools = []
+    # the write-behind writer of the nodes table.
+    node_writer = None
+    # the listener of the changes of the nodes table that are made by others.
+    listener = None
+    # the partition maintenance of the sensor data tables.
+    schema = None
+    # the shard processes that handle the messages, if the ingest is sharded.
+    shards = None
+    # the thread that moves the messages from the buffer for processing.
+    buffer_thread = None
+
+    def __init__(self,shards=0):
         """ __init__ function. This is the constructor of the current state.
+        Args:
+            param1 (int): The number of shard processes, 0 handles every message in this process.
         """
         print('Current State: ' + str(self))
+        self.shard_count = shards
         # This function handles the server setup before connecting to mqtt network.
         self.initial_setup()
         # This function is used to connect to mqtt and handle messages.
@@ -77,20 +148,42 @@ class ActiveMode(State):
         """
         # the server configuration file in str form.
         self.server_config_str = self.read_config()
+        if(self.shard_count > 0):
+            # The shard processes are forked first, before this process starts a thread or a connection.
+            # The module is imported only when it is used, it imports this module.
+            from sn_shard import Sn_shards
+            self.shards = Sn_shards(self.server_config_str, self.shard_count)
+        # The validation processes are forked before this process starts a thread.
+        start_pool()
+
+        # The sensor data tables are partitioned before any reading is written to them.
+        self.schema = Sn_schema()
+        self.schema.start()
+        # The spool is opened first, records left from a previous run are replayed when the database is up.
+        self.spool = Sn_spool()
+        # The spools of the shards that are not started this time are replayed by this process.
+        self.orphan_spools = [Sn_spool(directory) for directory in orphaned_spools(self.shard_count)]
+        # The changes of the nodes table are written behind, the writer spools them if the database is down.
+        self.node_writer = Sn_node_writer(self.spool)
+        # The listener starts listening before the nodes are loaded, so no change is missed.
+        self.listener = Sn_node_listener(self.apply_node_change, self.reload_nodes)
+        # The fingerprints of the saved node configurations are loaded.
+        self.config_cache = self.load_config_cache()
+        # The node configurations of the JSON file are loaded.
+        self.snapshot = self.load_snapshot()
+        # The status and the severity mode of every node are loaded.
+        self.registry = self.load_registry()
+        # The configuration is parsed once, its JSON form and its topics are kept.
+        self.server_config = Sn_config(self.server_config_str)
         # the SN performs validation of it's own xml file
         if(self.validate_config_file(self.server_config_str)==False):
             # If the file is not valid print message.
             print('Check Server configuration file')
         else:
             print('Server Configuration OK')
-            # Convert XML str to JSON str.
-            server_config_json = self.xml_to_json(self.server_config_str)
             # Insert/Update node_configuration on database
-            db = Sn_db()
-            db.connect_db()
-            # Upsert function Inserts or Updates the nodes table if the node already exists.
-            db.upsert_node_db(server_config_json, self.get_local_time())
-            db.disconnect_db()
+            self.save_node_config(self.server_config.json, self.get_local_time(),
+                                  node_id=self.server_config.node_id)
 
 
     def read_config(self):
@@ -116,28 +209,280 @@ class ActiveMode(State):
         the connection to the network. It also handles all the incomming traffic accordingly.
 
         """
+        # The handlers of the control and sensor data topics.
+        self.router = self.initial_routes(self.server_config, self.handle_control, self.save_sensor_data)
+
         # Object instantiations for the Mqtt Client class.
         self.mqtt = SnMqtt()
         # Calling the funcition mqtt_connect to initiate the connection to the broker.
         self.mqtt.mqtt_connect()
 
         # Inital topic subscriotions.
-        self.initial_connections(self.mqtt,self.server_config_str)
+        self.initial_connections(self.mqtt,self.server_config)
+        # The changes of the nodes table that arrived since startup are applied from now on.
+        self.listener.start()
+
+        # The batch writer, the worker pool and the scheduler are created before any message arrives.
+        self.writer = Sn_batch_writer(self.spool)
+        self.rollup = Sn_rollup_writer(self.spool)
+        self.db_pool = Sn_pool(name="db", workers=DB_WORKERS, queue_size=DB_QUEUE_SIZE)
+        self.scheduler = Sn_scheduler(self.db_pool, max_pending=DB_QUEUE_SIZE)
+        self.control_pool = Sn_pool(name="control", workers=CONTROL_WORKERS, queue_size=CONTROL_QUEUE_SIZE)
+        self.control_scheduler = Sn_scheduler(self.control_pool, max_pending=CONTROL_QUEUE_SIZE)
+        if(self.shards is not None):
+            # The shards publish their replies through this connection.
+            self.shards.start(self.mqtt, self.snapshot)
+        # The counters of the server are published every STATUS_INTERVAL seconds.
+        self.status = self.status_report(self.server_config.sys_topics['server_stats'])
+        self.status.start()
 
         # A thread object for a parallel buffer checking function
-        buffer_thread = Sn_thread(id = "buffer",callback=self.check_buffer)
+        self.buffer_thread = Sn_thread(id = "buffer",callback=self.check_buffer)
+        # The thread must not keep the program alive on exit.
+        self.buffer_thread.daemon = True
         # The thread starts
-        buffer_thread.start()
+        self.buffer_thread.start()
 
-        # Infinite loop for the MQTT looping process.
-        while True:
+        # A termination signal ends the network loop the same way as a keyboard interrupt.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
             # Call of mqtt_loop, a method that is used for the network looping process.
+            # The network loop blocks here for as long as the server runs.
             self.mqtt.mqtt_loop()
+        finally:
+            self.shutdown()
+
+
+    def shutdown(self):
+        """shutdown function. This function stops the server in order. The messages of the buffer
+        are handed over first, then the network connection closes, the pending jobs finish
+        and the pending sensor data is written.
+        """
+
+        print("Server shutting down.")
+        self.status.close()
+        # The network loop has stopped, the messages that are left in the buffer are handed over first.
+        self.mqtt.buffer.close()
+        self.buffer_thread.join()
+        if(self.shards is not None):
+            # The shards finish first, their replies still need the network connection.
+            self.shards.close()
+        self.mqtt.disconnect()
+        self.listener.close()
+        self.schema.close()
+        self.control_scheduler.join()
+        self.scheduler.join()
+        self.control_pool.join()
+        self.db_pool.join()
+        self.writer.close()
+        # The open rollup windows and the pending changes of the nodes table are written before the spool closes.
+        self.rollup.close()
+        self.node_writer.close()
+        self.spool.close()
+        for spool in self.orphan_spools:
+            spool.close()
+        # The last changes of the node configurations are written to the file.
+        self.snapshot.close()
+        # The pending validations finish and the validation processes stop.
+        close_pool()
+        # Every writer is closed, the connections of the pool are closed last.
+        if(Sn_db.pool is not None):
+            Sn_db.pool.close_all()
+
+
+    def load_config_cache(self):
+        """load_config_cache function. This function creates the configuration fingerprint cache
+        and loads the fingerprints of the saved configurations from the database.
+        If the database is unavailable the cache starts empty.
+        """
+
+        config_cache = Sn_config_cache()
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn != ""):
+                config_cache.seed(db.get_config_hashes())
+        except Exception as exception:
+            print(exception)
+        finally:
+            db.disconnect_db()
+        return config_cache
+
+
+    def load_snapshot(self):
+        """load_snapshot function. This function creates the snapshot of the node configurations
+        and loads the configurations from the database. If the database is unavailable
+        the configurations of the existing file are loaded.
+        """
+
+        snapshot = Sn_snapshot()
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn != ""):
+                snapshot.seed(db.get_node_configs())
+            else:
+                snapshot.seed_file()
+        except Exception as exception:
+            print(exception)
+            snapshot.seed_file()
+        finally:
+            db.disconnect_db()
+        return snapshot
+
+
+    def load_registry(self):
+        """load_registry function. This function creates the node registry and loads every node
+        from the database. If the database is unavailable the nodes are loaded on their first lookup.
+        """
+
+        registry = Sn_node_registry()
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn != ""):
+                registry.seed(db.get_node_states())
+        except Exception as exception:
+            print(exception)
+        finally:
+            db.disconnect_db()
+        return registry
+
+
+    def lookup_nodes(self,db,node_ids):
+        """lookup_nodes function. This function returns a dictionary with the node id as key and
+        the registry node as value. The nodes that are not in the registry are loaded with one query.
+        Args:
+            param1 (Sn_db): A database connection instance.
+            param2 (list): The node ids.
+        """
+
+        missing = self.registry.missing(node_ids)
+        if(missing):
+            self.registry.seed(db.get_node_states(missing))
+        return self.registry.get_many(node_ids)
+
+
+    def apply_node_change(self,change):
+        """apply_node_change function. This function applies a change of the nodes table
+        that was made by another server or by an operator.
+        Args:
+            param1 (dict): The change, with the operation, the node id, the status, the severity mode,
+                           whether the configuration changed and the new fingerprint.
+        """
+
+        node_id = change['node_id']
+        if(change['op'] == "DELETE"):
+            self.registry.forget(node_id)
+            self.config_cache.forget(node_id)
+            if(self.mqtt is not None):
+                self.mqtt.danger_nodes.discard(node_id)
+            self.refresh_snapshot(node_id)
+            return
+
+        node = self.registry.get(node_id)
+        if(self.mqtt is not None and (node is None or node.sev_mode != change['sev_mode'])):
+            # The readings of nodes in danger mode take the alert lane.
+            if(change['sev_mode'] == "dangerMode"):
+                self.mqtt.danger_nodes.add(node_id)
+            else:
+                self.mqtt.danger_nodes.discard(node_id)
+        self.registry.seed([(node_id, change['status'], change['sev_mode'])])
+
+        if(change['config_changed']):
+            if(change['config_hash'] is not None):
+                self.config_cache.remember(node_id, change['config_hash'])
+            else:
+                # The configuration changed without a fingerprint, the next one is validated again.
+                self.config_cache.forget(node_id)
+            self.refresh_snapshot(node_id)
+
+
+    def reload_nodes(self):
+        """reload_nodes function. This function loads the registry, the fingerprints and the snapshot
+        again from the database, when the changes of a period are unknown.
+        """
+
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn == ""):
+                raise RuntimeError("No database connection.")
+            self.registry.replace(db.get_node_states())
+            self.config_cache.replace(db.get_config_hashes())
+        finally:
+            db.disconnect_db()
+        self.refresh_snapshot()
+
+
+    def refresh_snapshot(self,node_id=None):
+        """refresh_snapshot function. This function loads the configuration of a node,
+        or of every node, from the database into the snapshot of the JSON file.
+        Args:
+            param1 (str): The node id, or None for every node.
+        """
+
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn == ""):
+                raise RuntimeError("No database connection.")
+            if(node_id is None):
+                self.snapshot.replace(db.get_node_configs())
+                return
+            config = db.get_node_config(node_id)
+        finally:
+            db.disconnect_db()
+        if(config is None):
+            self.snapshot.remove(node_id)
+        else:
+            self.snapshot.update(node_id, config)
+
+
+    def save_node_config(self,config_json,datetime,db=None,config_hash=None,node_id=None):
+        """save_node_config function. This function inserts or updates a node configuration
+        on the database. If the database is unavailable, or older writes still wait in the spool,
+        the upsert is appended to the spool and it is replayed later in order.
+        The configuration is given to the snapshot of the JSON file in both cases.
+        Args:
+            param1 (str): The node configuration in JSON form.
+            param2 (str): The current timestamp.
+            param3 (Sn_db): A database connection instance, if the caller already holds one.
+            param4 (str): The fingerprint of the configuration XML, or None.
+            param5 (str): The node id of the configuration, or None to find it in the JSON.
+        """
+
+        if(node_id is None):
+            node_id = Sn_db().find_node_id(config_json)
+        self.snapshot.update(node_id, config_json)
+        # The upsert sets the connection time, an older pending connection time must not replace it.
+        self.node_writer.discard(node_id, "last_connected")
+
+        if(self.spool.has_data() or not Sn_db.breaker.allow()):
+            self.spool.append_upsert(config_json, datetime, config_hash, node_id)
+            return
+
+        own_db = db is None
+        if(own_db):
+            db = Sn_db()
+            db.connect_db()
+        try:
+            # Upsert function Inserts or Updates the nodes table if the node already exists.
+            db.upsert_node_db(config_json, datetime, config_hash, node_id)
+            Sn_db.breaker.success()
+        except Exception as exception:
+            print(exception)
+            Sn_db.breaker.failure()
+            self.spool.append_upsert(config_json, datetime, config_hash, node_id)
+        finally:
+            if(own_db):
+                # The connection returns to the pool.
+                db.disconnect_db()
 
 
     def check_buffer(self,id,data):
         """check_buffer function. This function implements a loop that
-        checks the buffer periodically for incoming messages. Content from the main buffer
+        waits on the buffer for incoming messages. Content from the main buffer
         is moved to a temporary buffer for further processing.
         Args:
             param1 (str): Thread id.
@@ -146,25 +491,28 @@ class ActiveMode(State):
         """
 
         while(True):
-            #time.sleep(35)
-            self.msg_buffer = []
-            current_length = len(self.mqtt.buffer)
-            i=0
-            # Messages from the main buffer are moved to the temporary buffer.
-            while( i < current_length):
-                self.msg_buffer.append(self.mqtt.buffer[i])
-                self.mqtt.buffer.pop(i)
-                current_length-=1
-
-            # The content of the temporary buffer is handled for porcessing.
-            self.handle_message(self.mqtt, self.msg_buffer)
-
-
+            # The thread sleeps until at least one message is available. Messages that arrived
+            # in the meantime are moved to the temporary buffer too, control and alert messages first.
+            self.msg_buffer = self.mqtt.buffer.get_batch(DRAIN_BATCH_SIZE)
+            if(not self.msg_buffer):
+                # The buffer is closed and every message is handed over.
+                return
+
+            if(self.shards is not None):
+                # The content of the temporary buffer is sent to the shard processes.
+                self.shards.dispatch(self.msg_buffer)
+            else:
+                # The content of the temporary buffer is handled for porcessing.
+                self.handle_message(self.mqtt, self.msg_buffer)
 
 
 
     def handle_message(self,mqtt, msg_buffer):
         """handle_message function. This function handles all incomming traffic.
+        Every message is added to the lane of its node in the scheduler, so the messages
+        of a node are handled in order and different nodes are handled in parallel.
+        The control messages have their own scheduler and workers, so they never wait
+        behind the sensor data of a node or of the other nodes.
         Args:
             param1 (SnMqtt): The mqtt connection instance.
             param2 (list): A list of messages from the temporary buffer.
@@ -172,149 +520,186 @@ class ActiveMode(State):
         """
 
         for msg in msg_buffer:
-            # For every message in the temporary buffer
-            topic = msg.topic
-            payload = msg.payload
-            if(topic.rfind("control")!=-1):
-                # If the topic is a control topic
-                if(payload.find("PUB_CONFIG_FILE")!=-1):
-                    # If the message's payload contains this pattern,
-                    # the message contains an XML file for the new client node.
-                    xml_start = payload.find('<?xml version="1.0"?>')
-                    xml_end = payload.rfind('</nodeConfiguration>')
-
-                    if(xml_start!=-1 and xml_end!=-1):
-                        # if the string is an xml file
-                        # string trimming is performed to discard uncesessary data.
-                        client_config_str = payload[xml_start:xml_end + len('</nodeConfiguration>')]
-                        # if the incomming xml file is valid (through xml validation function)
-                        if(self.validate_config_file(client_config_str)):
-                            print("Client node valid.")
-
-                            # Initiating connection with the database.
-                            db = Sn_db()
-                            db.connect_db()
-
-                            # This is the last known severity mode of the current node in the database.
-                            # The mode is retrieved using the node id. The id is extracted from the topic.
-                            last_known_mode = db.get_node_sev_mode(self.find_in_topic(topic,2))
-
-                            # the SN publishes to the same topic a set_node_mode active command and severity mode.
-                            mqtt.publish(topic=topic, payload="SET_CN_FUNCTIONAL_MODE, active," +
-                                                last_known_mode + ", parameter2, parameter3", qos=1, retain=False)
-                            # Convert the XML file to JSON
-                            client_config_json = self.xml_to_json(client_config_str)
-
-                            # Upsert function Inserts or Updates the nodes table if the node already exists.
-                            db.upsert_node_db(client_config_json,self.get_local_time())
-                            time.sleep(1)
-                            # After databases update, the SN publishes messages to $SYS topics.
-                            self.active_connections(mqtt,self.server_config_str,client_config_str,db)
-                            # Database connection ends.
-                            db.disconnect_db()
-                        else:
-                            # if the incomming xml file is invalid (through xml validation function)
-                            print("Client node invalid.")
-                            # the SN publishes to the same topic a set_node_mode blocked command.
-                            mqtt.publish(topic=topic, payload="SET_CN_FUNCTIONAL_MODE, blocked,"
-                            " parameter2, parameter3", qos=1, retain=False)
+            # For every message in the temporary buffer the parsed topic is found.
+            route = self.router.route(msg.topic)
+            if(route.handler == self.handle_control):
+                self.control_scheduler.submit(route.node_id, route.handler, mqtt, msg, route)
+            elif(route.handler is not None):
+                # The handler of the topic runs in the lane of the node.
+                self.scheduler.submit(route.node_id, route.handler, mqtt, msg, route)
 
-                    else:
-                        # if the string is not an xml file
-                        print("Client node invalid.")
-                        # the SN publishes to the same topic a set_node_mode blocked command.
-                        mqtt.publish(topic=topic, payload="SET_CN_FUNCTIONAL_MODE, blocked,"
-                        " parameter2, parameter3", qos=1, retain=False)
 
-                elif(payload.find("PUB_CN_SEVERITY_MODE")!=-1):
-                    # if the topic is refers to severity mode change
+    def handle_control(self,mqtt,msg,route):
+        """handle_control function. This function handles a control message.
+        Args:
+            param1 (SnMqtt): The mqtt connection instance.
+            param2 (Sn_message): A control message.
+            param3 (Sn_route): The parsed topic of the message.
 
-                    sev_mode = self.find_sev_mode(payload)
-                    node_id = self.find_in_topic(topic,2)
+        """
 
+        topic = msg.topic
+        payload = msg.payload
+
+        if(payload.find("PUB_CONFIG_FILE")!=-1):
+            # If the message's payload contains this pattern,
+            # the message contains an XML file for the new client node.
+            xml_start = payload.find('<?xml version="1.0"?>')
+            xml_end = payload.rfind('</nodeConfiguration>')
+
+            if(xml_start!=-1 and xml_end!=-1):
+                # if the string is an xml file
+                # string trimming is performed to discard uncesessary data.
+                client_config_str = payload[xml_start:xml_end + len('</nodeConfiguration>')]
+                # The fingerprint of the configuration is compared with the cached ones.
+                config_hash = self.config_cache.fingerprint(client_config_str)
+                # A configuration that is saved already for this node is not validated and saved again.
+                saved = self.config_cache.is_saved(route.node_id, config_hash)
+                # if the incomming xml file is valid (through xml validation function)
+                # A configuration that was found invalid before is rejected without parsing.
+                if(saved or (not self.config_cache.is_invalid(config_hash) and
+                             self.validate_config_file(client_config_str))):
+                    print("Client node valid.")
+
+                    # Borrowing a connection from the database pool.
                     db = Sn_db()
                     db.connect_db()
-                    # Update column function updates the severity mode of the current node.
-                    db.update_node_column("sev_mode",sev_mode,node_id)
-                    db.disconnect_db()
-
+                    try:
+                        # This is the last known severity mode of the current node.
+                        # The mode is retrieved from the registry using the node id.
+                        node = self.lookup_nodes(db, [route.node_id]).get(route.node_id)
+                        # A node that is not registered yet starts in the default mode.
+                        last_known_mode = DEFAULT_SEV_MODE
+                        if(node is not None and node.sev_mode is not None):
+                            last_known_mode = node.sev_mode
+
+                        # the SN publishes to the same topic a set_node_mode active command and severity mode.
+                        mqtt.publish(topic=topic, payload="SET_CN_FUNCTIONAL_MODE, active," +
+                                            last_known_mode + ", parameter2, parameter3", qos=1, retain=False)
+                        if(saved):
+                            # The configuration is unchanged, only the connection time is updated.
+                            self.node_writer.set(route.node_id, "last_connected", self.get_local_time())
+                        else:
+                            # Convert the XML file to JSON
+                            client_config_json, summary = self.xml_to_json(client_config_str)
+
+                            # The nodes table is updated, or the upsert is spooled if the database is unavailable.
+                            self.save_node_config(client_config_json,self.get_local_time(),db,config_hash,
+                                                  summary.node_id)
+                            self.config_cache.remember(route.node_id, config_hash)
+                        # After databases update, the SN publishes messages to $SYS topics.
+                        self.active_connections(mqtt,self.server_config,client_config_str,db)
+                    finally:
+                        # The connection returns to the pool.
+                        db.disconnect_db()
                 else:
-                    # other kind of control messages are being ignored for now.
-                    pass
-
-
-            elif(topic.rfind("Sensor")!=-1):
-                # if the topic of a message contains the word Sensor
-                # another thread is executed to process the data and save it into the DB
-                db_thread = Sn_thread(self.find_in_topic(topic,2),msg,self.save_sensor_data)
-                db_thread.start()
+                    # if the incomming xml file is invalid (through xml validation function)
+                    print("Client node invalid.")
+                    self.config_cache.remember_invalid(config_hash)
+                    # the SN publishes to the same topic a set_node_mode blocked command.
+                    mqtt.publish(topic=topic, payload="SET_CN_FUNCTIONAL_MODE, blocked,"
+                    " parameter2, parameter3", qos=1, retain=False)
 
+            else:
+                # if the string is not an xml file
+                print("Client node invalid.")
+                # the SN publishes to the same topic a set_node_mode blocked command.
+                mqtt.publish(topic=topic, payload="SET_CN_FUNCTIONAL_MODE, blocked,"
+                " parameter2, parameter3", qos=1, retain=False)
 
+        elif(payload.find("PUB_CN_SEVERITY_MODE")!=-1):
+            # if the topic is refers to severity mode change
 
+            sev_mode = self.find_sev_mode(payload)
+            node_id = route.node_id
 
-    def save_sensor_data(self,node_id,data_msg):
-        """save_sensor_data function. This function saves the sensor data from a message
-        to the database.
-        Args:
-            param1 (str): The node id.
-            param2 (list): A data message.
+            # The readings of nodes in danger mode take the alert lane.
+            if(sev_mode == "dangerMode"):
+                mqtt.danger_nodes.add(node_id)
+            else:
+                mqtt.danger_nodes.discard(node_id)
 
-        """
+            # The severity mode of the current node is written behind, the registry changes at once.
+            self.node_writer.set(node_id, "sev_mode", sev_mode)
+            self.registry.set_sev_mode(node_id, sev_mode)
 
-        # the data table is processed for content extraction
-        # the process returns a dictionary object.
-        data = self.find_data_values(data_msg)
-        # Initiating connection with the database.
-        db = Sn_db()
-        db.connect_db()
-        # Depending on the message topic,
-        # the data is being inserted to a specific table in the database.
-        if(data_msg.topic.rfind("Temperature")!=-1):
-            db.insert_client_data(node_id, "temperature", data)
-            db.disconnect_db()
+        else:
+            # other kind of control messages are being ignored for now.
+            pass
 
-        elif(data_msg.topic.rfind("Humidity")!=-1):
-            db.insert_client_data(node_id, "humidity", data)
-            db.disconnect_db()
 
-        elif(data_msg.topic.rfind("Flame")!=-1):
-            db.insert_client_data(node_id, "flame", data)
-            db.disconnect_db()
 
 
 
 
-    def find_data_values(self,msg):
-        """find_data_values function. This function extracts the data from every message
-        in the list, and it returns a key:value dictionary.
+    def save_sensor_data(self,mqtt,data_msg,route):
+        """save_sensor_data function. This function saves the sensor data from a message
+        to the database through the batch writer and adds it to the rollup windows.
         Args:
-            param1 (list): A list of messages from a specific client.
+            param1 (SnMqtt): The mqtt connection instance.
+            param2 (Sn_message): A data message.
+            param3 (Sn_route): The parsed topic of the message.
 
         """
 
-        # The dictionary is initialized with default values.
-        #extracted_data = {'temperature_type': 'F', 'temperature_range': 'F', 'temperature': '-1',
-        #                  'humidity_type': 'F', 'humidity': '-1', 'humidity_range': 'F',
-        #                  'flame_type': 'F', 'flame': '-1', 'flame_range': 'F'}
-
-            # for every message in the list data extraction is performed.
-        extracted_data = {}
-
-        if(msg.topic.rfind("Temperature")!=-1):
-                extracted_data['temperature_type'] = self.find_in_payload(msg.payload, 1)
-                extracted_data['temperature_range'] = self.find_in_payload(msg.payload, 2)
-                extracted_data['temperature'] = self.find_in_payload(msg.payload,3)
-        elif(msg.topic.rfind("Humidity")!=-1):
-                extracted_data['humidity_type'] = self.find_in_payload(msg.payload, 1)
-                extracted_data['humidity_range'] = self.find_in_payload(msg.payload, 2)
-                extracted_data['humidity'] = self.find_in_payload(msg.payload,3)
-        elif(msg.topic.rfind("Flame")!=-1):
-                extracted_data['flame_type'] = self.find_in_payload(msg.payload, 1)
-                extracted_data['flame_range'] = self.find_in_payload(msg.payload, 2)
-                extracted_data['flame'] = self.find_in_payload(msg.payload,3)
+        if(route.table is None):
+            # The topic does not belong to a known sensor kind.
+            return
+        try:
+            # The payload is decoded to its type, range and numeric value.
+            data_type, data_range, value = self.find_data_values(data_msg.payload)
+        except ValueError as exception:
+            print(exception)
+            return
+        # The reading is created once and it is added as it is to the batch of its table.
+        reading = Sn_reading(route.node_id, route.table, value, data_msg.received, data_range, data_type)
+        self.writer.add(reading)
+        # The reading is added to its rollup windows as it passes.
+        self.rollup.add(reading)
+
+
+
+
+    def find_data_values(self,payload):
+        """find_data_values function. This function decodes a sensor data payload
+        of the form "type,range,value" in one pass over the raw bytes.
+        It returns the type, the range and the value converted to a number.
+        A value that is not a finite number, such as nan or inf, is rejected.
+        Args:
+            param1 (bytes): Message payload.
 
+        """
 
-        return extracted_data
+        # The payload is split once, the value may not contain more commas.
+        fields = payload.split(b",", 2)
+        if(len(fields) != 3):
+            raise ValueError("Invalid sensor data: " + repr(payload))
+        data_type, data_range, value = fields
+
+        # The value is converted from the bytes, without decoding it to text first.
+        name, convert = VALUE_TYPES.get(data_type, (None, float))
+        try:
+            number = convert(value)
+        except ValueError:
+            try:
+                # An integer sensor may still send a decimal point.
+                number = float(value)
+            except ValueError:
+                raise ValueError("Invalid sensor value: " + repr(payload))
+        try:
+            finite = not (math.isnan(number) or math.isinf(number))
+        except OverflowError:
+            # An integer that does not fit in a double precision column.
+            finite = False
+        if(not finite):
+            raise ValueError("Invalid sensor value: " + repr(payload))
+
+        if(name is None):
+            # An unknown type is kept as it was sent.
+            name = data_type if isinstance(data_type, str) else data_type.decode("utf-8", "replace")
+        if(not isinstance(data_range, str)):
+            data_range = data_range.decode("utf-8", "replace")
+        return name, data_range, number
 
 
     def find_sev_mode(self,payload):
@@ -329,66 +714,15 @@ class ActiveMode(State):
         end = payload.rfind("Mode") + len("Mode")
         return  payload[start:end]
 
-    def find_in_payload(self,payload,position):
-        """find_in_topic function. This function extracts a specific item from a data message
-        depending on the position of the item.
-        Args:
-            param1 (str): Message payload.
-            param1 (str): Word position on topic.
-
-        """
-
-        # Word extraction from the current topic.
-        i=1
-        start = 0
-        end = payload.find(',')
-        # Depending on the position of the item that we need to extract from the topic
-        # the loop runs to locate the item between two "/".
-        while i < position:
-            start = end + 1
-            if(payload.find(',',end + 1)!=-1):
-                end = payload.find(',',end + 1)
-            else:
-                end = len(payload)
-            i = i + 1
-        # when the desired word indexes are found we extract the final item.
-        return payload[start:end]
-
-
-    def find_in_topic(self,topic,position):
-        """find_in_topic function. This function extracts a specific item from a topic
-        depending on the position of the item.
-        Args:
-            param1 (str): Message topic.
-            param1 (str): Word position on topic.
-
-        """
-
-        # Word extraction from the current topic.
-        i=1
-        start = 0
-        end = topic.find('/')
-        # Depending on the position of the item that we need to extract from the topic
-        # the loop runs to locate the item between two "/".
-        while i < position:
-            start = end + 1
-            if(topic.find('/',end + 1)!=-1):
-                end = topic.find('/',end + 1)
-            else:
-                end = len(topic)
-            i = i + 1
-        # when the desired word indexes are found we extract the final item.
-        return topic[start:end]
-
-
     def xml_to_json(self,xml_str):
         """xml_to_json function. This function converts XML str to JSON str.
+        It returns the JSON str and the summary of the configuration.
         Args:
             param1 (str): xml string.
 
         """
-        # Parses xml to dictionary and then converts to JSON.
-        return dumps(xmltodict.parse(xml_str))
+        # The xml is converted in one pass, the node id and the other summary values are collected on the way.
+        return sn_xml.convert(xml_str)
 
     def get_local_time(self):
         """get_local_time function. This function returns the local time.
@@ -398,110 +732,142 @@ class ActiveMode(State):
         return current_time
 
 
-    def initial_connections(self,mqtt,xml_config):
+    def initial_connections(self,mqtt,server_config):
         """initial_connections function. In this function, 
-        the program acquires data from the server XML
-        and forms the first subscribing topic.
+        the program subscribes to the topics of the server configuration.
+        The topics are kept by the client, it subscribes to them again on every reconnection.
 
         Args:
             param1 (SnMqtt): The mqtt connection instance.
-            param2 (str): The node_configuration in str form.
+            param2 (Sn_config): The server configuration.
 
         """
 
-        # We extract the necessary data from the XML file using our custom element extraction function.
-        networkName = self.find_xml_element(xml_config,"<networkName>")
-        country = self.find_xml_element(xml_config, "<country>")
-        districtState = self.find_xml_element(xml_config, "<districtState>")
-        city = self.find_xml_element(xml_config, "<city>")
-        areaDescription = self.find_xml_element(xml_config, "<areaDescription>")
-        area = self.find_xml_element(xml_config, "<area>")
-        building = self.find_xml_element(xml_config, "<building>")
-        room = self.find_xml_element(xml_config, "<room>")
+        # The SN subscribes to the client control and sensor data topics and waits for incomming client
+        # configuration files or sensor data.
+        mqtt.subscriptions = [(server_config.control_topic, 1), (server_config.sensor_data_topic, 1)]
+        if(mqtt.is_connected()):
+            mqtt.subscribe(mqtt.subscriptions)
+        # Otherwise the client subscribes when the broker accepts the connection.
+
+    def initial_routes(self,server_config,control_handler,sensor_handler):
+        """initial_routes function. In this function, the program creates the topic router
+        with a handler for the client control topic and a handler for the sensor data topic.
 
-        # The extracted data forms the final control topic.
-        client_control_topic = networkName + "/+/" + country + "/" + districtState + "/" +\
-        city + "/" + areaDescription + "/" + area + "/" + building + "/" + room + "/control";
+        Args:
+            param1 (Sn_config): The server configuration.
+            param2 (function): The handler of the control messages.
+            param3 (function): The handler of the sensor data messages.
 
-        # The extracted data forms the final sensor data topic.
-        sensor_data_topic = networkName + "/+/" + country + "/" + districtState + "/" +\
-        city + "/" + areaDescription + "/" + area + "/" + building + "/" + room + "/+";
+        """
 
-        # The SN subscribes to the client control and sensor data topics and waits for incomming client
-        # configuration files or sensor data.
-        mqtt.subscribe(topic=client_control_topic, qos=1)
-        mqtt.subscribe(topic=sensor_data_topic, qos=1)
+        router = Sn_router()
+        # The control topic is matched before the sensor data topic, an exact word is preferred over '+'.
+        router.add(server_config.control_topic, control_handler)
+        router.add(server_config.sensor_data_topic, sensor_handler)
+        return router
 
-    def active_connections(self,mqtt,server_xml_config,client_xml_config,db_connection):
+    def status_report(self,topic):
+        """status_report function. In this function, the program creates the status report
+        with the counters of every part of the server that keeps them.
+
+        Args:
+            param1 (str): The $SYS topic that the report is published to.
+
+        """
+
+        status = Sn_status(lambda payload: self.mqtt.publish(topic=topic, payload=payload))
+        for name in STATUS_SOURCES:
+            status.add(name, getattr(self, name, None))
+        # The lanes of the buffer, the timings of the statements and the durations of the validations.
+        status.add("lanes", getattr(self.mqtt, "buffer", None))
+        status.add("statements", Sn_statements())
+        status.add("validation", XmlValidator.latency)
+        return status
+
+    def active_connections(self,mqtt,server_config,client_xml_config,db_connection):
         """active_connections function. In this function, 
-        the program acquires data from the XML files,
+        the program acquires data from the client XML file,
         forms and publishes to all necessary  $SYS topics.
+        The messages are published one after the other by a timer, after the delays
+        of SYS_PUBLISH_DELAYS, so the worker does not wait for them.
 
         Args:
             param1 (Cn1Mqtt): The mqtt connection object.
-            param2 (str): The server configuration string.
+            param2 (Sn_config): The server configuration.
             param3 (str): The client configuration string.
             param4 (Sn_db): The database connection instance.
 
         """
-        # We extract the necessary data from the server XML file using our custom element extraction function.
-        networkName = self.find_xml_element(server_xml_config,"<networkName>")
-        serverID = self.find_xml_element(server_xml_config, "<serverID>")
-        country = self.find_xml_element(server_xml_config, "<country>")
-        districtState = self.find_xml_element(server_xml_config, "<districtState>")
-        city = self.find_xml_element(server_xml_config, "<city>")
-        areaDescription = self.find_xml_element(server_xml_config, "<areaDescription>")
-        area = self.find_xml_element(server_xml_config, "<area>")
-        building = self.find_xml_element(server_xml_config, "<building>")
-        room = self.find_xml_element(server_xml_config, "<room>")
-        serverIP = self.find_xml_element(server_xml_config, "<IPAddress>")
-
-        # The server forms the $SYS topics using Server's xml file data.
-        sys_local_time_topic = "$SYS/" + networkName + "/" + serverID + "/" + country\
-                               + "/" + districtState + "/" + city + "/" + areaDescription\
-                               + "/" + area + "/" + building + "/" + room + "/localDateTime";
-        sys_server_status_topic = "$SYS/" + networkName + "/" + serverID + "/" + country\
-                                  + "/" + districtState + "/" + city + "/" + areaDescription\
-                                  + "/" + area + "/" + building + "/" + room + "/" + serverID + "/status";
-        sys_network_status_topic = "$SYS/" + networkName + "/" + serverID + "/" + country\
-                                   + "/" + districtState + "/" + city + "/" + areaDescription\
-                                   + "/" + area + "/" + building + "/" + room + "/networkStatus";
-        sys_server_ip_topic = "$SYS/" + networkName + "/" + serverID + "/" + country\
-                              + "/" + districtState + "/" + city + "/" + areaDescription\
-                              + "/" + area + "/" + building + "/" + room + "/ipAddress";
-        sys_num_connected_nodes_topic = "$SYS/" + networkName + "/" + serverID + "/" + country\
-                                        + "/" + districtState + "/" + city + "/" + areaDescription\
-                                        + "/" + area + "/" + building + "/" + room + "/numOfConnectedNodes";
+        # The $SYS topics and the data that is published to them.
+        sys_topics = self.find_sys_topics(server_config, client_xml_config)
+
+        # The status and the number of active nodes are read from the registry.
+        node = self.lookup_nodes(db_connection, [sys_topics['clientID']]).get(sys_topics['clientID'])
+        payloads = {'network_status': "active", 'local_time': self.get_local_time(),
+                    'server_ip': sys_topics['serverIP'], 'server_status': "active",
+                    'client_ip': sys_topics['clientIP'],
+                    'client_status': node.status if node is not None else None,
+                    'num_connected_nodes': self.registry.active_count()}
+
+        # SN publishes data to all $SYS topics.
+        messages = [(delay, sys_topics[name], payloads[name]) for name, delay in SYS_PUBLISH_DELAYS]
+        self.publish_later(mqtt, messages)
+
+
+    def publish_later(self,mqtt,messages):
+        """publish_later function. This function publishes the first message of a list after its delay
+        on a timer thread, and then the rest of the list the same way.
+        Args:
+            param1 (SnMqtt): The mqtt connection instance.
+            param2 (list): A list of (delay, topic, payload) tuples.
+        """
 
+        if(not messages):
+            return
+        timer = threading.Timer(messages[0][0], self.publish_next, args=(mqtt, messages))
+        # A timer must not keep the program alive on exit.
+        timer.daemon = True
+        timer.start()
+
+
+    def publish_next(self,mqtt,messages):
+        """publish_next function. This function is run by the timer, it publishes the first message
+        of a list and schedules the rest.
+        Args:
+            param1 (SnMqtt): The mqtt connection instance.
+            param2 (list): A list of (delay, topic, payload) tuples.
+        """
+
+        delay, topic, payload = messages[0]
+        mqtt.publish(topic=topic, payload=payload, qos=1, retain=False)
+        self.publish_later(mqtt, messages[1:])
+
+
+    def find_sys_topics(self,server_config,client_xml_config):
+        """find_sys_topics function. In this function, the program acquires data
+        from the client XML file and forms the $SYS topics of the client. The $SYS topics
+        of the server are formed once, by the server configuration.
+        It returns a dictionary with the topics, the server IP and the client ID and IP.
+
+        Args:
+            param1 (Sn_config): The server configuration.
+            param2 (str): The client configuration string.
+
+        """
 
         # We extract the necessary data from the client XML file using our custom element extraction function.
         clientID = self.find_xml_element(client_xml_config, "<ID>")
         clientIP = self.find_xml_element(client_xml_config, "<IPAddress>")
 
-        # The server forms the $SYS topics using Client's xml file data.
-        sys_client_ip_topic = "$SYS/" + networkName + "/" + serverID + "/" + country\
-                              + "/" + districtState + "/" + city + "/" + areaDescription\
-                              + "/" + area + "/" + building + "/" + room + "/" + clientID + "/ipAddress";
-        sys_client_status_topic = "$SYS/" + networkName + "/" + serverID + "/" + country\
-                                  + "/" + districtState + "/" + city + "/" + areaDescription\
-                                  + "/" + area + "/" + building + "/" + room + "/" + clientID + "/status";
-
-        # SN publishes data to all $SYS topics.
-        mqtt.publish(topic=sys_network_status_topic, payload="active", qos=1, retain=False)
-        time.sleep(0.2)
-        mqtt.publish(topic=sys_local_time_topic, payload=self.get_local_time(), qos=1, retain=False)
-        time.sleep(1)
-        mqtt.publish(topic=sys_server_ip_topic, payload=serverIP, qos=1, retain=False)
-        time.sleep(0.2)
-        mqtt.publish(topic=sys_server_status_topic, payload="active", qos=1, retain=False)
-        time.sleep(0.2)
-        mqtt.publish(topic=sys_client_ip_topic, payload=clientIP, qos=1, retain=False)
-        time.sleep(0.2)
-        mqtt.publish(topic=sys_client_status_topic,
-                     payload=db_connection.get_node_status(clientID), qos=1, retain=False)
-        time.sleep(0.2)
-        mqtt.publish(topic=sys_num_connected_nodes_topic,
-                     payload=db_connection.get_active_nodes_count(), qos=1, retain=False)
+        # The server $SYS topics are copied, the client topics are the server prefix and the client id.
+        sys_topics = dict(server_config.sys_topics)
+        sys_topics['client_ip'] = server_config.client_topic(clientID, SYS_CLIENT_IP_SUFFIX)
+        sys_topics['client_status'] = server_config.client_topic(clientID, SYS_CLIENT_STATUS_SUFFIX)
+        sys_topics['serverIP'] = server_config.ip_address
+        sys_topics['clientID'] = clientID
+        sys_topics['clientIP'] = clientIP
+        return sys_topics
 
 
     def find_xml_element(self,xml_string,element):
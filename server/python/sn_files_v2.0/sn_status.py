@@ -0,0 +1,133 @@
+"""
+    File name: sn_status.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the status report of the server is constructed. The counters of the buffer, the pools,
+the schedulers, the writers, the spool, the caches and the other parts of the server are collected
+every STATUS_INTERVAL seconds and published as one JSON message to the stats $SYS topic of the server.
+
+
+Todo :
+	*
+"""
+
+import json
+import threading
+import traceback
+from sn_thread import Sn_thread
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# Seconds between two status reports.
+STATUS_INTERVAL = 60
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_status:
+    ''' Base class for the status report. It contains the parts of the server that keep counters
+        and the thread that publishes their counters.
+    '''
+
+    def __init__(self,publish,interval=STATUS_INTERVAL):
+        """__init__ function. This function creates the report thread.
+        Args:
+            param1 (function): The function that publishes the report, it is called with the JSON text.
+            param2 (float): Seconds between two reports.
+        """
+
+        self.publish = publish
+        self.interval = interval
+        # A list of (name, part) pairs, every part has a get_stats function.
+        self.sources = []
+        self.running = True
+        self.cond = threading.Condition()
+        # The number of published reports.
+        self.reports = 0
+
+        self.thread = Sn_thread(id="status", callback=self.run)
+        self.thread.daemon = True
+
+
+    def add(self,name,source):
+        """add function. This function adds a part of the server to the report.
+        A part that is not created or that keeps no counters is left out.
+        Args:
+            param1 (str): The name of the part in the report.
+            param2 (obj): The part, an object with a get_stats function.
+        """
+
+        if(source is not None and hasattr(source, "get_stats")):
+            self.sources.append((name, source))
+
+
+    def collect(self):
+        """collect function. This function returns the counters of every part in a dictionary.
+        A part that fails is left out, the report of the others is still published.
+        """
+
+        stats = {}
+        for name, source in self.sources:
+            try:
+                stats[name] = source.get_stats()
+            except Exception:
+                traceback.print_exc()
+        return stats
+
+
+    def payload(self):
+        """payload function. This function returns the report in JSON form.
+        """
+
+        # A value that is not a JSON type is written as text.
+        return json.dumps(self.collect(), sort_keys=True, default=str)
+
+
+    def report(self):
+        """report function. This function publishes one report.
+        """
+
+        self.publish(self.payload())
+        self.reports += 1
+
+
+    def start(self):
+        """start function. This function starts the report thread.
+        """
+
+        self.thread.start()
+
+
+    def run(self,id,data):
+        """run function. This is the loop of the report thread.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            with self.cond:
+                if(self.running):
+                    self.cond.wait(self.interval)
+                if(not self.running):
+                    return
+            try:
+                self.report()
+            except Exception:
+                # A failing report must not stop the thread.
+                traceback.print_exc()
+
+
+    def close(self):
+        """close function. This function stops the report thread.
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if(self.thread.is_alive()):
+            self.thread.join()
@@ -0,0 +1,212 @@
+"""
+    File name: sn_writeback.py
+    Author: Georgios Vrettos
+    Date created: 17/5/2018
+    Date last modified: 17/5/2018
+    Python Version: 2.7
+
+In this module, the write-behind writer of the nodes table is constructed. The changes of the
+severity mode, the status and the connection time of the nodes are not written one by one.
+They are kept per node, a later value of a column replaces the earlier one, and every
+NODE_FLUSH_INTERVAL seconds all of them are written with one UPDATE statement in one
+transaction. If the database is unavailable, or older writes still wait in the spool,
+the changes are appended to the spool. The pending changes are written when the writer closes.
+
+
+Todo :
+	*
+"""
+
+import collections
+import threading
+import traceback
+from sn_thread import Sn_thread
+from sn_db import Sn_db
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The columns of the nodes table that are written behind, in the order of the update_nodes parameters.
+NODE_UPDATE_COLUMNS = ("sev_mode", "last_connected", "node_status")
+# The maximum time in seconds that a change waits before it is written.
+NODE_FLUSH_INTERVAL = 0.5
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Sn_node_updates:
+    ''' Base class for the pending node changes. It contains the last value
+        of every changed column of every node.
+    '''
+
+    def __init__(self):
+        """__init__ function. This function creates an empty set of changes.
+        """
+
+        # A dictionary with the node id as key and a dictionary of the changed columns as value.
+        self.pending = collections.OrderedDict()
+        self.cond = threading.Condition()
+
+        # Change counters.
+        self.changes = 0
+        self.coalesced = 0
+        self.nodes_written = 0
+        self.nodes_spooled = 0
+        self.flushes = 0
+
+
+    def set(self,node_id,column,value):
+        """set function. This function changes a column of a node.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The column name, one of NODE_UPDATE_COLUMNS.
+            param3 (str): The value.
+        """
+
+        if(column not in NODE_UPDATE_COLUMNS):
+            raise ValueError("Column " + column + " cannot be updated.")
+        with self.cond:
+            columns = self.pending.get(node_id)
+            if(columns is None):
+                columns = self.pending[node_id] = {}
+                if(len(self.pending) == 1):
+                    # The writer is woken up to start counting the interval.
+                    self.cond.notify_all()
+            if(column in columns):
+                self.coalesced += 1
+            columns[column] = value
+            self.changes += 1
+
+
+    def discard(self,node_id,column):
+        """discard function. This function drops the pending change of a column of a node.
+        It is used when a newer value is written to the database directly.
+        Args:
+            param1 (str): The node id.
+            param2 (str): The column name.
+        """
+
+        with self.cond:
+            columns = self.pending.get(node_id)
+            if(columns is not None):
+                columns.pop(column, None)
+                if(not columns):
+                    del self.pending[node_id]
+
+
+    def take(self):
+        """take function. This function removes every pending change and returns the changes
+        as the parameters of the update_nodes statement: a list of node ids and a list of values
+        for every column of NODE_UPDATE_COLUMNS, None for the columns that did not change.
+        """
+
+        with self.cond:
+            pending = self.pending
+            self.pending = collections.OrderedDict()
+
+        params = ([],) + tuple([] for column in NODE_UPDATE_COLUMNS)
+        for node_id, columns in pending.items():
+            params[0].append(node_id)
+            for i, column in enumerate(NODE_UPDATE_COLUMNS):
+                value = columns.get(column)
+                # The values are sent as text, the statement casts them to the column types.
+                params[i + 1].append(None if value is None else str(value))
+        return params
+
+
+    def get_stats(self):
+        """get_stats function. This function returns the change counters in a dictionary.
+        """
+
+        with self.cond:
+            return {'pending': len(self.pending), 'changes': self.changes, 'coalesced': self.coalesced,
+                    'nodes_written': self.nodes_written, 'nodes_spooled': self.nodes_spooled,
+                    'flushes': self.flushes}
+
+
+class Sn_node_writer(Sn_node_updates):
+    ''' The write-behind writer of the nodes table. It contains the pending node changes
+        and the thread that writes them to the database.
+    '''
+
+    def __init__(self,spool,interval=NODE_FLUSH_INTERVAL):
+        """__init__ function. This function creates the writer and starts the writer thread.
+        Args:
+            param1 (Sn_spool): The spool that takes the changes that cannot be written.
+            param2 (float): The maximum time in seconds that a change waits.
+        """
+
+        Sn_node_updates.__init__(self)
+        self.spool = spool
+        self.interval = interval
+        self.running = True
+
+        self.thread = Sn_thread(id="node_writer", callback=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def run(self,id,data):
+        """run function. This is the loop of the writer thread. The thread sleeps until a change
+        arrives and then waits for the interval, so the changes of the interval are written together.
+        Args:
+            param1 (str): Thread id.
+            param2 (obj): Not used.
+        """
+
+        while(True):
+            with self.cond:
+                while(self.running and not self.pending):
+                    self.cond.wait()
+                if(self.running):
+                    self.cond.wait(self.interval)
+                if(not self.pending):
+                    if(self.running):
+                        # The pending changes were discarded while waiting.
+                        continue
+                    # The writer is stopped and nothing is left to write.
+                    return
+            self.flush(self.take())
+
+
+    def flush(self,params):
+        """flush function. This function writes the changes to the database.
+        Args:
+            param1 (tuple): The parameters of the update_nodes statement.
+        """
+
+        count = len(params[0])
+        if(self.spool.has_data() or not Sn_db.breaker.allow()):
+            # Older writes wait in the spool or the database is unavailable.
+            self.spool.append_nodes(params)
+            self.nodes_spooled += count
+            return
+
+        db = Sn_db()
+        db.connect_db()
+        try:
+            if(db.conn == ""):
+                raise RuntimeError("No database connection.")
+            db.update_nodes(params)
+            Sn_db.breaker.success()
+            self.nodes_written += count
+        except Exception:
+            traceback.print_exc()
+            Sn_db.breaker.failure()
+            # The changes are kept in the spool and they are written when the database recovers.
+            self.spool.append_nodes(params)
+            self.nodes_spooled += count
+        finally:
+            db.disconnect_db()
+        self.flushes += 1
+
+
+    def close(self):
+        """close function. This function stops the writer thread after every pending change is written.
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if(self.thread.is_alive()):
+            self.thread.join()
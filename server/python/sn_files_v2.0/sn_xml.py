@@ -0,0 +1,223 @@
+"""
+    File name: sn_xml.py
+    Author: Georgios Vrettos
+    Date created: 13/5/2018
+    Date last modified: 14/5/2018
+    Python Version: 2.7
+
+In this module, the streaming converter of the node configuration files is constructed.
+The XML is read once by the expat parser, the parser of xmltodict and of the iterparse function
+of ElementTree, without building elements. Every element is written as JSON text when it ends,
+so only the open elements are kept and the document tree or the dictionary tree of xmltodict
+is never built. The XML is given to the parser in chunks, so the parser does not copy all of it. The JSON text is the same
+as the text of json.dumps(xmltodict.parse(xml)): the attributes are written with the "@"
+prefix, the text of an element with children or attributes with the "#text" key and the
+repeated children as lists. In the same pass, the node id, IP address, network, server id,
+location and sensors of the node are collected in a typed summary.
+
+
+Todo :
+	*
+"""
+
+from json.encoder import encode_basestring_ascii as quote
+from xml.parsers import expat
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The number of bytes that are given to the parser at once, the parser buffers only one chunk.
+PARSE_CHUNK_SIZE = 16384
+# The location elements of a node configuration, in the order of the topic words.
+LOCATION_FIELDS = ("country", "districtState", "city", "areaDescription", "area", "building", "room")
+
+# The paths of the summary values under the root element.
+ID_PATH = ("nodeInfo", "ID")
+IP_PATH = ("nodeInfo", "networkSetup", "IPAddress")
+NETWORK_PATH = ("nodeInfo", "networkSetup", "networkName")
+SERVER_ID_PATH = ("nodeInfo", "networkSetup", "serverID")
+LOCATION_PATH = ("nodeLocation",)
+SENSOR_PATH = ("nodeInfo", "hardwareSetup", "sensors", "sensor")
+
+# The summary attribute of every summary path. The sensor paths set an attribute of the last sensor.
+SUMMARY_PATHS = dict([(ID_PATH, "node_id"), (IP_PATH, "ip_address"), (NETWORK_PATH, "network"),
+                      (SERVER_ID_PATH, "server_id")] +
+                     [(LOCATION_PATH + (field,), i) for i, field in enumerate(LOCATION_FIELDS)])
+SENSOR_PATHS = {SENSOR_PATH + ("dataName",): "name", SENSOR_PATH + ("type",): "model",
+                SENSOR_PATH + ("dataType",): "data_type",
+                SENSOR_PATH + ("dataRange", "minValue"): "min_value",
+                SENSOR_PATH + ("dataRange", "maxValue"): "max_value"}
+
+# --------------------------------------------------------------------------------------------------
+
+class Sn_sensor_summary(object):
+    ''' A sensor of a node configuration.
+    '''
+
+    __slots__ = ("name", "model", "data_type", "min_value", "max_value")
+
+    def __init__(self):
+        """__init__ function. This function creates an empty sensor summary.
+        """
+
+        self.name = None
+        self.model = None
+        self.data_type = None
+        self.min_value = None
+        self.max_value = None
+
+
+class Sn_config_summary(object):
+    ''' The values of a node configuration that the server uses.
+        The location is a tuple with the values of LOCATION_FIELDS.
+    '''
+
+    __slots__ = ("node_id", "ip_address", "network", "server_id", "location", "sensors")
+
+    def __init__(self):
+        """__init__ function. This function creates an empty configuration summary.
+        """
+
+        self.node_id = None
+        self.ip_address = None
+        self.network = None
+        self.server_id = None
+        self.location = (None,) * len(LOCATION_FIELDS)
+        self.sensors = []
+
+
+def json_object(entries):
+    """json_object function. This function writes a JSON object from (key, JSON text) entries.
+    Args:
+        param1 (list): The entries of the object.
+    """
+
+    return "{" + ", ".join([quote(key) + ": " + value for key, value in entries]) + "}"
+
+
+def collect_summary(summary,path,text):
+    """collect_summary function. This function keeps the text of an element
+    in the summary, if the element is one of the summary values.
+    Args:
+        param1 (Sn_config_summary): The summary.
+        param2 (tuple): The path of the element under the root element.
+        param3 (str): The text of the element, or None.
+    """
+
+    field = SUMMARY_PATHS.get(path)
+    if(field is None):
+        field = SENSOR_PATHS.get(path)
+        if(field is not None and summary.sensors):
+            setattr(summary.sensors[-1], field, text)
+    elif(isinstance(field, int)):
+        # The location values are kept in the order of LOCATION_FIELDS.
+        location = list(summary.location)
+        location[field] = text
+        summary.location = tuple(location)
+    else:
+        setattr(summary, field, text)
+
+
+class Sn_xml_converter(object):
+    ''' Base class for the streaming converter. It contains the open elements,
+        the summary and the JSON text of the document when the parsing ends.
+    '''
+
+    def __init__(self):
+        """__init__ function. This function creates a converter for one document.
+        """
+
+        self.summary = Sn_config_summary()
+        # For every open element: its name, its attribute entries, its children JSON texts by name,
+        # the order of the children names and its text parts.
+        self.frames = []
+        # The path of every open element under the root element, the root is not part of it.
+        self.paths = [()]
+        self.document = None
+
+
+    def start_element(self,name,attributes):
+        """start_element function. This function is called by the parser when an element starts.
+        Args:
+            param1 (str): The element name, with its prefix.
+            param2 (list): The attribute names and values, in the order of the document.
+        """
+
+        if(attributes):
+            attributes = [("@" + attributes[i], quote(attributes[i + 1])) for i in range(0, len(attributes), 2)]
+        self.frames.append((name, attributes, {}, [], []))
+        if(len(self.frames) > 1):
+            path = self.paths[-1] + (name.split(":")[-1],)
+            if(path == SENSOR_PATH):
+                # The values of the sensor are collected when its children end.
+                self.summary.sensors.append(Sn_sensor_summary())
+            self.paths.append(path)
+
+
+    def character_data(self,text):
+        """character_data function. This function is called by the parser with the text of the open element.
+        Args:
+            param1 (str): The text.
+        """
+
+        self.frames[-1][4].append(text)
+
+
+    def end_element(self,name):
+        """end_element function. This function is called by the parser when an element ends.
+        The element is written as JSON text and added to the children of its parent.
+        Args:
+            param1 (str): The element name, with its prefix.
+        """
+
+        name, attributes, children, order, text = self.frames.pop()
+        # The text of an element is its own text and the text after every child.
+        text = "".join(text).strip() or None
+        if(self.frames):
+            collect_summary(self.summary, self.paths.pop(), text)
+
+        if(not attributes and not children):
+            value = "null" if text is None else quote(text)
+        else:
+            # Repeated children are written as a list, in the place of the first one.
+            entries = attributes + [(child, children[child][0] if len(children[child]) == 1
+                                     else "[" + ", ".join(children[child]) + "]") for child in order]
+            if(text is not None):
+                entries.append(("#text", quote(text)))
+            value = json_object(entries)
+
+        if(self.frames):
+            parent = self.frames[-1]
+            siblings = parent[2].get(name)
+            if(siblings is None):
+                parent[2][name] = [value]
+                parent[3].append(name)
+            else:
+                siblings.append(value)
+        else:
+            self.document = json_object([(name, value)])
+
+
+def convert(xml_str):
+    """convert function. This function converts a node configuration from XML to JSON
+    in one pass. It returns the JSON text and the configuration summary.
+    Args:
+        param1 (str): The node configuration in XML form.
+    """
+
+    converter = Sn_xml_converter()
+    # Like xmltodict, the names keep their prefixes and the namespace declarations are attributes.
+    parser = expat.ParserCreate()
+    parser.ordered_attributes = True
+    parser.buffer_text = True
+    parser.StartElementHandler = converter.start_element
+    parser.EndElementHandler = converter.end_element
+    parser.CharacterDataHandler = converter.character_data
+    for start in range(0, len(xml_str), PARSE_CHUNK_SIZE):
+        chunk = xml_str[start:start + PARSE_CHUNK_SIZE]
+        if(not isinstance(chunk, bytes)):
+            # Every chunk is encoded on its own, the whole XML is not copied.
+            chunk = chunk.encode("utf-8")
+        parser.Parse(chunk, False)
+    parser.Parse(b"", True)
+    return converter.document, converter.summary
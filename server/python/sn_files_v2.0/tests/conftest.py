@@ -0,0 +1,20 @@
+"""
+    File name: conftest.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the server modules are made importable by the tests, the tests are run
+with pytest from the server directory or from this one.
+
+
+Todo :
+	*
+"""
+
+import os
+import sys
+
+# The server modules are in the parent directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
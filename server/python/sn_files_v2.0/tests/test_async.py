@@ -0,0 +1,290 @@
+"""
+    File name: test_async.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 3.7
+
+In this module, the asyncio runtime is tested without a broker and a database: on shutdown
+the dispatcher handles every queued message and the writer tasks write everything they hold,
+also the changes that arrive while a flush is running, and a batch that cannot be written goes to
+the spool. The server starts when the database is unavailable and connects to it later.
+The control messages of a node run in order.
+
+
+Todo :
+	*
+"""
+
+import asyncio
+import time
+import pytest
+
+pytest.importorskip("asyncpg")
+
+import sn_async
+from sn_async import AsyncActiveMode
+from sn_record import Sn_message, Sn_reading
+from sn_rollup import Sn_rollup_windows
+from sn_router import Sn_router
+from sn_writeback import Sn_node_updates
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# Seconds that every statement of the fake database takes.
+STATEMENT_TIME = 0.05
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Fake_transaction:
+    ''' A transaction of the fake database.
+    '''
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,*exc_info):
+        return False
+
+
+class Fake_pool:
+    ''' An asyncpg pool that keeps the executed statements. It is its own connection.
+    '''
+
+    def __init__(self):
+        self.executed = []
+        self.copies = []
+
+    async def execute(self,query,*params):
+        await asyncio.sleep(STATEMENT_TIME)
+        self.executed.append((query, params))
+
+    async def copy_to_table(self,table,source,columns,format):
+        await asyncio.sleep(STATEMENT_TIME)
+        self.copies.append((table, source.read().decode("utf-8")))
+
+    def acquire(self):
+        return self
+
+    def transaction(self):
+        return Fake_transaction()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,*exc_info):
+        return False
+
+
+class Fake_spool:
+    ''' A spool without data, it keeps the appended batches.
+    '''
+
+    def __init__(self):
+        self.batches = []
+
+    def has_data(self):
+        return False
+
+    def append_rows(self,batch):
+        self.batches.append(batch)
+
+
+class Fake_mqtt:
+    ''' An MQTT client with a socket that is always read.
+    '''
+
+    def resume_reading(self):
+        pass
+
+
+def active_mode():
+    """active_mode function. This function returns an active mode with fake connections.
+    """
+
+    mode = AsyncActiveMode.__new__(AsyncActiveMode)
+    mode.db = Fake_pool()
+    mode.spool = Fake_spool()
+    mode.node_writer = Sn_node_updates()
+    mode.rollup = Sn_rollup_windows()
+    mode.stopping = asyncio.Event()
+    return mode
+
+
+def test_node_writer_drains(monkeypatch):
+    monkeypatch.setattr(sn_async, "NODE_FLUSH_INTERVAL", 0.01)
+
+    async def run():
+        mode = active_mode()
+        mode.node_writer.set("CN1", "sev_mode", "warningMode")
+        writer = asyncio.get_running_loop().create_task(mode.node_writer_async())
+        # The first flush is running when the next change arrives and the server stops.
+        await asyncio.sleep(0.02)
+        mode.node_writer.set("CN2", "sev_mode", "dangerMode")
+        mode.stopping.set()
+        await writer
+        return [params[0] for query, params in mode.db.executed]
+
+    assert asyncio.run(run()) == [["CN1"], ["CN2"]]
+
+
+def test_rollup_writer_drains(monkeypatch):
+    monkeypatch.setattr(sn_async, "ROLLUP_FLUSH_INTERVAL", 0.01)
+
+    async def run():
+        mode = active_mode()
+        writer = asyncio.get_running_loop().create_task(mode.rollup_writer_async())
+        await asyncio.sleep(0.02)
+        # The window is open when the server stops.
+        mode.rollup.add(Sn_reading("CN1", "temperature", 21.5, time.time(), "0-70", "float"))
+        mode.stopping.set()
+        await writer
+        return mode
+
+    mode = asyncio.run(run())
+    assert sorted([params[0] for query, params in mode.db.executed]) == [["CN1"], ["CN1"]]
+    assert mode.rollup.get_stats()['open'] == 0
+    assert mode.rollup.get_stats()['windows_written'] == 2
+
+
+def test_batch_writer_drains(monkeypatch):
+    monkeypatch.setattr(sn_async.Sn_db, "breaker", sn_async.sn_db.Sn_breaker())
+
+    async def run():
+        mode = active_mode()
+        mode.rows = asyncio.Queue()
+        for i in range(10):
+            mode.rows.put_nowait(Sn_reading("CN1", "temperature", float(i), time.time(), "0-70", "float"))
+        # The writer stops after the readings before None are written.
+        mode.rows.put_nowait(None)
+        await mode.writer_async()
+        return mode
+
+    mode = asyncio.run(run())
+    assert [table for table, text in mode.db.copies] == ["temperature"]
+    assert [line.split("\t")[1] for line in mode.db.copies[0][1].splitlines()] == [str(float(i)) for i in range(10)]
+    assert [params for query, params in mode.db.executed] == [(["CN1"], ["temperature"], ["float"], ["0-70"])]
+    assert mode.spool.batches == []
+
+
+def test_failed_batch_spooled(monkeypatch):
+    monkeypatch.setattr(sn_async.Sn_db, "breaker", sn_async.sn_db.Sn_breaker())
+
+    async def copy_to_table(table,source,columns,format):
+        raise OSError("connection lost")
+
+    async def run():
+        mode = active_mode()
+        mode.db.copy_to_table = copy_to_table
+        await mode.flush_async({"temperature": [Sn_reading("CN1", "temperature", 21.5, time.time(), "0-70",
+                                                           "float")]})
+        return mode
+
+    mode = asyncio.run(run())
+    # The batch that cannot be written is kept in the spool.
+    assert [list(batch) for batch in mode.spool.batches] == [["temperature"]]
+    assert sn_async.Sn_db.breaker.failures == 1
+
+
+def test_dispatcher_drains():
+    handled = []
+
+    async def handler(route,payload,received):
+        await asyncio.sleep(0)
+        handled.append(payload)
+
+    async def run():
+        mode = active_mode()
+        mode.mqtt = Fake_mqtt()
+        mode.router = Sn_router()
+        mode.router.add("sensor_network/+/room/+", handler)
+        mode.ingest = asyncio.Queue()
+        for i in range(100):
+            mode.ingest.put_nowait(Sn_message("sensor_network/CN1/room/TemperatureSensor", i, time.time()))
+        # The dispatcher stops after the messages before None are handled.
+        mode.ingest.put_nowait(None)
+        await mode.check_buffer_async()
+
+    asyncio.run(run())
+    assert handled == list(range(100))
+
+
+def test_database_unavailable(monkeypatch):
+    async def create_pool(**kwargs):
+        raise OSError("Connect call failed")
+
+    monkeypatch.setattr(sn_async.asyncpg, "create_pool", create_pool)
+    monkeypatch.setattr(sn_async.Sn_db, "breaker", sn_async.sn_db.Sn_breaker())
+
+    async def run():
+        mode = active_mode()
+        mode.db = None
+        connected = await mode.connect_db_async()
+        # The writes go to the spool until the database is connected.
+        return connected, mode.spool_required()
+
+    assert asyncio.run(run()) == (False, True)
+
+
+def test_database_connected(monkeypatch):
+    pool = Fake_pool()
+
+    async def create_pool(**kwargs):
+        return pool
+
+    monkeypatch.setattr(sn_async.asyncpg, "create_pool", create_pool)
+    monkeypatch.setattr(sn_async.Sn_db, "breaker", sn_async.sn_db.Sn_breaker())
+    monkeypatch.setattr(sn_async, "DB_RECONNECT_DELAY", 0.01)
+
+    async def run():
+        mode = active_mode()
+        mode.db = None
+        reloaded = []
+
+        async def reload_nodes_async():
+            reloaded.append(True)
+
+        mode.reload_nodes_async = reload_nodes_async
+        await mode.connector_async()
+        return mode, reloaded
+
+    mode, reloaded = asyncio.run(run())
+    # The schema changes are applied and the nodes are loaded again.
+    assert mode.db is pool
+    assert [query for query, params in pool.executed] == sn_async.MIGRATIONS
+    assert reloaded == [True]
+    assert not mode.spool_required()
+
+
+def test_sessions_in_node_order():
+    events = []
+
+    async def handle_control_async(route,payload):
+        events.append(("start", route.node_id, payload))
+        # The registration takes longer than the severity mode change.
+        await asyncio.sleep(0.05 if payload == "PUB_CONFIG_FILE" else 0)
+        events.append(("end", route.node_id, payload))
+
+    async def run():
+        mode = active_mode()
+        mode.handle_control_async = handle_control_async
+        mode.sessions = set()
+        mode.session_lanes = {}
+        router = Sn_router()
+        for node_id in ("CN1", "CN2"):
+            route = router.route("sensor_network/" + node_id + "/room/control")
+            await mode.start_session_async(route, b"PUB_CONFIG_FILE", time.time())
+            await mode.start_session_async(route, b"PUB_CN_SEVERITY_MODE", time.time())
+        await asyncio.wait(mode.sessions)
+        return mode
+
+    mode = asyncio.run(run())
+    for node_id in ("CN1", "CN2"):
+        assert [(kind, payload) for kind, node, payload in events if node == node_id] == [
+            ("start", "PUB_CONFIG_FILE"), ("end", "PUB_CONFIG_FILE"),
+            ("start", "PUB_CN_SEVERITY_MODE"), ("end", "PUB_CN_SEVERITY_MODE")]
+    # The sessions of the two nodes run at the same time.
+    assert events[:2] == [("start", "CN1", "PUB_CONFIG_FILE"), ("start", "CN2", "PUB_CONFIG_FILE")]
+    assert mode.session_lanes == {}
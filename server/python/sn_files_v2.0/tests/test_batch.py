@@ -0,0 +1,159 @@
+"""
+    File name: test_batch.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the batch writer is tested: the readings are written with one COPY per batch,
+a batch that cannot be written goes to the spool, every batch after it goes to the spool too until
+the replay catches up, and the writes go to the database again in the order the readings arrived.
+
+
+Todo :
+	*
+"""
+
+import time
+import pytest
+import sn_batch
+import sn_spool
+from sn_db import Sn_breaker, SENSOR_SPEC_TABLE
+from sn_batch import Sn_batch_writer
+from sn_record import Sn_reading
+from sn_spool import Sn_spool
+
+
+class Fake_db:
+    ''' A database connection that keeps the written rows, the writes fail while failing is set.
+    '''
+
+    breaker = Sn_breaker()
+    # The batches that were written, every row as a list of its column values.
+    written = []
+    failing = False
+    connections = 0
+
+    def __init__(self):
+        self.conn = ""
+
+    def connect_db(self):
+        Fake_db.connections += 1
+        self.conn = "connection"
+
+    def disconnect_db(self):
+        self.conn = ""
+
+    def copy_client_data(self,batch):
+        if(Fake_db.failing):
+            raise RuntimeError("server closed the connection unexpectedly")
+        Fake_db.written.append(dict((table, [list(row) for row in rows]) for table, rows in batch.items()))
+
+
+@pytest.fixture
+def spool(tmp_path,monkeypatch):
+    monkeypatch.setattr(Fake_db, "breaker", Sn_breaker())
+    monkeypatch.setattr(Fake_db, "written", [])
+    monkeypatch.setattr(Fake_db, "failing", False)
+    monkeypatch.setattr(Fake_db, "connections", 0)
+    monkeypatch.setattr(sn_batch, "Sn_db", Fake_db)
+    monkeypatch.setattr(sn_spool, "Sn_db", Fake_db)
+    # The replay is run by the tests, the replay thread must not start it.
+    monkeypatch.setattr(sn_spool, "SPOOL_REPLAY_INTERVAL", 3600)
+    monkeypatch.setattr(sn_batch, "BATCH_MAX_DELAY", 0.05)
+    return Sn_spool(str(tmp_path / "spool"))
+
+
+def reading(node_id,value,kind="temperature",data_range="0-70"):
+    return Sn_reading(node_id, kind, value, time.time(), data_range, "float")
+
+
+def wait_flushes(writer,count):
+    """wait_flushes function. This function waits until the writer has handled count batches.
+    Args:
+        param1 (Sn_batch_writer): The writer.
+        param2 (int): The number of batches.
+    """
+
+    deadline = time.time() + 5
+    while(writer.rows_written + writer.rows_spooled < count and time.time() < deadline):
+        time.sleep(0.01)
+    assert writer.rows_written + writer.rows_spooled == count
+
+
+def values(batches,table="temperature"):
+    return [row[1] for batch in batches for row in batch.get(table, [])]
+
+
+def test_batch_written(spool):
+    writer = Sn_batch_writer(spool)
+    writer.add(reading("CN1", 20.5))
+    writer.add(reading("CN1", 21.0))
+    writer.add(reading("CN2", 40.0, "humidity"))
+    writer.close()
+
+    # The pending rows are written when the writer is closed.
+    assert values(Fake_db.written) == [20.5, 21.0]
+    assert values(Fake_db.written, "humidity") == [40.0]
+    assert writer.rows_written == 3
+    assert not spool.has_data()
+
+
+def test_delayed_flush(spool):
+    writer = Sn_batch_writer(spool)
+    writer.add(reading("CN1", 20.5))
+    # A batch that is not full is written after the maximum delay.
+    wait_flushes(writer, 1)
+    assert values(Fake_db.written) == [20.5]
+    assert writer.get_stats()['pending'] == 0
+    writer.close()
+
+
+def test_spec_changes(spool):
+    writer = Sn_batch_writer(spool)
+    writer.add(reading("CN1", 20.5))
+    writer.add(reading("CN1", 21.0))
+    writer.add(reading("CN1", 22.0, data_range="0-100"))
+    writer.close()
+
+    # A specification row is written only when the type or the range of a sensor changes.
+    specs = [row for batch in Fake_db.written for row in batch.get(SENSOR_SPEC_TABLE, [])]
+    assert specs == [["CN1", "temperature", "float", "0-70"], ["CN1", "temperature", "float", "0-100"]]
+    assert writer.get_stats()['spec_changes'] == 2
+
+
+def test_spool_handoff(spool):
+    writer = Sn_batch_writer(spool)
+    Fake_db.failing = True
+    writer.add(reading("CN1", 1.0))
+    wait_flushes(writer, 1)
+    assert writer.rows_spooled == 1
+    assert spool.has_data()
+
+    # The database is back, the new rows still go to the spool behind the older ones.
+    Fake_db.failing = False
+    writer.add(reading("CN1", 2.0))
+    wait_flushes(writer, 2)
+    assert writer.rows_spooled == 2
+    assert Fake_db.written == []
+
+    # The replay writes the spool in order and hands the writes back to the database.
+    spool.replay()
+    assert not spool.has_data()
+    writer.add(reading("CN1", 3.0))
+    writer.close()
+    assert writer.rows_written == 1
+    assert values(Fake_db.written) == [1.0, 2.0, 3.0]
+
+
+def test_open_breaker_spools(spool):
+    for i in range(Fake_db.breaker.max_failures):
+        Fake_db.breaker.failure()
+    writer = Sn_batch_writer(spool)
+    writer.add(reading("CN1", 20.5))
+    writer.close()
+
+    # The database is left alone while the breaker is open.
+    assert Fake_db.connections == 0
+    assert writer.rows_spooled == 1
+    assert spool.has_data()
@@ -0,0 +1,111 @@
+"""
+    File name: test_cache.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the configuration fingerprint cache is tested: a configuration that is saved for a node
+is found by its fingerprint, the invalid configurations are remembered up to the size of the cache,
+and a repeated invalid configuration is rejected without validating it again.
+
+
+Todo :
+	*
+"""
+
+from sn_cache import Sn_config_cache
+from sn_states import ActiveMode
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# A node configuration, it is not validated in these tests.
+XML_CONFIG = '<?xml version="1.0"?><nodeConfiguration><nodeId>CN1</nodeId></nodeConfiguration>'
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Fake_mqtt:
+    ''' An MQTT connection that keeps the published messages.
+    '''
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self,topic,payload=None,qos=0,retain=False):
+        self.published.append((topic, payload))
+
+
+class Fake_route:
+    ''' The parsed topic of a control message.
+    '''
+
+    def __init__(self,node_id):
+        self.node_id = node_id
+
+
+class Fake_message:
+    ''' A received control message.
+    '''
+
+    def __init__(self,topic,payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def test_fingerprint():
+    cache = Sn_config_cache()
+    assert cache.fingerprint(XML_CONFIG) == cache.fingerprint(XML_CONFIG.encode("utf-8"))
+    assert cache.fingerprint(XML_CONFIG) != cache.fingerprint(XML_CONFIG.replace("CN1", "CN2"))
+    assert len(cache.fingerprint(XML_CONFIG)) == 40
+
+
+def test_saved_configs():
+    cache = Sn_config_cache()
+    cache.seed([("CN1", "a"), ("CN2", "b")])
+    assert cache.is_saved("CN1", "a")
+    assert not cache.is_saved("CN1", "b")
+    assert not cache.is_saved("CN3", "a")
+
+    cache.remember("CN3", "c")
+    cache.forget("CN1")
+    assert cache.is_saved("CN3", "c")
+    assert not cache.is_saved("CN1", "a")
+
+    # The fingerprints of the nodes table replace the cached ones.
+    cache.replace([("CN2", "d")])
+    assert not cache.is_saved("CN3", "c")
+    assert cache.is_saved("CN2", "d")
+
+    stats = cache.get_stats()
+    assert (stats['nodes'], stats['hits'], stats['misses']) == (1, 3, 4)
+
+
+def test_invalid_configs():
+    cache = Sn_config_cache(negative_size=2)
+    cache.remember_invalid("a")
+    cache.remember_invalid("b")
+    assert cache.is_invalid("a")
+    # The least recently used fingerprint is removed first.
+    cache.remember_invalid("c")
+    assert not cache.is_invalid("b")
+    assert cache.is_invalid("a")
+    assert cache.is_invalid("c")
+    assert cache.get_stats()['negative_hits'] == 3
+
+
+def test_repeated_invalid_config():
+    mode = ActiveMode.__new__(ActiveMode)
+    mode.config_cache = Sn_config_cache()
+    validated = []
+    mode.validate_config_file = lambda config: validated.append(config) and False
+    mqtt = Fake_mqtt()
+    msg = Fake_message("sensor_network/CN1/control", "PUB_CONFIG_FILE " + XML_CONFIG)
+    mode.handle_control(mqtt, msg, Fake_route("CN1"))
+    mode.handle_control(mqtt, msg, Fake_route("CN1"))
+
+    # The configuration is validated once, both messages block the node.
+    assert validated == [XML_CONFIG]
+    assert [payload.split(",")[1].strip() for topic, payload in mqtt.published] == ["blocked", "blocked"]
+    assert mode.config_cache.get_stats()['negative_hits'] == 1
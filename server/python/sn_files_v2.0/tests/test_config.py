@@ -0,0 +1,71 @@
+"""
+    File name: test_config.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the server configuration model is tested: the values of the server configuration file
+are read once, and the subscription topics and the $SYS topics are formed from the network,
+the server id and the location of the server.
+
+
+Todo :
+	*
+"""
+
+import json
+import os
+from sn_config import Sn_config, SYS_CLIENT_IP_SUFFIX, SYS_CLIENT_STATUS_SUFFIX
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The server configuration file.
+SERVER_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "xml", "sn_config.xml")
+# The location words of the server in the configuration file.
+LOCATION = "Greece/Samos/Karlovasi/AegeanUniversityCampus/indoor/A/A52"
+# The $SYS prefix of the server.
+SYS_PREFIX = "$SYS/Karlovasi_IoT_network/SN/" + LOCATION + "/"
+
+# --------------------------------------------------------------------------------------------------
+
+
+def server_config():
+    with open(SERVER_CONFIG, "rb") as config_file:
+        return Sn_config(config_file.read().decode("utf-8"))
+
+
+def test_values():
+    config = server_config()
+    assert (config.node_id, config.server_id, config.network) == ("SN", "SN", "Karlovasi_IoT_network")
+    assert config.ip_address == "195.251.166.202"
+    assert "/".join(config.location) == LOCATION
+    assert json.loads(config.json)["nodeConfiguration"]["nodeInfo"]["ID"] == "SN"
+
+
+def test_topics():
+    config = server_config()
+    assert config.control_topic == "Karlovasi_IoT_network/+/" + LOCATION + "/control"
+    assert config.sensor_data_topic == "Karlovasi_IoT_network/+/" + LOCATION + "/+"
+    assert config.sys_topics == {'local_time': SYS_PREFIX + "localDateTime",
+                                 'server_status': SYS_PREFIX + "SN/status",
+                                 'server_stats': SYS_PREFIX + "SN/stats",
+                                 'network_status': SYS_PREFIX + "networkStatus",
+                                 'server_ip': SYS_PREFIX + "ipAddress",
+                                 'num_connected_nodes': SYS_PREFIX + "numOfConnectedNodes"}
+
+
+def test_client_topics():
+    config = server_config()
+    assert config.client_topic("CN1", SYS_CLIENT_IP_SUFFIX) == SYS_PREFIX + "CN1/ipAddress"
+    assert config.client_topic("CN1", SYS_CLIENT_STATUS_SUFFIX) == SYS_PREFIX + "CN1/status"
+
+
+def test_other_server():
+    with open(SERVER_CONFIG, "rb") as config_file:
+        xml = config_file.read().decode("utf-8")
+    config = Sn_config(xml.replace("<serverID>SN</serverID>", "<serverID>SN2</serverID>"))
+    # The topics of a second server of the network differ in the server id only.
+    assert config.sys_topics['server_status'] == "$SYS/Karlovasi_IoT_network/SN2/" + LOCATION + "/SN2/status"
+    assert config.control_topic == server_config().control_topic
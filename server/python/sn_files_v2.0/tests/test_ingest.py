@@ -0,0 +1,102 @@
+"""
+    File name: test_ingest.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the ingest loop is tested: the buffer thread sleeps until a message arrives,
+hands every batch over in order and returns when the buffer is closed and empty.
+
+
+Todo :
+	*
+"""
+
+import threading
+import time
+from sn_lanes import Sn_lanes
+from sn_states import ActiveMode, DRAIN_BATCH_SIZE
+
+
+class Fake_mqtt:
+    ''' An MQTT connection with the buffer of the server.
+    '''
+
+    def __init__(self):
+        self.buffer = Sn_lanes()
+
+
+class Fake_shards:
+    ''' The shard processes, they keep the dispatched batches.
+    '''
+
+    def __init__(self):
+        self.batches = []
+
+    def dispatch(self,batch):
+        self.batches.append(list(batch))
+
+
+def buffer_thread():
+    """buffer_thread function. This function starts the buffer loop of an active mode
+    that sends the batches to fake shards.
+    """
+
+    mode = ActiveMode.__new__(ActiveMode)
+    mode.mqtt = Fake_mqtt()
+    mode.shards = Fake_shards()
+    thread = threading.Thread(target=mode.check_buffer, args=("buffer", None))
+    thread.daemon = True
+    thread.start()
+    return mode, thread
+
+
+def test_consumer_waits():
+    lanes = Sn_lanes()
+    batches = []
+    thread = threading.Thread(target=lambda: batches.append(lanes.get_batch(10)))
+    thread.daemon = True
+    thread.start()
+    time.sleep(0.05)
+    # The reader sleeps on the empty buffer, it does not return an empty batch.
+    assert thread.is_alive()
+    assert batches == []
+
+    lanes.put("routine", "message")
+    thread.join(5)
+    assert not thread.is_alive()
+    assert batches == [["message"]]
+
+
+def test_buffer_thread_hands_over():
+    mode, thread = buffer_thread()
+    for i in range(5):
+        mode.mqtt.buffer.put("routine", i)
+    deadline = time.time() + 5
+    while(sum(len(batch) for batch in mode.shards.batches) < 5 and time.time() < deadline):
+        time.sleep(0.01)
+    assert [msg for batch in mode.shards.batches for msg in batch] == list(range(5))
+    assert thread.is_alive()
+
+    mode.mqtt.buffer.close()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_close_drains_buffer():
+    mode, thread = buffer_thread()
+    mode.mqtt.buffer.close()
+    thread.join(5)
+    assert not thread.is_alive()
+
+    mode, thread = buffer_thread()
+    count = DRAIN_BATCH_SIZE + 10
+    for i in range(count):
+        mode.mqtt.buffer.put("routine", i)
+    mode.mqtt.buffer.close()
+    thread.join(5)
+    # The messages that were in the buffer when it was closed are handed over before the thread returns.
+    assert not thread.is_alive()
+    assert max(len(batch) for batch in mode.shards.batches) <= DRAIN_BATCH_SIZE
+    assert [msg for batch in mode.shards.batches for msg in batch] == list(range(count))
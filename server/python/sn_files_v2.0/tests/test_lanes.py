@@ -0,0 +1,141 @@
+"""
+    File name: test_lanes.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the priority lanes of the received messages are tested: the order of the
+lanes in strict and weighted mode, the order of the messages of one lane, the watermarks
+that throttle the network loop and the full lanes that stop the reading without losing a message.
+
+
+Todo :
+	*
+"""
+
+from sn_lanes import Sn_lanes, LANE_SIZES, LANE_WEIGHTS, HIGH_WATERMARK, LOW_WATERMARK
+from sn_mqtt import SnMqtt
+
+
+class Fake_message:
+    ''' A received MQTT message.
+    '''
+
+    def __init__(self,topic,payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def fill(lanes,count):
+    """fill function. This function puts count messages in every lane, the routine lane first.
+    Args:
+        param1 (Sn_lanes): The lanes.
+        param2 (int): The number of messages of every lane.
+    """
+
+    for lane in ("routine", "alert", "control"):
+        for i in range(count):
+            assert lanes.put(lane, (lane, i))
+
+
+def test_strict_priority():
+    lanes = Sn_lanes()
+    fill(lanes, 3)
+    batch = lanes.get_batch(5)
+    assert batch == [("control", 0), ("control", 1), ("control", 2), ("alert", 0), ("alert", 1)]
+    batch = lanes.get_batch(10)
+    assert batch == [("alert", 2), ("routine", 0), ("routine", 1), ("routine", 2)]
+    assert lanes.qsize() == 0
+
+
+def test_weighted_rounds():
+    lanes = Sn_lanes(weighted=True)
+    fill(lanes, 20)
+    batch = lanes.get_batch(LANE_WEIGHTS["control"] + LANE_WEIGHTS["alert"] + LANE_WEIGHTS["routine"])
+    # One round takes the weight of every lane, the routine lane is not starved.
+    assert [msg[0] for msg in batch] == (["control"] * LANE_WEIGHTS["control"] +
+                                         ["alert"] * LANE_WEIGHTS["alert"] +
+                                         ["routine"] * LANE_WEIGHTS["routine"])
+
+
+def test_lane_order():
+    lanes = Sn_lanes(weighted=True)
+    fill(lanes, 20)
+    batch = lanes.get_batch(60)
+    for lane in ("control", "alert", "routine"):
+        assert [msg[1] for msg in batch if msg[0] == lane] == list(range(20))
+
+
+def test_close():
+    lanes = Sn_lanes()
+    lanes.put("alert", "a")
+    lanes.close()
+    assert not lanes.put("alert", "b")
+    # The messages in the lanes are still taken, then an empty batch is returned.
+    assert lanes.get_batch(10) == ["a"]
+    assert lanes.get_batch(10) == []
+
+
+def test_wait_stats():
+    lanes = Sn_lanes()
+    fill(lanes, 2)
+    lanes.get_batch(10)
+    stats = lanes.get_stats()
+    for lane in ("control", "alert", "routine"):
+        assert stats[lane]['messages'] == 2
+        assert stats[lane]['depth'] == 0
+        assert stats[lane]['max_wait'] >= stats[lane]['avg_wait'] >= 0.0
+
+
+def test_watermarks():
+    lanes = Sn_lanes()
+    for i in range(HIGH_WATERMARK - 1):
+        lanes.put("routine", i)
+    assert lanes.accepting.is_set()
+    lanes.put("routine", HIGH_WATERMARK)
+    # The high watermark stops the network loop.
+    assert not lanes.accepting.is_set()
+    assert lanes.get_stats()['throttled']
+
+    lanes.get_batch(HIGH_WATERMARK - LOW_WATERMARK - 1)
+    assert not lanes.accepting.is_set()
+    lanes.get_batch(1)
+    # The lanes drained to the low watermark, the network loop reads again.
+    assert lanes.accepting.is_set()
+    stats = lanes.get_stats()
+    assert not stats['throttled']
+    assert stats['throttle_events'] == 1
+
+
+def test_full_lane_keeps_messages():
+    lanes = Sn_lanes()
+    for i in range(LANE_SIZES["control"] - 1):
+        assert lanes.put("control", i)
+    assert lanes.accepting.is_set()
+    # A full lane stops the reading, the messages that were read still go in.
+    assert lanes.put("control", "full")
+    assert not lanes.accepting.is_set()
+    assert lanes.put("control", "late")
+    stats = lanes.get_stats()
+    assert stats["control"]['depth'] == LANE_SIZES["control"] + 1
+    assert stats["control"]['full'] == 1
+    assert stats['throttle_events'] == 1
+
+    # The lanes are below the low watermark, the reading starts when the lane is below its size.
+    lanes.get_batch(1)
+    assert not lanes.accepting.is_set()
+    lanes.get_batch(1)
+    assert lanes.accepting.is_set()
+    batch = lanes.get_batch(LANE_SIZES["control"])
+    assert batch[-2:] == ["full", "late"]
+
+
+def test_network_messages_kept():
+    mqtt = SnMqtt()
+    mqtt.buffer = Sn_lanes()
+    for i in range(LANE_SIZES["control"] + 10):
+        mqtt.on_message(mqtt, None, Fake_message("sensor_network/CN1/control", str(i).encode()))
+    assert not mqtt.buffer.accepting.is_set()
+    batch = mqtt.buffer.get_batch(LANE_SIZES["control"] + 10)
+    assert [msg.payload for msg in batch] == [str(i).encode() for i in range(LANE_SIZES["control"] + 10)]
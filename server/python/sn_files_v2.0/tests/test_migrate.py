@@ -0,0 +1,69 @@
+"""
+    File name: test_migrate.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the schema changes are tested: a change that the database rejects is left out
+and the others are applied, an unavailable database raises the error so the changes are applied
+on the next connection.
+
+
+Todo :
+	*
+"""
+
+import psycopg2
+import pytest
+from sn_db import Sn_db, MIGRATIONS
+
+
+class Fake_cursor:
+    ''' A cursor that rejects the statements that contain a text.
+    '''
+
+    def __init__(self,conn):
+        self.conn = conn
+
+    def execute(self,query,params=()):
+        if(self.conn.rejected in query):
+            raise self.conn.error("permission denied for table nodes")
+        self.conn.executed.append(query)
+
+
+class Fake_conn:
+    ''' A connection that keeps the executed statements.
+    '''
+
+    def __init__(self,rejected,error):
+        self.rejected = rejected
+        self.error = error
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return Fake_cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_rejected_change():
+    db = Sn_db()
+    db.conn = Fake_conn("CREATE TRIGGER", psycopg2.ProgrammingError)
+    db.migrate()
+
+    applied = [query for query in db.conn.executed if "SAVEPOINT" not in query]
+    assert applied == [migration for migration in MIGRATIONS if "CREATE TRIGGER" not in migration]
+    # The rejected changes are rolled back to their savepoints and the others are committed.
+    assert db.conn.executed.count("ROLLBACK TO SAVEPOINT sn_migration") == 2
+    assert db.conn.commits == 1
+
+
+def test_database_unavailable():
+    db = Sn_db()
+    db.conn = Fake_conn("CREATE TRIGGER", psycopg2.OperationalError)
+    with pytest.raises(psycopg2.OperationalError):
+        db.migrate()
+    assert db.conn.commits == 0
@@ -0,0 +1,130 @@
+"""
+    File name: test_notify.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the listener of the changes of the nodes table is tested: the changes of this process
+are skipped, the changes of the other processes are given to the callback, a truncate reloads everything,
+and a change updates the registry, the fingerprint cache, the danger nodes and the snapshot.
+
+
+Todo :
+	*
+"""
+
+import json
+import psycopg2
+import pytest
+import sn_db
+from sn_cache import Sn_config_cache
+from sn_notify import Sn_node_listener, read_change
+from sn_registry import Sn_node_registry
+from sn_states import ActiveMode
+
+
+class Fake_mqtt:
+    ''' An MQTT connection with the danger nodes of the server.
+    '''
+
+    def __init__(self):
+        self.danger_nodes = set()
+
+
+def change(op="UPDATE",node_id="CN1",sev_mode="normalMode",config_changed=False,config_hash=None,
+           source="sn_server_1"):
+    return {'op': op, 'node_id': node_id, 'status': "connected", 'sev_mode': sev_mode,
+            'config_changed': config_changed, 'config_hash': config_hash, 'source': source}
+
+
+def offline_listener(monkeypatch,changes,reloads):
+    """offline_listener function. This function creates a listener without a database connection.
+    Args:
+        param1 (MonkeyPatch): The pytest monkeypatch fixture.
+        param2 (list): The list that takes the changes.
+        param3 (list): The list that takes the reloads.
+    """
+
+    def connect(self):
+        raise psycopg2.OperationalError("could not connect to server")
+
+    monkeypatch.setattr(Sn_node_listener, "connect", connect)
+    return Sn_node_listener(changes.append, lambda: reloads.append(True))
+
+
+def test_read_change():
+    own = json.dumps(change(source=sn_db.application_name()))
+    other = json.dumps(change())
+    assert read_change(own) is None
+    assert read_change(other) == change()
+    assert read_change("not json") is None
+
+
+def test_dispatch(monkeypatch):
+    changes = []
+    reloads = []
+    listener = offline_listener(monkeypatch, changes, reloads)
+    assert listener.conn is None
+
+    listener.dispatch(json.dumps(change()))
+    listener.dispatch(json.dumps(change(source=sn_db.application_name())))
+    listener.dispatch(json.dumps({'op': "TRUNCATE", 'source': "psql"}))
+    assert changes == [change()]
+    assert reloads == [True]
+    stats = listener.get_stats()
+    assert (stats['received'], stats['skipped'], stats['reloads']) == (3, 1, 1)
+
+
+def test_failing_callback(monkeypatch):
+    reloads = []
+    listener = offline_listener(monkeypatch, [], reloads)
+
+    def fail(change):
+        raise KeyError("node_id")
+
+    listener.on_change = fail
+    # A change that cannot be applied does not stop the listener.
+    listener.dispatch(json.dumps(change()))
+    listener.dispatch(json.dumps({'op': "TRUNCATE", 'source': "psql"}))
+    assert reloads == [True]
+
+
+@pytest.fixture
+def mode():
+    mode = ActiveMode.__new__(ActiveMode)
+    mode.mqtt = Fake_mqtt()
+    mode.registry = Sn_node_registry()
+    mode.config_cache = Sn_config_cache()
+    mode.refreshed = []
+    mode.refresh_snapshot = mode.refreshed.append
+    return mode
+
+
+def test_apply_changes(mode):
+    mode.apply_node_change(change(sev_mode="dangerMode", config_changed=True, config_hash="a"))
+    assert mode.registry.get("CN1").sev_mode == "dangerMode"
+    assert "CN1" in mode.mqtt.danger_nodes
+    assert mode.config_cache.is_saved("CN1", "a")
+    assert mode.refreshed == ["CN1"]
+
+    # A change of the mode only leaves the configuration as it is.
+    mode.apply_node_change(change(sev_mode="warningMode"))
+    assert mode.registry.get("CN1").sev_mode == "warningMode"
+    assert "CN1" not in mode.mqtt.danger_nodes
+    assert mode.config_cache.is_saved("CN1", "a")
+    assert mode.refreshed == ["CN1"]
+
+    # A configuration without a fingerprint is validated again.
+    mode.apply_node_change(change(sev_mode="warningMode", config_changed=True))
+    assert not mode.config_cache.is_saved("CN1", "a")
+    assert mode.refreshed == ["CN1", "CN1"]
+
+
+def test_apply_delete(mode):
+    mode.apply_node_change(change(sev_mode="dangerMode", config_changed=True, config_hash="a"))
+    mode.apply_node_change(change(op="DELETE"))
+    assert mode.registry.get("CN1") is None
+    assert not mode.config_cache.is_saved("CN1", "a")
+    assert not mode.mqtt.danger_nodes
+    assert mode.refreshed == ["CN1", "CN1"]
@@ -0,0 +1,106 @@
+"""
+    File name: test_record.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the compact records are tested: the records have no attribute dictionary,
+a received message keeps only its topic, payload and arrival time, and the reading that is
+decoded once is the same object in the batch and in the rollup windows.
+
+
+Todo :
+	*
+"""
+
+import pytest
+import sn_mqtt
+from sn_mqtt import SnMqtt
+from sn_record import Sn_message, Sn_reading, utc_timestamp
+from sn_states import ActiveMode
+
+
+class Fake_message:
+    ''' A received MQTT message.
+    '''
+
+    def __init__(self,topic,payload):
+        self.topic = topic
+        self.payload = payload
+        self.qos = 1
+
+
+class Fake_route:
+    ''' The parsed topic of a data message.
+    '''
+
+    def __init__(self,node_id,table):
+        self.node_id = node_id
+        self.table = table
+
+
+class Fake_collector:
+    ''' A batch writer or rollup that keeps the added readings.
+    '''
+
+    def __init__(self):
+        self.readings = []
+
+    def add(self,reading):
+        self.readings.append(reading)
+
+
+def test_no_attribute_dictionary():
+    msg = Sn_message("sensor_network/CN1/room/TemperatureSensor", b"float,0-70,20.5", 0.0)
+    reading = Sn_reading("CN1", "temperature", 20.5, 0.0, "0-70", "float")
+    for record in (msg, reading):
+        assert not hasattr(record, "__dict__")
+        with pytest.raises(AttributeError):
+            record.extra = 1
+
+
+def test_reading_row():
+    reading = Sn_reading("CN1", "temperature", 20.5, 1526817600.25, "0-70", "float")
+    # The row has the node id, the value and the UTC time that the reading was received.
+    assert list(reading) == ["CN1", 20.5, "2018-05-20 12:00:00.250000"]
+    assert utc_timestamp(0) == "1970-01-01 00:00:00"
+
+
+def test_message_record(monkeypatch):
+    monkeypatch.setattr(sn_mqtt, "TOPIC_CACHE_SIZE", 2)
+    # The topic cache is shared by the connections, the test starts with an empty one.
+    monkeypatch.setattr(SnMqtt, "topics", {})
+    mqtt = SnMqtt()
+    # Every received message has its own topic text.
+    first = mqtt.make_record(Fake_message("/".join(["sensor_network", "CN1", "room", "TemperatureSensor"]), b"a"))
+    second = mqtt.make_record(Fake_message("/".join(["sensor_network", "CN1", "room", "TemperatureSensor"]), b"b"))
+    assert isinstance(first, Sn_message)
+    assert (first.payload, second.payload) == (b"a", b"b")
+    assert first.received <= second.received
+    # The topic text of the messages of a sensor is kept once.
+    assert first.topic is second.topic
+
+    mqtt.make_record(Fake_message("sensor_network/CN2/room/TemperatureSensor", b"c"))
+    mqtt.make_record(Fake_message("sensor_network/CN3/room/TemperatureSensor", b"d"))
+    # The topic cache is bounded.
+    assert len(mqtt.topics) <= 2
+
+
+def test_reading_created_once():
+    mode = ActiveMode.__new__(ActiveMode)
+    mode.writer = Fake_collector()
+    mode.rollup = Fake_collector()
+    msg = Sn_message("sensor_network/CN1/room/TemperatureSensor", b"float,0-70,20.5", 1526817600.25)
+    mode.save_sensor_data(None, msg, Fake_route("CN1", "temperature"))
+
+    reading = mode.writer.readings[0]
+    assert mode.rollup.readings[0] is reading
+    assert (reading.node_id, reading.kind, reading.value, reading.received) == ("CN1", "temperature", 20.5,
+                                                                                1526817600.25)
+    assert (reading.type, reading.range) == ("float", "0-70")
+
+    # A topic that is not a sensor kind and a payload that is not a number make no reading.
+    mode.save_sensor_data(None, msg, Fake_route("CN1", None))
+    mode.save_sensor_data(None, Sn_message(msg.topic, b"float,0-70,nan", 0.0), Fake_route("CN1", "temperature"))
+    assert len(mode.writer.readings) == 1
@@ -0,0 +1,89 @@
+"""
+    File name: test_rollup.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the rollup windows are tested: the readings are added to the window of their
+receive time in every rollup table and the windows are taken after their end and the grace time.
+
+
+Todo :
+	*
+"""
+
+from sn_record import Sn_reading
+from sn_rollup import Sn_rollup_windows, ROLLUP_GRACE
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The start of an hour, 20/5/2018 12:00:00 UTC.
+HOUR = 1526817600
+
+# --------------------------------------------------------------------------------------------------
+
+
+def add(windows,node_id,kind,value,received):
+    windows.add(Sn_reading(node_id, kind, value, received, "0-70", "float"))
+
+
+def rows(params):
+    """rows function. This function turns the parameters of an upsert statement into rows.
+    Args:
+        param1 (tuple): The node ids, sensors, window starts, numbers of readings, sums, minimums and maximums.
+    """
+
+    return sorted(zip(*params))
+
+
+def test_bucketing():
+    windows = Sn_rollup_windows()
+    add(windows, "CN1", "temperature", 21.0, HOUR + 0.25)
+    add(windows, "CN1", "temperature", 19.5, HOUR + 30)
+    add(windows, "CN1", "temperature", 23.0, HOUR + 59.9)
+    add(windows, "CN1", "temperature", 22.0, HOUR + 60)
+    add(windows, "CN2", "temperature", 18.0, HOUR + 10)
+    add(windows, "CN1", "humidity", 40.0, HOUR + 10)
+    add(windows, "CN1", "temperature", 25.0, HOUR + 3600)
+
+    rollups = windows.take()
+    assert rows(rollups["sensor_rollup_1m"]) == [
+        ("CN1", "humidity", HOUR, 1, 40.0, 40.0, 40.0),
+        ("CN1", "temperature", HOUR, 3, 63.5, 19.5, 23.0),
+        ("CN1", "temperature", HOUR + 60, 1, 22.0, 22.0, 22.0),
+        ("CN1", "temperature", HOUR + 3600, 1, 25.0, 25.0, 25.0),
+        ("CN2", "temperature", HOUR, 1, 18.0, 18.0, 18.0)]
+    assert rows(rollups["sensor_rollup_1h"]) == [
+        ("CN1", "humidity", HOUR, 1, 40.0, 40.0, 40.0),
+        ("CN1", "temperature", HOUR, 4, 85.5, 19.5, 23.0),
+        ("CN1", "temperature", HOUR + 3600, 1, 25.0, 25.0, 25.0),
+        ("CN2", "temperature", HOUR, 1, 18.0, 18.0, 18.0)]
+    assert windows.get_stats()['open'] == 0
+    assert windows.get_stats()['readings'] == 7
+
+
+def test_rising_values():
+    windows = Sn_rollup_windows()
+    for value in (1.0, 2.0, 3.0):
+        add(windows, "CN1", "flame", value, HOUR)
+    assert rows(windows.take()["sensor_rollup_1m"]) == [("CN1", "flame", HOUR, 3, 6.0, 1.0, 3.0)]
+
+
+def test_take_after_grace():
+    windows = Sn_rollup_windows()
+    add(windows, "CN1", "temperature", 21.0, HOUR + 5)
+    add(windows, "CN1", "temperature", 22.0, HOUR + 65)
+
+    # The first minute is still in its grace time.
+    assert windows.take(HOUR + 60 + ROLLUP_GRACE - 0.1) == {}
+    rollups = windows.take(HOUR + 60 + ROLLUP_GRACE)
+    assert list(rollups) == ["sensor_rollup_1m"]
+    assert rows(rollups["sensor_rollup_1m"]) == [("CN1", "temperature", HOUR, 1, 21.0, 21.0, 21.0)]
+
+    # The hour ends after the second minute.
+    rollups = windows.take(HOUR + 3600 + ROLLUP_GRACE)
+    assert rows(rollups["sensor_rollup_1m"]) == [("CN1", "temperature", HOUR + 60, 1, 22.0, 22.0, 22.0)]
+    assert rows(rollups["sensor_rollup_1h"]) == [("CN1", "temperature", HOUR, 2, 43.0, 21.0, 22.0)]
+    assert windows.get_stats()['open'] == 0
@@ -0,0 +1,128 @@
+"""
+    File name: test_router.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the topic router is tested: the precedence of the exact words over the
+wildcards, the '+' and '#' wildcards and the parsed routes of the cache.
+
+
+Todo :
+	*
+"""
+
+from sn_router import Sn_router
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The topic filters of the server, as they are built by Sn_config.
+CONTROL_FILTER = "sensor_network/+/greece/attica/athens/center/1/a/101/control"
+SENSOR_FILTER = "sensor_network/+/greece/attica/athens/center/1/a/101/+"
+LOCATION = "greece/attica/athens/center/1/a/101"
+
+# --------------------------------------------------------------------------------------------------
+
+
+def control(msg):
+    return "control"
+
+
+def sensor(msg):
+    return "sensor"
+
+
+def server_router():
+    """server_router function. This function returns a router with the filters of the server.
+    """
+
+    router = Sn_router()
+    router.add(CONTROL_FILTER, control)
+    router.add(SENSOR_FILTER, sensor)
+    return router
+
+
+def test_control_before_sensor():
+    router = server_router()
+    route = router.route("sensor_network/CN2/" + LOCATION + "/control")
+    assert route.handler is control
+    assert route.node_id == "CN2"
+    assert route.table is None
+
+
+def test_exact_word_does_not_depend_on_order():
+    # The sensor filter is added first, the exact word still wins over '+'.
+    router = Sn_router()
+    router.add(SENSOR_FILTER, sensor)
+    router.add(CONTROL_FILTER, control)
+    assert router.route("sensor_network/CN2/" + LOCATION + "/control").handler is control
+    assert router.route("sensor_network/CN2/" + LOCATION + "/TemperatureSensor").handler is sensor
+
+
+def test_sensor_topic():
+    route = server_router().route("sensor_network/CN2/" + LOCATION + "/HumiditySensor")
+    assert route.handler is sensor
+    assert route.node_id == "CN2"
+    assert route.location == LOCATION
+    assert route.kind == "HumiditySensor"
+    assert route.table == "humidity"
+
+
+def test_plus_matches_one_level():
+    router = server_router()
+    assert router.match("sensor_network/CN2/" + LOCATION + "/extra/control") is None
+    assert router.match("sensor_network/" + LOCATION + "/control") is None
+    assert router.match("other_network/CN2/" + LOCATION + "/control") is None
+
+
+def test_plus_before_hash():
+    router = Sn_router()
+    router.add("a/#", control)
+    router.add("a/+/c", sensor)
+    assert router.match("a/b/c") is sensor
+    assert router.match("a/b/d") is control
+    assert router.match("a/b/c/d") is control
+
+
+def test_hash_matches_parent_level():
+    router = Sn_router()
+    router.add("a/#", control)
+    assert router.match("a") is control
+    assert router.match("b") is None
+
+
+def test_dollar_topics_skip_first_level_wildcards():
+    router = Sn_router()
+    router.add("#", control)
+    router.add("+/broker", sensor)
+    assert router.match("$SYS/broker") is None
+    assert router.match("$SYS") is None
+    router.add("$SYS/#", sensor)
+    assert router.match("$SYS/broker") is sensor
+
+
+def test_cached_route():
+    router = server_router()
+    topic = "sensor_network/CN2/" + LOCATION + "/FlameSensor"
+    first = router.route(topic)
+    assert router.route(topic) is first
+    assert router.get_stats() == {'cached_topics': 1, 'hits': 1, 'misses': 1}
+
+
+def test_add_clears_cache():
+    router = server_router()
+    topic = "sensor_network/CN2/" + LOCATION + "/FlameSensor"
+    router.route(topic)
+    router.add("sensor_network/CN2/" + LOCATION + "/FlameSensor", control)
+    assert router.route(topic).handler is control
+
+
+def test_cache_size():
+    router = Sn_router(cache_size=2)
+    router.add("#", control)
+    for topic in ("a", "b", "a", "c"):
+        router.route(topic)
+    # "b" is the least recently used topic, it is removed.
+    assert list(router.cache) == ["a", "c"]
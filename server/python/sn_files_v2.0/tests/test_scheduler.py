@@ -0,0 +1,81 @@
+"""
+    File name: test_scheduler.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the per node scheduler is tested with a worker pool: the jobs of a node
+run in order and one at a time, the jobs of different nodes run in parallel.
+
+
+Todo :
+	*
+"""
+
+import random
+import threading
+import time
+from sn_pool import Sn_pool
+from sn_scheduler import Sn_scheduler, SCHEDULER_LANE_BATCH
+
+
+def test_node_order():
+    scheduler = Sn_scheduler(Sn_pool("test", 4, 1000), max_pending=1000)
+    lock = threading.Lock()
+    done = dict((node, []) for node in ("CN1", "CN2", "CN3"))
+    running = set()
+    overlaps = []
+
+    def job(node,i):
+        with lock:
+            if(node in running):
+                overlaps.append(node)
+            running.add(node)
+        time.sleep(random.random() / 1000)
+        with lock:
+            running.discard(node)
+            done[node].append(i)
+
+    # More jobs than the lane batch, so the lanes are handed back to the pool.
+    for i in range(SCHEDULER_LANE_BATCH * 2 + 5):
+        for node in done:
+            scheduler.submit(node, job, node, i)
+    scheduler.join()
+
+    for node in done:
+        assert done[node] == list(range(SCHEDULER_LANE_BATCH * 2 + 5))
+    assert overlaps == []
+    stats = scheduler.get_stats()
+    assert stats['pending'] == 0
+    assert stats['jobs_run'] == 3 * (SCHEDULER_LANE_BATCH * 2 + 5)
+    assert stats['max_wait'] >= stats['avg_wait'] > 0.0
+
+
+def test_nodes_in_parallel():
+    scheduler = Sn_scheduler(Sn_pool("test", 2, 100), max_pending=100)
+    started = threading.Event()
+    results = []
+
+    def wait(node):
+        # The job of CN1 finishes only if the job of CN2 runs at the same time.
+        results.append(started.wait(5))
+
+    scheduler.submit("CN1", wait, "CN1")
+    scheduler.submit("CN2", started.set)
+    scheduler.join()
+    assert results == [True]
+
+
+def test_failing_job():
+    scheduler = Sn_scheduler(Sn_pool("test", 1, 100), max_pending=100)
+    done = []
+
+    def fail():
+        raise ValueError("job failed")
+
+    scheduler.submit("CN1", fail)
+    scheduler.submit("CN1", done.append, 1)
+    scheduler.join()
+    # A failing job does not stop the lane.
+    assert done == [1]
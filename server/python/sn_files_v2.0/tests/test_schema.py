@@ -0,0 +1,162 @@
+"""
+    File name: test_schema.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the partition maintenance is tested: the partition bounds are read, a day that is covered
+by a partition is not created again, the rows of a day in the default partition are moved to the new
+partition, and the partitions and rollup windows older than their retention are dropped.
+
+
+Todo :
+	*
+"""
+
+import datetime
+from sn_db import ROLLUP_TABLES
+from sn_schema import Sn_schema, read_bound, overlaps
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The start of the current day in the tests.
+TODAY = datetime.datetime(2018, 5, 20)
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Fake_cursor:
+    ''' A cursor that gives the partitions of a table and keeps the executed statements.
+    '''
+
+    def __init__(self,partitions=(),default_days=(),relkind=None):
+        # The (name, bound) rows of the partitions, as pg_get_expr gives them.
+        self.rows = list(partitions)
+        # The kind of the table in pg_class, None if the table does not exist.
+        self.relkind = relkind
+        # The days that have rows in the default partition.
+        self.default_days = default_days
+        self.executed = []
+        self.result = None
+        self.rowcount = 0
+
+    def execute(self,query,params=()):
+        self.executed.append((query, params))
+        if(query.startswith("SELECT relkind")):
+            self.result = [(self.relkind,)] if self.relkind is not None else []
+        elif(query.startswith("SELECT c.relname")):
+            self.result = self.rows
+        elif(query.startswith("SELECT 1 FROM")):
+            self.result = [(1,)] if params[0] in self.default_days else []
+        elif(query.startswith("DELETE")):
+            self.rowcount = 3
+
+    def fetchall(self):
+        return self.result
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+
+def bound(start,end):
+    return "FOR VALUES FROM (" + start + ") TO (" + end + ")"
+
+
+def statements(cur,start):
+    return [(query, params) for query, params in cur.executed if query.startswith(start)]
+
+
+def test_read_bound():
+    assert read_bound("'2018-05-20 00:00:00'") == TODAY
+    assert read_bound("'2018-05-20 00:00:00+03'") == TODAY
+    assert read_bound("MINVALUE") is None
+    assert read_bound("MAXVALUE") is None
+
+
+def test_overlaps():
+    day = datetime.timedelta(days=1)
+    assert overlaps(TODAY, TODAY + day, TODAY, TODAY + day)
+    assert not overlaps(TODAY, TODAY + day, TODAY + day, TODAY + 2 * day)
+    assert not overlaps(TODAY, TODAY + day, None, TODAY)
+    assert overlaps(TODAY, TODAY + day, None, TODAY + day)
+    assert overlaps(TODAY, TODAY + day, TODAY - day, None)
+
+
+def test_partition_table():
+    schema = Sn_schema()
+    cur = Fake_cursor(relkind="r")
+    schema.partition_table(cur, "temperature", TODAY)
+
+    # The table without partitions is renamed, its rows get a partition of the days before today.
+    assert cur.executed[1] == ("ALTER TABLE temperature RENAME TO temperature_legacy", ())
+    assert cur.executed[2][0].startswith("CREATE TABLE temperature (node_id text, temperature double precision")
+    assert cur.executed[3] == ("CREATE TABLE temperature_history PARTITION OF temperature "
+                               "FOR VALUES FROM (MINVALUE) TO (%s)", (TODAY,))
+    assert cur.executed[4][0] == "CREATE TABLE IF NOT EXISTS temperature_default PARTITION OF temperature DEFAULT"
+
+    # A partitioned table is left as it is.
+    cur = Fake_cursor(relkind="p")
+    schema.partition_table(cur, "temperature", TODAY)
+    assert not statements(cur, "CREATE TABLE temperature ")
+    assert not statements(cur, "ALTER TABLE temperature RENAME")
+
+
+def test_create_partitions():
+    schema = Sn_schema(ahead_days=2)
+    cur = Fake_cursor([("temperature_history", bound("MINVALUE", "'2018-05-20 00:00:00'")),
+                       ("temperature_p20180520", bound("'2018-05-20 00:00:00'", "'2018-05-21 00:00:00'")),
+                       ("temperature_default", "DEFAULT")])
+    schema.create_partitions(cur, "temperature", TODAY)
+
+    # The day of the existing partition is skipped, the next days are created.
+    created = statements(cur, "CREATE TABLE")
+    assert created == [("CREATE TABLE temperature_p20180521 PARTITION OF temperature FOR VALUES FROM (%s) TO (%s)",
+                        (datetime.datetime(2018, 5, 21), datetime.datetime(2018, 5, 22))),
+                       ("CREATE TABLE temperature_p20180522 PARTITION OF temperature FOR VALUES FROM (%s) TO (%s)",
+                        (datetime.datetime(2018, 5, 22), datetime.datetime(2018, 5, 23)))]
+    assert schema.created == 2
+
+
+def test_default_rows_moved():
+    schema = Sn_schema(ahead_days=0)
+    cur = Fake_cursor(default_days=(TODAY,))
+    schema.create_partitions(cur, "temperature", TODAY)
+
+    # The partition is created empty, the rows of the day are moved to it and then it is attached.
+    queries = [query for query, params in cur.executed[1:]]
+    assert queries[1] == "CREATE TABLE temperature_p20180520 (LIKE temperature INCLUDING DEFAULTS)"
+    assert queries[2].startswith("WITH moved AS (DELETE FROM temperature_default WHERE time >= %s")
+    assert queries[2].endswith("INSERT INTO temperature_p20180520 SELECT * FROM moved")
+    assert queries[3] == ("ALTER TABLE temperature ATTACH PARTITION temperature_p20180520 "
+                          "FOR VALUES FROM (%s) TO (%s)")
+    assert cur.executed[-1][1] == (TODAY, TODAY + datetime.timedelta(days=1))
+
+
+def test_drop_partitions():
+    schema = Sn_schema(retention_days=90)
+    cur = Fake_cursor([("temperature_history", bound("MINVALUE", "'2018-02-18 00:00:00'")),
+                       ("temperature_p20180218", bound("'2018-02-18 00:00:00'", "'2018-02-19 00:00:00'")),
+                       ("temperature_p20180219", bound("'2018-02-19 00:00:00'", "'2018-02-20 00:00:00'")),
+                       ("temperature_default", "DEFAULT")])
+    schema.drop_partitions(cur, "temperature", TODAY)
+
+    # The partitions that end 90 days ago or earlier are dropped, the default partition is kept.
+    assert [query for query, params in statements(cur, "DROP")] == ["DROP TABLE temperature_history",
+                                                                    "DROP TABLE temperature_p20180218"]
+    assert schema.dropped == 2
+
+
+def test_drop_windows():
+    schema = Sn_schema(retention_days=90, rollup_retention_days=730)
+    cur = Fake_cursor()
+    schema.drop_windows(cur, TODAY)
+
+    deleted = statements(cur, "DELETE")
+    assert [query for query, params in deleted] == ["DELETE FROM " + rollup + " WHERE bucket < %s"
+                                                    for seconds, rollup in ROLLUP_TABLES]
+    # The finest windows are kept as long as the readings, the coarser ones longer.
+    assert deleted[0][1] == (TODAY - datetime.timedelta(days=90),)
+    assert deleted[1][1] == (TODAY - datetime.timedelta(days=730),)
+    assert schema.windows_dropped == 6
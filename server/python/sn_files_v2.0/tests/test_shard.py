@@ -0,0 +1,113 @@
+"""
+    File name: test_shard.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the shard set is tested: the messages of a node always go to the same shard,
+only the shard of a node sends the changes of its danger mode to the receiver, every shard
+process hears the changes of the others, and a shard that does not stop on shutdown is terminated.
+
+
+Todo :
+	*
+"""
+
+import multiprocessing
+import threading
+import time
+import sn_db
+import sn_shard
+from sn_notify import read_change
+from sn_shard import Sn_shards, Sn_shard_nodes, shard_of
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# A message topic of a node, the node id is the second word.
+TOPIC = "Karlovasi_IoT_network/{node}/Greece/Samos/Karlovasi/indoorTemperatureSensor"
+# --------------------------------------------------------------------------------------------------
+
+
+class Fake_replies:
+    ''' A reply queue that keeps the replies.
+    '''
+
+    def __init__(self):
+        self.replies = []
+
+    def put(self,reply):
+        self.replies.append(reply)
+
+
+def shard_set(count):
+    ''' A shard set without processes, for the routing of the messages.
+    '''
+
+    shards = Sn_shards.__new__(Sn_shards)
+    shards.count = count
+    return shards
+
+
+def test_node_shard():
+    shards = shard_set(4)
+    nodes = ["CN" + str(i) for i in range(100)]
+    for node in nodes:
+        shard = shards.find_shard(TOPIC.format(node=node))
+        # Every topic of a node goes to the same shard.
+        assert shards.find_shard(TOPIC.format(node=node) + "/control") == shard
+        assert shard == shard_of(node, 4)
+    # The nodes are spread over every shard.
+    assert set(shard_of(node, 4) for node in nodes) == set(range(4))
+
+
+def test_danger_replies_of_owner():
+    replies = Fake_replies()
+    sets = [Sn_shard_nodes(replies, shard, 3) for shard in range(3)]
+    # Every shard hears the change of the node, the receiver gets one reply.
+    for nodes in sets:
+        nodes.add("CN2")
+    for nodes in sets:
+        nodes.discard("CN2")
+    assert replies.replies == [("danger", "CN2", True), ("danger", "CN2", False)]
+
+
+def send_application_name(queue):
+    queue.put(sn_db.application_name())
+
+
+def test_application_name_per_process():
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=send_application_name, args=(queue,))
+    process.start()
+    shard_name = queue.get(timeout=10)
+    process.join()
+
+    assert shard_name != sn_db.application_name()
+    # The change of a shard is applied by the receiver, its own change is skipped.
+    change = '{"op": "UPDATE", "node_id": "CN2", "source": "%s"}'
+    assert read_change(change % shard_name)['node_id'] == "CN2"
+    assert read_change(change % sn_db.application_name()) is None
+
+
+def test_stuck_shard_terminated(monkeypatch):
+    monkeypatch.setattr(sn_shard, "SHARD_STOP_TIMEOUT", 0.5)
+    shards = shard_set(1)
+    shards.lock = threading.Lock()
+    shards.closed = False
+    shards.replies = Fake_replies()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    shards.channels = [sender]
+    # A shard that does not read the end of its input.
+    process = multiprocessing.Process(target=time.sleep, args=(60,))
+    process.daemon = True
+    process.start()
+    shards.processes = [process]
+    shards.thread = threading.Thread()
+
+    start = time.time()
+    shards.close()
+    assert time.time() - start < 10
+    assert not process.is_alive()
+    assert shards.replies.replies == [None]
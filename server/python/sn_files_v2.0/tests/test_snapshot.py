@@ -0,0 +1,99 @@
+"""
+    File name: test_snapshot.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the snapshot of the node configurations is tested: many changes in a short time
+cause one write of the file, the pending changes are written when the snapshot is closed,
+and the configurations of an existing file are kept by the next write.
+
+
+Todo :
+	*
+"""
+
+import json
+import time
+from sn_snapshot import Sn_snapshot
+
+
+def config(node_id,version=1):
+    return json.dumps({"nodeConfiguration": {"nodeInfo": {"ID": node_id}, "version": version}})
+
+
+def wait_writes(snapshot,count):
+    """wait_writes function. This function waits until the snapshot file is written count times.
+    Args:
+        param1 (Sn_snapshot): The snapshot.
+        param2 (int): The number of writes.
+    """
+
+    deadline = time.time() + 5
+    while(snapshot.writes < count and time.time() < deadline):
+        time.sleep(0.01)
+    assert snapshot.writes == count
+
+
+def read_nodes(path):
+    with open(path) as snapshot_file:
+        nodes = json.load(snapshot_file)["nodes"]
+    return [(node["nodeConfiguration"]["nodeInfo"]["ID"], node["nodeConfiguration"]["version"]) for node in nodes]
+
+
+def test_debounced_writes(tmp_path):
+    path = str(tmp_path / "nodes_config.json")
+    snapshot = Sn_snapshot(path, interval=0.3)
+    snapshot.update("CN1", config("CN1"))
+    wait_writes(snapshot, 1)
+
+    for version in range(50):
+        snapshot.update("CN" + str(version % 5), config("CN" + str(version % 5), version))
+    time.sleep(0.1)
+    # The changes wait for the interval since the last write.
+    assert snapshot.writes == 1
+    wait_writes(snapshot, 2)
+    assert read_nodes(path) == [("CN1", 46), ("CN0", 45), ("CN2", 47), ("CN3", 48), ("CN4", 49)]
+    assert snapshot.get_stats()['updates'] == 51
+    snapshot.close()
+    assert snapshot.writes == 2
+
+
+def test_close_writes_pending(tmp_path):
+    path = str(tmp_path / "nodes_config.json")
+    snapshot = Sn_snapshot(path, interval=3600)
+    snapshot.update("CN1", config("CN1"))
+    wait_writes(snapshot, 1)
+    snapshot.update("CN2", config("CN2"))
+    snapshot.remove("CN1")
+    assert snapshot.get_stats()['pending']
+
+    snapshot.close()
+    assert snapshot.writes == 2
+    assert read_nodes(path) == [("CN2", 1)]
+    assert not snapshot.thread.is_alive()
+
+
+def test_seed_without_write(tmp_path):
+    path = str(tmp_path / "nodes_config.json")
+    snapshot = Sn_snapshot(path)
+    snapshot.seed([("CN1", config("CN1"))])
+    snapshot.remove("CN3")
+    snapshot.close()
+    assert snapshot.writes == 0
+    assert not (tmp_path / "nodes_config.json").exists()
+
+
+def test_seed_file(tmp_path):
+    path = str(tmp_path / "nodes_config.json")
+    with open(path, "w") as snapshot_file:
+        snapshot_file.write('{"nodes":[' + config("CN1") + ',{"nodeConfiguration": {}},' + config("CN2") + ']}')
+    snapshot = Sn_snapshot(path, interval=3600)
+    snapshot.seed_file()
+    snapshot.update("CN2", config("CN2", 2))
+    snapshot.close()
+
+    # The configurations of the file are kept, the one without a node id is left out.
+    assert read_nodes(path) == [("CN1", 1), ("CN2", 2)]
+    assert not (tmp_path / "nodes_config.json.tmp").exists()
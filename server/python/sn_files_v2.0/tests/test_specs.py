@@ -0,0 +1,106 @@
+"""
+    File name: test_specs.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the numeric storage of the readings is tested: the values are written as numbers
+with every digit, the type and the range of a sensor are written to the sensor specification table
+only when they change, and the last specification of a sensor in a batch is the one that is kept.
+
+
+Todo :
+	*
+"""
+
+from sn_batch import Sn_sensor_specs
+from sn_db import Sn_db, SENSOR_SPEC_TABLE
+from sn_record import Sn_reading
+
+
+class Fake_cursor:
+    ''' A cursor that keeps the text of every COPY.
+    '''
+
+    def __init__(self,copies):
+        self.copies = copies
+
+    def copy_from(self,rows,table,columns):
+        self.copies.append((table, tuple(columns), rows.read()))
+
+
+class Fake_conn:
+    ''' A connection that gives Fake_cursor cursors and counts the commits.
+    '''
+
+    def __init__(self):
+        self.copies = []
+        self.commits = 0
+
+    def cursor(self):
+        return Fake_cursor(self.copies)
+
+    def commit(self):
+        self.commits += 1
+
+
+class Fake_statements:
+    ''' The prepared statements, they keep the executed statements.
+    '''
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self,conn,name,params=()):
+        self.executed.append((name, params))
+
+
+def reading(node_id,kind,value,data_range="0-70",data_type="float"):
+    return Sn_reading(node_id, kind, value, 0.0, data_range, data_type)
+
+
+def test_spec_changes():
+    specs = Sn_sensor_specs()
+    assert specs.check(reading("CN1", "temperature", 20.5)) == ("CN1", "temperature", "float", "0-70")
+    assert specs.check(reading("CN1", "temperature", 21.5)) is None
+    # Another node, another sensor of the node and a new range are changes.
+    assert specs.check(reading("CN2", "temperature", 20.5)) is not None
+    assert specs.check(reading("CN1", "humidity", 40.0, "0-100")) is not None
+    assert specs.check(reading("CN1", "temperature", 20.5, "0-100")) == ("CN1", "temperature", "float", "0-100")
+    assert specs.check(reading("CN1", "temperature", 1.0, "0-100", "int")) is not None
+    assert specs.changes == 5
+
+
+def test_numeric_copy():
+    db = Sn_db()
+    db.conn = Fake_conn()
+    db.statements = Fake_statements()
+    db.copy_client_data({"temperature": [reading("CN1", "temperature", 0.1 + 0.2),
+                                         reading("CN2", "temperature", -40.0)],
+                         "flame": [reading("CN1", "flame", 1, "0-1", "int")],
+                         SENSOR_SPEC_TABLE: [("CN1", "temperature", "float", "0-70")]})
+
+    copies = dict((table, [line.split("\t")[:2] for line in text.splitlines()])
+                  for table, columns, text in db.conn.copies)
+    # The values are written with every digit, the type and the range are not in the rows.
+    assert copies["temperature"] == [["CN1", repr(0.1 + 0.2)], ["CN2", "-40.0"]]
+    assert copies["flame"] == [["CN1", "1"]]
+    assert db.statements.executed == [("upsert_sensor_specs", (["CN1"], ["temperature"], ["float"], ["0-70"]))]
+    assert db.conn.commits == 1
+
+
+def test_spec_params():
+    db = Sn_db()
+    params = db.spec_params([("CN1", "temperature", "float", "0-70"), ("CN2", "flame", "int", "0-1"),
+                             ("CN1", "temperature", "float", "0-100")])
+    # The last specification of a sensor is written.
+    rows = sorted(zip(*params))
+    assert rows == [("CN1", "temperature", "float", "0-100"), ("CN2", "flame", "int", "0-1")]
+
+
+def test_copy_escape():
+    db = Sn_db()
+    assert db.copy_escape(23.456789012345678) == repr(23.456789012345678)
+    assert db.copy_escape(7) == "7"
+    assert db.copy_escape("CN\t1\\") == "CN\\t1\\\\"
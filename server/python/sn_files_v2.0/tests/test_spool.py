@@ -0,0 +1,349 @@
+"""
+    File name: test_spool.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the on-disk spool is tested: the records are replayed in the order they were
+appended, across segments and restarts, the writers go back to the database when the replay
+has caught up, the records that the database rejects are moved to the dead letter file and
+the sensor data rows keep the time that they were received until they are written by the COPY
+of the database.
+
+
+Todo :
+	*
+"""
+
+import json
+import os
+import threading
+import psycopg2
+import pytest
+import sn_spool
+from sn_db import Sn_db, Sn_breaker, SENSOR_SPEC_TABLE
+from sn_record import Sn_reading, utc_timestamp
+from sn_spool import Sn_spool
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The time that the test readings are received, 20/5/2018 12:00:00.25 UTC.
+RECEIVED = 1526817600.25
+
+# --------------------------------------------------------------------------------------------------
+
+
+class Fake_db:
+    ''' A database connection that keeps the calls of the replay in order.
+    '''
+
+    breaker = Sn_breaker()
+
+    def __init__(self):
+        self.calls = []
+        self.conn = Fake_conn()
+
+    def connect_db(self):
+        pass
+
+    def disconnect_db(self):
+        pass
+
+    def copy_client_data(self,batch):
+        self.calls.append(('rows', batch))
+
+    def upsert_node_db(self,data,datetime,config_hash,node_id):
+        self.calls.append(('upsert', (data, datetime, config_hash, node_id)))
+
+    def update_nodes(self,params):
+        self.calls.append(('nodes', params))
+
+    def upsert_rollups(self,rollups):
+        self.calls.append(('rollups', rollups))
+
+
+class Fake_cursor:
+    ''' A cursor that keeps the text of every COPY.
+    '''
+
+    def __init__(self,copies):
+        self.copies = copies
+
+    def copy_from(self,rows,table,columns):
+        self.copies.append((table, tuple(columns), rows.read()))
+
+
+class Fake_conn:
+    ''' A connection that gives Fake_cursor cursors and counts the commits.
+    '''
+
+    def __init__(self):
+        self.copies = []
+        self.commits = 0
+
+    def cursor(self):
+        return Fake_cursor(self.copies)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class Fake_statements:
+    ''' A statement registry that keeps the executed statements.
+    '''
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self,conn,name,params=()):
+        self.executed.append((name, params))
+
+
+@pytest.fixture
+def spool_dir(tmp_path,monkeypatch):
+    # The replay thread must not reach the database during the test.
+    monkeypatch.setattr(sn_spool, "SPOOL_REPLAY_INTERVAL", 3600)
+    return str(tmp_path / "spool")
+
+
+def reading(node_id,kind,value,received=RECEIVED):
+    return Sn_reading(node_id, kind, value, received, "0-70", "float")
+
+
+def replay(spool):
+    """replay function. This function closes the open segment and replays every segment to a Fake_db.
+    Args:
+        param1 (Sn_spool): The spool.
+    """
+
+    db = Fake_db()
+    spool.close()
+    for segment in list(spool.segments):
+        spool.replay_segment(db, segment)
+    return db
+
+
+def test_replay_order(spool_dir):
+    spool = Sn_spool(spool_dir)
+    spool.append_rows({"temperature": [reading("CN1", "temperature", 20.5)]})
+    spool.append_upsert('{"node": 1}', "2018-05-20 12:00:00", "hash", "CN1")
+    spool.append_rows({"humidity": [reading("CN1", "humidity", 40.0)]})
+    spool.append_rows({"humidity": [reading("CN2", "humidity", 41.0)]})
+    spool.append_nodes(([u"CN1"], [u"warningMode"]))
+    spool.append_rollups({"temperature_1m": [[u"CN1"], [u"temperature"], [1526817600], [1], [20.5], [20.5],
+                                             [20.5]]})
+    spool.append_rows({"flame": [reading("CN2", "flame", 0.0)]})
+    assert spool.has_data()
+
+    db = replay(spool)
+    # The rows before every node and rollup write are written first, consecutive rows together.
+    assert [kind for kind, data in db.calls] == ['rows', 'upsert', 'rows', 'nodes', 'rollups', 'rows']
+    assert db.calls[0][1] == {"temperature": [["CN1", 20.5, utc_timestamp(RECEIVED)]]}
+    assert db.calls[1][1] == ('{"node": 1}', "2018-05-20 12:00:00", "hash", "CN1")
+    assert [row[0] for row in db.calls[2][1]["humidity"]] == ["CN1", "CN2"]
+    assert db.calls[3][1] == [["CN1"], ["warningMode"]]
+    assert db.calls[4][1]["temperature_1m"][2] == [1526817600]
+    assert db.calls[5][1] == {"flame": [["CN2", 0.0, utc_timestamp(RECEIVED)]]}
+
+    # The replayed segment is removed.
+    assert not spool.has_data()
+    assert os.listdir(spool_dir) == []
+    assert spool.get_stats()['rows_replayed'] == 4
+
+
+def test_segments_in_order(spool_dir,monkeypatch):
+    # Every record starts a new segment.
+    monkeypatch.setattr(sn_spool, "SPOOL_SEGMENT_SIZE", 1)
+    spool = Sn_spool(spool_dir)
+    for i in range(12):
+        spool.append_rows({"temperature": [reading("CN" + str(i), "temperature", float(i))]})
+    assert len(spool.segments) == 12
+
+    db = replay(spool)
+    assert [data["temperature"][0][0] for kind, data in db.calls] == ["CN" + str(i) for i in range(12)]
+
+
+def test_replay_after_restart(spool_dir):
+    spool = Sn_spool(spool_dir)
+    spool.append_rows({"temperature": [reading("CN1", "temperature", 20.5)]})
+    spool.close()
+    spool.append_rows({"temperature": [reading("CN2", "temperature", 21.5)]})
+    spool.close()
+    # A partly written line at the end of a segment is left by a crash.
+    with open(spool.path(spool.segments[-1]), "a") as segment_file:
+        segment_file.write('{"kind": "rows", "bat')
+
+    # The segments of the previous run are replayed first, the new records after them.
+    restarted = Sn_spool(spool_dir)
+    assert restarted.has_data()
+    restarted.append_rows({"temperature": [reading("CN3", "temperature", 22.5)]})
+    db = replay(restarted)
+    assert [data["temperature"][0][0] for kind, data in db.calls] == ["CN1", "CN2", "CN3"]
+
+
+def test_receive_time_round_trip(spool_dir):
+    spool = Sn_spool(spool_dir)
+    spool.append_rows({"temperature": [reading("CN2", "temperature", 21.5)],
+                       "flame": [reading("CN2", "flame", 1.0, RECEIVED + 0.5)],
+                       SENSOR_SPEC_TABLE: [("CN2", "temperature", "float", "0-70")]})
+    replayed = replay(spool).calls[0][1]
+
+    # The replayed batch is written by the COPY of the database.
+    db = Sn_db()
+    db.conn = Fake_conn()
+    db.statements = Fake_statements()
+    db.copy_client_data(replayed)
+    copies = dict((table, (columns, text)) for table, columns, text in db.conn.copies)
+    assert copies["temperature"] == (("node_id", "temperature", "time"),
+                                     "CN2\t21.5\t2018-05-20 12:00:00.250000\n")
+    assert copies["flame"] == (("node_id", "flame", "time"), "CN2\t1.0\t2018-05-20 12:00:00.750000\n")
+    assert db.statements.executed == [("upsert_sensor_specs", (["CN2"], ["temperature"], ["float"], ["0-70"]))]
+    assert db.conn.commits == 1
+
+
+def test_legacy_rows():
+    db = Sn_db()
+    db.conn = Fake_conn()
+    db.statements = Fake_statements()
+    # The rows of an older spool have no time, or a type and a range after the value.
+    db.copy_client_data({"temperature": [["CN1", 20.5], ["CN2", 21.5, "float", "0-70"]]})
+    lines = db.conn.copies[0][2].splitlines()
+    assert [line.split("\t")[:2] for line in lines] == [["CN1", "20.5"], ["CN2", "21.5"]]
+    assert all([len(line.split("\t")[2]) > 0 for line in lines])
+    assert db.statements.executed == [("upsert_sensor_specs", (["CN2"], ["temperature"], ["float"], ["0-70"]))]
+
+
+def lock_held(spool):
+    """lock_held function. This function returns True if the lock of the spool is held by another thread.
+    Args:
+        param1 (Sn_spool): The spool.
+    """
+
+    free = []
+
+    def try_lock():
+        free.append(spool.lock.acquire(False))
+        if(free[0]):
+            spool.lock.release()
+
+    thread = threading.Thread(target=try_lock)
+    thread.start()
+    thread.join()
+    return not free[0]
+
+
+def busy_db(spool,writes):
+    """busy_db function. This function returns a Fake_db class with one shared instance. The writers
+    append a record to the spool after each of the first writes calls of the replay, unless they
+    wait for the lock of the spool.
+    Args:
+        param1 (Sn_spool): The spool.
+        param2 (int): The number of calls that are followed by a new record.
+    """
+
+    class Busy_db(Fake_db):
+        calls = []
+        locked = []
+
+        def __init__(self):
+            self.conn = Fake_conn()
+
+        def copy_client_data(self,batch):
+            Fake_db.copy_client_data(self, batch)
+            self.locked.append(lock_held(spool))
+            if(len(self.calls) < writes and not self.locked[-1]):
+                spool.append_rows({"temperature": [reading("CN" + str(len(self.calls)), "temperature", 20.0)]})
+    return Busy_db
+
+
+def test_handoff(spool_dir,monkeypatch):
+    spool = Sn_spool(spool_dir)
+    spool.append_rows({"temperature": [reading("CN0", "temperature", 20.0)]})
+    monkeypatch.setattr(sn_spool, "Sn_db", busy_db(spool, 5))
+    spool.replay()
+
+    # The record that was appended during the first round is the last one, it is written with
+    # the lock held and the writers write to the database after it.
+    calls = sn_spool.Sn_db.calls
+    assert [data["temperature"][0][0] for kind, data in calls] == ["CN0", "CN1"]
+    assert sn_spool.Sn_db.locked == [False, True]
+    assert not spool.has_data()
+
+
+def test_handoff_after_rounds(spool_dir,monkeypatch):
+    # With no bytes left for the last round, the lock is taken only for an empty spool.
+    monkeypatch.setattr(sn_spool, "SPOOL_HANDOFF_SIZE", 0)
+    spool = Sn_spool(spool_dir)
+    spool.append_rows({"temperature": [reading("CN0", "temperature", 20.0)]})
+    monkeypatch.setattr(sn_spool, "Sn_db", busy_db(spool, 3))
+    spool.replay()
+
+    calls = sn_spool.Sn_db.calls
+    assert [data["temperature"][0][0] for kind, data in calls] == ["CN0", "CN1", "CN2"]
+    assert sn_spool.Sn_db.locked == [False, False, False]
+    assert not spool.has_data()
+
+
+class Strict_db(Fake_db):
+    ''' A database that rejects the rows and the configurations of the node BAD.
+    '''
+
+    def copy_client_data(self,batch):
+        for rows in batch.values():
+            if([row for row in rows if row[0] == "BAD"]):
+                raise psycopg2.IntegrityError("no partition of relation found for row")
+        Fake_db.copy_client_data(self, batch)
+
+    def upsert_node_db(self,data,datetime,config_hash,node_id):
+        if(node_id == "BAD"):
+            raise psycopg2.DataError("invalid input syntax for type json")
+        Fake_db.upsert_node_db(self, data, datetime, config_hash, node_id)
+
+
+def test_dead_letter(spool_dir):
+    spool = Sn_spool(spool_dir)
+    spool.append_rows({"temperature": [reading("CN1", "temperature", 20.5)]})
+    spool.append_rows({"temperature": [reading("BAD", "temperature", 21.5)]})
+    spool.append_rows({"humidity": [reading("CN2", "humidity", 40.0)]})
+    spool.append_upsert("{", "2018-05-20 12:00:00", "hash", "BAD")
+    spool.append_upsert("{}", "2018-05-20 12:00:00", "hash", "CN1")
+    spool.close()
+    db = Strict_db()
+    spool.replay_segment(db, spool.segments[0])
+
+    # The rejected records do not stop the records after them.
+    assert [kind for kind, data in db.calls] == ['rows', 'rows', 'upsert']
+    assert db.calls[0][1] == {"temperature": [["CN1", 20.5, utc_timestamp(RECEIVED)]]}
+    assert db.calls[1][1] == {"humidity": [["CN2", 40.0, utc_timestamp(RECEIVED)]]}
+    assert db.calls[2][1][3] == "CN1"
+    with open(os.path.join(spool_dir, sn_spool.SPOOL_DEAD_LETTER)) as dead_file:
+        dead = [json.loads(line) for line in dead_file]
+    assert [record['kind'] for record in dead] == ['rows', 'upsert']
+    assert dead[0]['batch'] == {"temperature": [["BAD", 21.5, utc_timestamp(RECEIVED)]]}
+    assert dead[1]['node_id'] == "BAD"
+    assert not spool.has_data()
+    assert spool.get_stats()['records_dead'] == 2
+    # A new spool does not take the dead letter file for a segment.
+    assert not Sn_spool(spool_dir).has_data()
+
+
+def test_database_failure_keeps_records(spool_dir):
+    spool = Sn_spool(spool_dir)
+    spool.append_rows({"temperature": [reading("CN1", "temperature", 20.5)]})
+    spool.close()
+
+    class Lost_db(Fake_db):
+        def copy_client_data(self,batch):
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    with pytest.raises(psycopg2.OperationalError):
+        spool.replay_segment(Lost_db(), spool.segments[0])
+    # The record is replayed when the database recovers.
+    assert spool.has_data()
+    assert not os.path.exists(os.path.join(spool_dir, sn_spool.SPOOL_DEAD_LETTER))
+    assert [kind for kind, data in replay(spool).calls] == ['rows']
@@ -0,0 +1,87 @@
+"""
+    File name: test_status.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the status report is tested: the counters of every part of the server
+are published in one JSON message, a part that fails or keeps no counters is left out,
+and the report thread publishes until it is closed.
+
+
+Todo :
+	*
+"""
+
+import json
+import time
+from sn_lanes import Sn_lanes
+from sn_pool import Sn_pool
+from sn_scheduler import Sn_scheduler
+from sn_states import ActiveMode
+from sn_status import Sn_status
+
+
+class Failing_part:
+    ''' A part of the server whose counters cannot be read.
+    '''
+
+    def get_stats(self):
+        raise RuntimeError("counters unavailable")
+
+
+class Fake_mqtt:
+    ''' An MQTT connection that keeps the published messages.
+    '''
+
+    def __init__(self):
+        self.buffer = Sn_lanes()
+        self.published = []
+
+    def publish(self,topic,payload=None,qos=0,retain=False):
+        self.published.append((topic, payload))
+
+
+def test_report():
+    published = []
+    status = Sn_status(published.append)
+    status.add("scheduler", Sn_scheduler(Sn_pool("test", 1, 10), max_pending=10))
+    status.add("failing", Failing_part())
+    status.add("no_counters", object())
+    status.add("not_created", None)
+    status.report()
+
+    assert status.reports == 1
+    report = json.loads(published[0])
+    assert sorted(report) == ["scheduler"]
+    assert report["scheduler"]["pending"] == 0
+
+
+def test_report_thread():
+    published = []
+    status = Sn_status(published.append, interval=0.01)
+    status.start()
+    deadline = time.time() + 5
+    while(status.reports < 2 and time.time() < deadline):
+        time.sleep(0.01)
+    status.close()
+
+    assert status.reports >= 2
+    assert not status.thread.is_alive()
+    count = len(published)
+    time.sleep(0.05)
+    assert len(published) == count
+
+
+def test_server_parts():
+    mode = ActiveMode.__new__(ActiveMode)
+    mode.mqtt = Fake_mqtt()
+    mode.db_pool = Sn_pool("db", 1, 10)
+    mode.scheduler = Sn_scheduler(mode.db_pool, max_pending=10)
+    status = mode.status_report("$SYS/stats")
+    status.report()
+
+    topic, payload = mode.mqtt.published[0]
+    assert topic == "$SYS/stats"
+    assert sorted(json.loads(payload)) == ["db_pool", "lanes", "scheduler", "statements", "validation"]
@@ -0,0 +1,58 @@
+"""
+    File name: test_values.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the decoding of the sensor data payloads is tested: the value is converted by
+its type, the type and the range are returned as text and the values that are not finite
+numbers are rejected.
+
+
+Todo :
+	*
+"""
+
+import pytest
+from sn_states import ActiveMode
+
+
+def find_data_values(payload):
+    # The decoding does not use the state of the active mode.
+    return ActiveMode.__new__(ActiveMode).find_data_values(payload)
+
+
+@pytest.mark.parametrize("payload,expected", [
+    (b"float,0-70,21.5", ("float", "0-70", 21.5)),
+    (b"float,0-70,-3", ("float", "0-70", -3.0)),
+    (b"float,0-70, 21.5\n", ("float", "0-70", 21.5)),
+    (b"int,0-1,1", ("int", "0-1", 1)),
+    (b"int,0-100,42.5", ("int", "0-100", 42.5)),
+    (b"boolean,0-1,1", ("boolean", "0-1", 1.0)),
+])
+def test_values(payload,expected):
+    assert find_data_values(payload) == expected
+
+
+def test_value_types():
+    assert isinstance(find_data_values(b"int,0-1,1")[2], int)
+    assert isinstance(find_data_values(b"float,0-1,1")[2], float)
+
+
+@pytest.mark.parametrize("payload", [
+    b"float,0-70,nan",
+    b"float,0-70,NaN",
+    b"float,0-70,inf",
+    b"float,0-70,-Infinity",
+    b"float,0-70,1e400",
+    b"int,0-70," + b"9" * 400,
+    b"float,0-70,",
+    b"float,0-70,21,5",
+    b"float,0-70,abc",
+    b"float,21.5",
+    b"21.5",
+])
+def test_invalid_values(payload):
+    with pytest.raises(ValueError):
+        find_data_values(payload)
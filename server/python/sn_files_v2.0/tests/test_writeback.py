@@ -0,0 +1,135 @@
+"""
+    File name: test_writeback.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the write-behind writer of the nodes table is tested: the changes of a node are
+coalesced to the last value of every column, the changes of an interval are written with one
+statement, and the changes that cannot be written go to the spool.
+
+
+Todo :
+	*
+"""
+
+import time
+import pytest
+import sn_writeback
+from sn_db import Sn_breaker
+from sn_writeback import Sn_node_updates, Sn_node_writer
+
+
+class Fake_db:
+    ''' A database connection that keeps the update_nodes parameters, the writes fail while failing is set.
+    '''
+
+    breaker = Sn_breaker()
+    updates = []
+    failing = False
+
+    def __init__(self):
+        self.conn = ""
+
+    def connect_db(self):
+        self.conn = "connection"
+
+    def disconnect_db(self):
+        self.conn = ""
+
+    def update_nodes(self,params):
+        if(Fake_db.failing):
+            raise RuntimeError("server closed the connection unexpectedly")
+        Fake_db.updates.append(params)
+
+
+class Fake_spool:
+    ''' A spool that keeps the appended node changes.
+    '''
+
+    def __init__(self):
+        self.nodes = []
+
+    def has_data(self):
+        return bool(self.nodes)
+
+    def append_nodes(self,params):
+        self.nodes.append(params)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    monkeypatch.setattr(Fake_db, "breaker", Sn_breaker())
+    monkeypatch.setattr(Fake_db, "updates", [])
+    monkeypatch.setattr(Fake_db, "failing", False)
+    monkeypatch.setattr(sn_writeback, "Sn_db", Fake_db)
+    return Fake_db
+
+
+def test_coalesced_changes():
+    updates = Sn_node_updates()
+    updates.set("CN1", "sev_mode", "warningMode")
+    updates.set("CN2", "node_status", "connected")
+    updates.set("CN1", "sev_mode", "dangerMode")
+    updates.set("CN1", "last_connected", "2018-05-20 12:00:00")
+
+    # Only the last value of a column is written, the other columns are left as they are.
+    assert updates.take() == (["CN1", "CN2"], ["dangerMode", None], ["2018-05-20 12:00:00", None],
+                              [None, "connected"])
+    assert updates.take() == ([], [], [], [])
+    stats = updates.get_stats()
+    assert (stats['changes'], stats['coalesced'], stats['pending']) == (4, 1, 0)
+
+
+def test_discard_and_columns():
+    updates = Sn_node_updates()
+    updates.set("CN1", "node_status", "connected")
+    updates.set("CN2", "node_status", "connected")
+    updates.set("CN2", "sev_mode", "normalMode")
+    updates.discard("CN1", "node_status")
+    updates.discard("CN2", "sev_mode")
+    assert updates.take() == (["CN2"], [None], [None], ["connected"])
+    with pytest.raises(ValueError):
+        updates.set("CN1", "node_config", "{}")
+
+
+def test_interval_written_once(fake_db):
+    writer = Sn_node_writer(Fake_spool(), interval=0.1)
+    for i in range(20):
+        writer.set("CN" + str(i % 4), "sev_mode", "mode" + str(i))
+    deadline = time.time() + 5
+    while(not Fake_db.updates and time.time() < deadline):
+        time.sleep(0.01)
+    writer.close()
+
+    assert Fake_db.updates == [(["CN0", "CN1", "CN2", "CN3"], ["mode16", "mode17", "mode18", "mode19"],
+                                [None] * 4, [None] * 4)]
+    assert writer.get_stats()['nodes_written'] == 4
+
+
+def test_close_writes_pending(fake_db):
+    writer = Sn_node_writer(Fake_spool(), interval=3600)
+    writer.set("CN1", "node_status", "disconnected")
+    # The interval is not waited when the writer closes.
+    writer.close()
+    assert Fake_db.updates == [(["CN1"], [None], [None], ["disconnected"])]
+    assert not writer.thread.is_alive()
+
+
+def test_failed_changes_spooled(fake_db):
+    spool = Fake_spool()
+    writer = Sn_node_writer(spool, interval=3600)
+    Fake_db.failing = True
+    writer.set("CN1", "sev_mode", "dangerMode")
+    writer.close()
+    assert spool.nodes == [(["CN1"], ["dangerMode"], [None], [None])]
+
+    # The spool has older writes, the next changes go behind them.
+    Fake_db.failing = False
+    writer = Sn_node_writer(spool, interval=3600)
+    writer.set("CN1", "sev_mode", "normalMode")
+    writer.close()
+    assert Fake_db.updates == []
+    assert len(spool.nodes) == 2
+    assert writer.get_stats()['nodes_spooled'] == 1
@@ -0,0 +1,94 @@
+"""
+    File name: test_xml.py
+    Author: Georgios Vrettos
+    Date created: 20/5/2018
+    Date last modified: 20/5/2018
+    Python Version: 2.7
+
+In this module, the streaming converter of the node configurations is tested: the JSON text
+must be the same as the text of json.dumps(xmltodict.parse(xml)) and the summary must have the
+values of the configuration.
+
+
+Todo :
+	*
+"""
+
+import json
+import os
+import pytest
+import sn_xml
+from xml.parsers.expat import ExpatError
+
+xmltodict = pytest.importorskip("xmltodict")
+
+
+# Global variables
+# --------------------------------------------------------------------------------------------------
+# The root directory of the project.
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..")
+# The configuration files of the nodes and of the server.
+CONFIG_FILES = [os.path.join(PROJECT_DIR, "NodeMCU", "xml", "cn2_config.xml"),
+                os.path.join(PROJECT_DIR, "RaspberryPi", "xml", "cn1_config.xml"),
+                os.path.join(PROJECT_DIR, "server", "xml", "node_config.xml"),
+                os.path.join(PROJECT_DIR, "server", "xml", "sn_config.xml")]
+# Documents with the cases of xmltodict that the configuration files do not have.
+DOCUMENTS = [
+    '<a/>',
+    '<a>text</a>',
+    '<a x="1" y="2"/>',
+    '<a x="1">text</a>',
+    '<a><b>1</b><b>2</b><c/><b>3</b></a>',
+    '<a>before<b>1</b>after</a>',
+    '<a>\n  <b>  spaced  </b>\n</a>',
+    '<p:a xmlns:p="urn:p"><p:b p:x="1">2</p:b></p:a>',
+    '<a><b x="1"/><b>2</b></a>',
+    u'<a name="\u0391\u03b8\u03ae\u03bd\u03b1">\u03a3\u03ac\u03bc\u03bf\u03c2 "quoted" \\ &amp; &lt;</a>',
+    '<a><![CDATA[<raw>]]></a>',
+]
+
+# --------------------------------------------------------------------------------------------------
+
+
+def read(path):
+    with open(path, "rb") as config_file:
+        return config_file.read()
+
+
+@pytest.mark.parametrize("path", CONFIG_FILES)
+def test_config_files(path):
+    xml = read(path)
+    document, summary = sn_xml.convert(xml)
+    assert document == json.dumps(xmltodict.parse(xml))
+    assert json.loads(document) == xmltodict.parse(xml)
+
+
+@pytest.mark.parametrize("xml", DOCUMENTS)
+def test_documents(xml):
+    assert sn_xml.convert(xml)[0] == json.dumps(xmltodict.parse(xml))
+
+
+def test_chunks(monkeypatch):
+    # The document is given to the parser in many chunks, a chunk may end inside a character.
+    monkeypatch.setattr(sn_xml, "PARSE_CHUNK_SIZE", 7)
+    xml = read(CONFIG_FILES[0]).decode("utf-8").replace("Greece", u"\u0395\u03bb\u03bb\u03ac\u03b4\u03b1")
+    assert sn_xml.convert(xml)[0] == json.dumps(xmltodict.parse(xml))
+    assert sn_xml.convert(xml.encode("utf-8"))[0] == json.dumps(xmltodict.parse(xml))
+
+
+def test_summary():
+    summary = sn_xml.convert(read(CONFIG_FILES[0]))[1]
+    assert summary.node_id == "CN2"
+    assert summary.ip_address == "10.0.0.5"
+    assert summary.network == "Karlovasi_IoT_network"
+    assert summary.server_id == "SN"
+    assert summary.location == ("Greece", "Samos", "Karlovasi", "AegeanUniversityCampus", "indoor", "A", "A52")
+    assert len(summary.sensors) == 1
+    sensor = summary.sensors[0]
+    assert (sensor.name, sensor.model, sensor.data_type, sensor.min_value, sensor.max_value) == \
+        ("indoorTemperatureSensor", "DHT11", "float", "0", "70")
+
+
+def test_invalid_xml():
+    with pytest.raises(ExpatError):
+        sn_xml.convert("<a><b></a>")
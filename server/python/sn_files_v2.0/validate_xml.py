@@ -2,47 +2,128 @@
     File name: validate_xml.py
     Author: Evangelos Logaras
     Date created: 24/10/2017
-    Date last modified: 11/12/2017 (By Georgios Vrettos)
+    Date last modified: 11/5/2018 (By Georgios Vrettos)
     Python Version: 2.7
 
 Using functions of the lxml package to validate the structure of the XML node configuration files
-against the provided XML schema.  The lxml package can be installed under Windows or Linux using  
+against the provided XML schema.  The lxml package can be installed under Windows or Linux using
 pip:
 $pip install lxml
 
+The schema is compiled once in every process and every thread keeps its own parser.
+If VALIDATION_PROCESSES is more than 0, the validation runs in a pool of processes that is
+started before the threads of the server.
+The duration of every validation is counted in a latency histogram.
+
 Example:
     $ python validate_xml.py
-#-------------------------------------------------------------------------------------------------- 
+#--------------------------------------------------------------------------------------------------
 """
 
+import multiprocessing
+import threading
+import time
 from lxml import etree, objectify
 from lxml.etree import XMLSyntaxError
+from sn_histogram import Sn_histogram
 
 # Global variables
 #--------------------------------------------------------------------------------------------------
 
 XSD_FILE_PATH = "/home/vrettel/Dropbox/Thesis/Code/PC Server/sn_files/node_config_schema.xsd"
+# The number of processes that validate the XML files, 0 validates in the calling thread.
+VALIDATION_PROCESSES = 0
 #--------------------------------------------------------------------------------------------------
 
+# The compiled schema of this process.
+schema = None
+schema_lock = threading.Lock()
+# The parser of every thread.
+local = threading.local()
+
+
+def get_parser():
+    """get_parser function. This function returns the validating parser of the current thread.
+    The schema is compiled on the first call of the process.
+    """
+
+    global schema
+    parser = getattr(local, "parser", None)
+    if(parser is None):
+        with schema_lock:
+            if(schema is None):
+                schema = etree.XMLSchema(file=XSD_FILE_PATH)
+        parser = objectify.makeparser(schema=schema)
+        local.parser = parser
+    return parser
+
+
+def validate(xml_string):
+    """validate function. This function validates an XML string against the schema.
+    It returns True if the XML is valid or False otherwise.
+
+    Args:
+        param1 (str): XML file content.
+    """
+
+    try:
+        objectify.fromstring(xml_string, get_parser())
+        return True
+    except XMLSyntaxError:
+        return False
+
+
+def start_pool():
+    """start_pool function. This function starts the pool of the validation processes.
+    It is called before the process starts any thread, the pool processes are forked from it.
+    """
+
+    if(VALIDATION_PROCESSES > 0 and XmlValidator.pool is None):
+        XmlValidator.pool = multiprocessing.Pool(VALIDATION_PROCESSES)
+
+
+def close_pool():
+    """close_pool function. This function waits for the pending validations and stops
+    the pool of the validation processes.
+    """
+
+    pool = XmlValidator.pool
+    if(pool is not None):
+        XmlValidator.pool = None
+        pool.close()
+        pool.join()
+
+
 class XmlValidator:
 
+    # The pool of the validation processes, it is shared by all instances.
+    # It is started by start_pool, without it the validation runs in the calling thread.
+    pool = None
+    # The durations of the validations.
+    latency = Sn_histogram()
+
     def xml_validator(self,xml_string):
         """XML validation function against provided XSD schema.
-    
+
         Args:
             param1 (str): XML file content.
         """
 
-        try:
-            schema = etree.XMLSchema(file=XSD_FILE_PATH)
-            parser = objectify.makeparser(schema=schema)
-            objectify.fromstring(xml_string, parser)
+        start = time.time()
+        pool = XmlValidator.pool
+        if(pool is not None):
+            # The calling thread waits, the other threads and the ingest keep running.
+            valid = pool.apply(validate, (xml_string,))
+        else:
+            valid = validate(xml_string)
+        self.latency.observe(time.time() - start)
+
+        if(valid):
             print("XML file has been validated.")
-            return True
-        except XMLSyntaxError:
+        else:
             #handle exception here
             print("XML file cannot be validated.")
-            return False
+        return valid
 
 
 